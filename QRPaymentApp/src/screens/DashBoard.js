@@ -31,10 +31,15 @@ const Dashboard = () => {
     };
 
     loadUserData();
-    fetchTransactions();
   }, []);
 
-  const fetchTransactions = async () => {
+  useEffect(() => {
+    fetchTransactions(activeTab);
+  }, [activeTab]);
+
+  // Shows the newest page of the selected tab; the Transactions screen pages through the full history
+  const fetchTransactions = async (type) => {
+    setIsLoading(true);
     try {
       const token = await AsyncStorage.getItem('token');
       if (!token) {
@@ -44,7 +49,8 @@ const Dashboard = () => {
       const response = await axios.get(`${AppUrl}/transactions`, {
         headers: {
           Authorization: `Bearer ${token}`
-        }
+        },
+        params: { type }
       });
 
       // Set balance from response and transactions
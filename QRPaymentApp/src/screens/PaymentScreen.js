@@ -23,10 +23,45 @@ const FailureIcon = () => (
   </Svg>
 );
 
+// How long to wait for M-Pesa before leaving the payment to finish on the phone
+const PAYMENT_WAIT_MS = 90000;
+// Seconds each status request may be held open by the server
+const STATUS_POLL_WAIT = 25;
+
+const PAYMENT_RESULTS = {
+  completed: { success: true, title: 'Payment Complete!', detail: 'The payment was received.' },
+  pending: {
+    success: true,
+    title: 'STK Push Sent!',
+    detail: 'Enter your M-Pesa PIN on your phone to complete the payment.'
+  },
+  failed: {
+    success: false,
+    title: 'Payment Failed!',
+    detail: 'M-Pesa did not accept the payment request, or it was cancelled.'
+  },
+  unknown: {
+    success: false,
+    title: 'Payment Not Confirmed',
+    detail: 'M-Pesa did not confirm the payment request. If a prompt appears on your phone, enter your PIN to complete it.'
+  },
+  queued: {
+    success: false,
+    title: 'Payment Failed!',
+    detail: 'The payment request could not be sent to M-Pesa. Please try again.'
+  }
+};
+
+const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
 const PaymentScreen = ({ route }) => {
-  const [amount, setAmount] = useState('500');
+  // A QR code printed for a fixed amount (e.g. a table's bill) fills it in and locks it
+  const fixedAmount = route.params?.qrData?.amount;
+  const [amount, setAmount] = useState(fixedAmount ? String(Number(fixedAmount)) : '500');
   const [modalVisible, setModalVisible] = useState(false);
   const [paymentSuccess, setPaymentSuccess] = useState(false);
+  const [paymentResult, setPaymentResult] = useState(PAYMENT_RESULTS.failed);
+  const [waitingForMpesa, setWaitingForMpesa] = useState(false);
   const [loading, setLoading] = useState(false);
   const [phoneNumber, setPhoneNumber] = useState('');
   const [showPhoneInput, setShowPhoneInput] = useState(true);
@@ -76,6 +111,32 @@ const PaymentScreen = ({ route }) => {
     return cleaned;
   };
 
+  // /pay only queues the request; long-poll its status until it settles or we stop waiting
+  const waitForPayment = async (requestId) => {
+    const deadline = Date.now() + PAYMENT_WAIT_MS;
+    let status = 'queued';
+    while (Date.now() < deadline) {
+      try {
+        const response = await axios.get(`${AppUrl}/pay/${requestId}`, {
+          params: { wait: STATUS_POLL_WAIT }
+        });
+        status = response.data.status;
+        if (!['queued', 'pending', 'unknown'].includes(status)) break;
+      } catch (error) {
+        // 503: too many clients are waiting on this server; ask again shortly
+        if (!error.response || error.response.status !== 503) throw error;
+        await sleep(2000);
+      }
+    }
+    return status;
+  };
+
+  const showResult = (result) => {
+    setPaymentSuccess(result.success);
+    setPaymentResult(result);
+    setModalVisible(true);
+  };
+
   const handlePayment = async () => {
     if (!phoneNumber) {
       Alert.alert('Error', 'Please enter your phone number');
@@ -102,26 +163,24 @@ const PaymentScreen = ({ route }) => {
         amount: Number(amount),
         phone_number: formattedPhone,
         customer: qrData.accountName,
-        account_number: qrData.accountNumber
+        account_number: qrData.accountNumber,
+        reference: qrData.reference
       });
 
-      console.log("Response", response.data);
-
-      if (response.data.checkout_request_id) {
-        setPaymentSuccess(true);
-        setModalVisible(true);
-        Alert.alert(
-          'STK Push Sent',
-          'Please check your phone and enter M-Pesa PIN to complete payment'
-        );
-      } else {
+      if (!response.data.request_id) {
         throw new Error('Failed to initiate payment');
       }
+
+      setWaitingForMpesa(true);
+      const status = await waitForPayment(response.data.request_id);
+      showResult(PAYMENT_RESULTS[status] || PAYMENT_RESULTS.failed);
     } catch (error) {
       console.error('Error making payment:', error);
-      Alert.alert('Error', 'Failed to make payment');
+      const message = error.response && error.response.data && error.response.data.error;
+      Alert.alert('Error', message || 'Failed to make payment');
     } finally {
       setLoading(false);
+      setWaitingForMpesa(false);
     }
   };
 
@@ -154,6 +213,7 @@ const PaymentScreen = ({ route }) => {
           <View style={styles.card}>
             <Text style={styles.cardTitle}>Paying to:</Text>
             <Text style={styles.accountName}>{qrData.accountName}</Text>
+            {qrData.reference ? <Text style={styles.reference}>Ref: {qrData.reference}</Text> : null}
           </View>
 
           {/* Phone Number Input */}
@@ -178,7 +238,7 @@ const PaymentScreen = ({ route }) => {
 
           {/* Amount Input */}
           <View style={styles.amountContainer}>
-            <Text style={styles.amountLabel}>Select Amount</Text>
+            <Text style={styles.amountLabel}>{fixedAmount ? 'Amount' : 'Select Amount'}</Text>
             <View style={styles.amountBox}>
               <Text style={styles.currency}>KES</Text>
               <TextInput
@@ -186,6 +246,7 @@ const PaymentScreen = ({ route }) => {
                 keyboardType="numeric"
                 value={amount}
                 onChangeText={setAmount}
+                editable={!fixedAmount}
               />
             </View>
           </View>
@@ -199,15 +260,17 @@ const PaymentScreen = ({ route }) => {
 
           {/* Loading Indicator */}
           {loading && <ActivityIndicator color="#2FC56D" style={styles.loader} />}
+          {waitingForMpesa && (
+            <Text style={styles.waitingText}>Check your phone for the M-Pesa prompt...</Text>
+          )}
 
           {/* Payment Modal */}
           <Modal animationType="fade" transparent visible={modalVisible} onRequestClose={handleCloseModal}>
             <View style={styles.modalContainer}>
               <View style={styles.modalView}>
                 {paymentSuccess ? <SuccessIcon /> : <FailureIcon />}
-                <Text style={styles.modalText}>
-                  {paymentSuccess ? 'STK Push Sent!' : 'Payment Failed!'}
-                </Text>
+                <Text style={styles.modalText}>{paymentResult.title}</Text>
+                <Text style={styles.modalDetail}>{paymentResult.detail}</Text>
                 <Button title="Close" onPress={handleCloseModal} />
               </View>
             </View>
@@ -246,6 +309,11 @@ const styles = StyleSheet.create({
     fontWeight: 'bold',
     marginTop: 5,
   },
+  reference: {
+    color: '#1E1E1E',
+    fontSize: 14,
+    marginTop: 5,
+  },
   amountContainer: {
     marginBottom: 20,
   },
@@ -301,6 +369,12 @@ const styles = StyleSheet.create({
     fontSize: 18,
     fontWeight: 'bold',
   },
+  modalDetail: {
+    marginBottom: 15,
+    textAlign: 'center',
+    fontSize: 14,
+    color: '#555',
+  },
   closeButton: {
     marginTop: 10,
   },
@@ -322,6 +396,11 @@ const styles = StyleSheet.create({
   loader: {
     marginTop: 20,
   },
+  waitingText: {
+    color: 'white',
+    textAlign: 'center',
+    marginTop: 10,
+  },
   savedPhoneContainer: {
     backgroundColor: '#2FC56D',
     borderRadius: 10,
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useMemo } from 'react';
 import {
   View,
   Text,
@@ -22,8 +22,10 @@ import { AppUrl } from '../config/constants';
 import { useAuth } from '../utils/Auth';
 
 const Transactions = () => {
-  const [groupedTransactions, setGroupedTransactions] = useState([]);
+  const [transactions, setTransactions] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState(null);
   const [modalVisible, setModalVisible] = useState(false);
   const [email, setEmail] = useState('');
@@ -37,18 +39,20 @@ const Transactions = () => {
     fetchTransactions();
   }, []);
 
-  const fetchTransactions = async () => {
+  // The API returns one page at a time, newest first; pass the previous page's next_cursor for the next one
+  const fetchTransactions = async (cursor = null) => {
     try {
       const token = await AsyncStorage.getItem('token');
       if (!token) throw new Error('No token found');
 
       const response = await axios.get(`${AppUrl}/transactions`, {
-        headers: { Authorization: `Bearer ${token}` }
+        headers: { Authorization: `Bearer ${token}` },
+        params: cursor ? { cursor } : {}
       });
 
-      const { balance, transactions } = response.data;
-      const grouped = groupTransactionsByDate(transactions);
-      setGroupedTransactions(grouped);
+      const { transactions: page, next_cursor } = response.data;
+      setTransactions(previous => (cursor ? [...previous, ...page] : page));
+      setNextCursor(next_cursor);
       setError(null);
     } catch (error) {
       console.error('Error fetching transactions:', error);
@@ -61,9 +65,16 @@ const Transactions = () => {
       }
     } finally {
       setLoading(false);
+      setLoadingMore(false);
     }
   };
 
+  const loadMore = () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    fetchTransactions(nextCursor);
+  };
+
   const groupTransactionsByDate = (transactions) => {
     const today = new Date();
     const yesterday = new Date(today);
@@ -108,6 +119,8 @@ const Transactions = () => {
       date1.getFullYear() === date2.getFullYear();
   };
 
+  const groupedTransactions = useMemo(() => groupTransactionsByDate(transactions), [transactions]);
+
   const formatTime = (dateString) => {
     const date = new Date(dateString);
     return date.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
@@ -137,7 +150,9 @@ const Transactions = () => {
         </View>
         <View>
           <Text style={styles.customerName}>{item.customer}</Text>
-          <Text style={styles.time}>{formatTime(item.date)}</Text>
+          <Text style={styles.time}>
+            {item.reference ? `${formatTime(item.date)} · ${item.reference}` : formatTime(item.date)}
+          </Text>
         </View>
       </View>
       <Text style={[styles.amount, {
@@ -215,6 +230,11 @@ const Transactions = () => {
           keyExtractor={item => item.id.toString()}
           contentContainerStyle={styles.listContainer}
           stickySectionHeadersEnabled
+          onEndReached={loadMore}
+          onEndReachedThreshold={0.5}
+          ListFooterComponent={loadingMore ? (
+            <ActivityIndicator size="small" color="#4CAF50" style={styles.footerLoader} />
+          ) : null}
         />
       )}
 
@@ -329,6 +349,9 @@ const styles = StyleSheet.create({
     top: '50%',
     left: '50%',
   },
+  footerLoader: {
+    marginVertical: 16,
+  },
   emptyState: {
     alignItems: 'center',
     justifyContent: 'center',
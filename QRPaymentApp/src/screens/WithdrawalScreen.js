@@ -52,8 +52,10 @@ const WithdrawalScreen = () => {
       const token = await AsyncStorage.getItem('token');
       if (!token) throw new Error('No token found');
 
+      // Only the balance is used, so ask for the smallest page
       const response = await axios.get(`${AppUrl}/transactions`, {
-        headers: { Authorization: `Bearer ${token}` }
+        headers: { Authorization: `Bearer ${token}` },
+        params: { limit: 1 }
       });
 
       setBalance(response.data.balance || 0);
@@ -1,20 +1,13 @@
-from app import create_app, db
-from sqlalchemy import text
+import os
+from app import create_app
 
 app = create_app()
 
-def check_database_connection():
-    try:
-        with app.app_context():
-            db.session.execute(text("SELECT 1"))
-            print("Database connection successful!")
-    except Exception as e:
-        print(f"Database connection failed: {e}")
-        exit(1)
-
 if __name__ == '__main__':
-    with app.app_context():
-        check_database_connection()
-        db.create_all()
-    
-    app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
+    # Development server only; production runs `gunicorn -c gunicorn.conf.py wsgi:app`.
+    # Create or upgrade the schema first with `flask --app app upgrade-db`.
+    app.run(
+        host=os.getenv('FLASK_RUN_HOST', '0.0.0.0'),
+        port=int(os.getenv('FLASK_RUN_PORT', 5000)),
+        debug=os.getenv('FLASK_DEBUG', '0') == '1'
+    )
@@ -1,24 +1,99 @@
+import threading
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from werkzeug.local import LocalProxy
 from config.config import Config
-from config.mpesa import MpesaExpress 
 
 db = SQLAlchemy()
-mpesa = MpesaExpress(
-    env="sandbox",
-    sandbox_url="https://sandbox.safaricom.co.ke",
-    live_url="https://api.safaricom.co.ke"
-)
 
-def create_app():
+_mpesa = None
+_mpesa_lock = threading.Lock()
+
+
+def get_mpesa():
+    """Return the shared Mpesa client, building it (and importing its HTTP stack) on first use."""
+    global _mpesa
+    if _mpesa is None:
+        with _mpesa_lock:
+            if _mpesa is None:
+                from config.mpesa import MpesaExpress
+                from app.services.metrics import observe_daraja
+                observer = observe_daraja if Config.METRICS_ENABLED else None
+                async_client = None
+                if Config.MPESA_ASYNC:
+                    from config.mpesa_async import AsyncMpesaExpress
+                    async_client = AsyncMpesaExpress(
+                        env=Config.MPESA_ENV,
+                        sandbox_url=Config.MPESA_SANDBOX_URL,
+                        live_url=Config.MPESA_LIVE_URL,
+                        observer=observer
+                    )
+                _mpesa = MpesaExpress(
+                    env=Config.MPESA_ENV,
+                    sandbox_url=Config.MPESA_SANDBOX_URL,
+                    live_url=Config.MPESA_LIVE_URL,
+                    async_client=async_client,
+                    observer=observer
+                )
+    return _mpesa
+
+
+mpesa = LocalProxy(get_mpesa)
+
+def create_app(config=None):
     app = Flask(__name__)
+    from app.utils.json_provider import JSONProvider
+    app.json = JSONProvider(app)
     app.config.from_object(Config)
+    if config:
+        app.config.update(config)
     
+    from app import log
+    log.configure(app)
+
     db.init_app(app)
+
+    if app.config['METRICS_ENABLED']:
+        from app.services.metrics import metrics
+        metrics.init_app(app)
+
+    from app.services.vendor_cache import vendor_cache
+    vendor_cache.init_app(app)
+
+    from app.services.passwords import passwords
+    passwords.init_app(app)
+
+    from app.services.admission import admission
+    admission.init_app(app)
+
+    from app.services.events import events
+    events.init_app(app)
+
+    from app.services.stk_dispatcher import bulk_dispatcher, dispatcher
+    dispatcher.init_app(app)
+    bulk_dispatcher.init_app(app)
+
+    from app.services.statements import statement_worker
+    statement_worker.init_app(app)
+
+    from app.services.qr import qr
+    qr.init_app(app)
+
+    from app.services.callback_queue import callback_queue
+    callback_queue.init_app(app)
+    if callback_queue.enabled and app.config['CALLBACK_QUEUE_CONSUMERS']:
+        callback_queue.start_consumers()
+
+    from app import cli
+    cli.register(app)
     
-    from app.routes import auth, payment, transaction
+    from app.routes import auth, payment, qr as qr_routes, transaction
     app.register_blueprint(auth.bp)
     app.register_blueprint(payment.bp)
     app.register_blueprint(transaction.bp)
+    app.register_blueprint(qr_routes.bp)
+    if app.config['METRICS_ENABLED']:
+        from app.routes import metrics as metrics_routes
+        app.register_blueprint(metrics_routes.bp)
     
     return app
\ No newline at end of file
@@ -0,0 +1,166 @@
+import time
+import click
+from flask.cli import with_appcontext
+from app import migrations
+
+
+@click.command('upgrade-db')
+@with_appcontext
+def upgrade_db():
+    """Create missing tables, columns and indexes."""
+    applied = migrations.upgrade()
+    for statement in applied:
+        click.echo(statement)
+    click.echo(f"Database up to date ({len(applied)} change(s) applied).")
+
+
+@click.command('check-db')
+@with_appcontext
+def check_db():
+    """Check that the database is reachable."""
+    from sqlalchemy import text
+    from app import db
+
+    try:
+        db.session.execute(text("SELECT 1"))
+    except Exception as e:
+        raise click.ClickException(f"Database connection failed: {e}")
+    click.echo("Database connection successful!")
+
+
+@click.command('reconcile')
+@click.option('--once', is_flag=True, help='Reconcile a single batch and exit.')
+@click.option('--batch-size', type=int, help='Transactions per batch.')
+@click.option('--qps', type=float, help='Maximum Daraja queries per second.')
+@with_appcontext
+def reconcile(once, batch_size, qps):
+    """Query Daraja for stale pending transactions and settle them."""
+    from app.services.reconciliation import Reconciler
+
+    reconciler = Reconciler(batch_size=batch_size, qps=qps)
+    if once:
+        click.echo(f"Daraja answered for {reconciler.run_once()} pending transaction(s).")
+    else:
+        reconciler.run()
+
+
+@click.command('consume-callbacks')
+@click.option('--consumers', type=int, help='Number of consumer threads.')
+@with_appcontext
+def consume_callbacks(consumers):
+    """Apply queued Daraja callbacks until interrupted."""
+    from app.services.callback_queue import callback_queue
+
+    callback_queue.start_consumers(consumers)
+    try:
+        while True:
+            time.sleep(10)
+            click.echo(callback_queue.stats())
+    except KeyboardInterrupt:
+        callback_queue.stop_consumers()
+
+
+@click.command('backfill-rollups')
+@click.option('--vendor-id', type=int, help='Rebuild a single vendor only.')
+@with_appcontext
+def backfill_rollups(vendor_id):
+    """Rebuild the daily rollups from the transaction table."""
+    from app.services import rollups
+
+    click.echo(f"Wrote {rollups.backfill(vendor_id)} rollup row(s).")
+
+
+@click.command('check-ledger')
+@click.option('--vendor-id', type=int, help='Check a single vendor only.')
+@with_appcontext
+def check_ledger(vendor_id):
+    """Verify cached vendor balances against the ledger."""
+    from app.services import ledger
+
+    mismatches, unbalanced = ledger.check(vendor_id)
+    for mismatch in mismatches:
+        click.echo(f"Vendor {mismatch.vendor_id}: balance {mismatch.balance_cents / 100:.2f}, "
+                   f"ledger {mismatch.ledger_cents / 100:.2f}")
+    for vid, transaction_id, cents in unbalanced:
+        click.echo(f"Vendor {vid}: posting for transaction {transaction_id} is off by {cents / 100:.2f}")
+    if mismatches or unbalanced:
+        raise click.ClickException(f"{len(mismatches)} balance mismatch(es), {len(unbalanced)} unbalanced posting(s).")
+    click.echo("Ledger and balances agree.")
+
+
+@click.command('export-qr')
+@click.argument('output', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'fmt', type=click.Choice(['png', 'svg']), default='png',
+              help='Image format inside a ZIP archive.')
+@click.option('--vendor-id', type=int, multiple=True, help='Export only these vendors (repeatable).')
+@with_appcontext
+def export_qr(output, fmt, vendor_id):
+    """Render vendor QR codes into OUTPUT: a ZIP of images, or printable pages if it ends in .pdf."""
+    from sqlalchemy import select
+    from app import db
+    from app.models.vendor import Vendor
+    from app.services.qr import qr
+
+    query = (select(Vendor.business_name, Vendor.business_number)
+             .where(Vendor.business_number.isnot(None))
+             .order_by(Vendor.id))
+    if vendor_id:
+        query = query.where(Vendor.id.in_(vendor_id))
+    codes = [qr.code(name, number) for name, number in db.session.execute(query)]
+    try:
+        with open(output, 'wb') as fileobj:
+            if output.lower().endswith('.pdf'):
+                qr.write_pdf(codes, fileobj)
+            else:
+                qr.write_zip(codes, fileobj, fmt)
+    finally:
+        qr.shutdown()
+    click.echo(f"Wrote {len(codes)} QR code(s) to {output}.")
+
+
+@click.command('import-vendors')
+@click.argument('csv_file', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--batch-size', type=int, help='Vendors per insert batch.')
+@click.option('--report', type=click.File('w'), help='Write the outcome of every row to this CSV file.')
+@with_appcontext
+def import_vendors(csv_file, batch_size, report):
+    """Register vendors from a CSV file with a header row.
+
+    Columns: business_name, email, password, phone_number, business_type, id_number, full_name.
+    """
+    import csv
+    from collections import Counter
+    from flask import current_app
+    from app.services import onboarding
+    from app.services.passwords import passwords
+
+    writer = None
+    if report:
+        writer = csv.writer(report)
+        writer.writerow(onboarding.ImportResult._fields)
+    counts = Counter()
+    try:
+        results = onboarding.import_vendors(csv.DictReader(csv_file),
+                                            batch_size or current_app.config['VENDOR_IMPORT_BATCH_SIZE'])
+        for result in results:
+            counts[result.status] += 1
+            if writer:
+                writer.writerow(result)
+            elif result.status == 'error':
+                click.echo(f"Line {result.line}: {result.error}", err=True)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    finally:
+        passwords.shutdown()
+    click.echo(f"Imported {counts['imported']} vendor(s), {counts['error']} error(s).")
+
+
+def register(app):
+    app.cli.add_command(upgrade_db)
+    app.cli.add_command(check_db)
+    app.cli.add_command(reconcile)
+    app.cli.add_command(consume_callbacks)
+    app.cli.add_command(backfill_rollups)
+    app.cli.add_command(check_ledger)
+    app.cli.add_command(export_qr)
+    app.cli.add_command(import_vendors)
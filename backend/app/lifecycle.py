@@ -0,0 +1,43 @@
+"""Process lifecycle hooks for pre-forking servers (see gunicorn.conf.py)."""
+from app import db, log
+
+
+def before_fork(app):
+    """Release what the master picked up while preloading, before workers fork from it."""
+    from app.services.callback_queue import callback_queue
+
+    callback_queue.stop_consumers(timeout=5)
+    with app.app_context():
+        db.engine.dispose()
+    # Flush buffered log records; the listener restarts on the next record
+    log.stop()
+
+
+def after_fork(app):
+    """Start per-process resources in a freshly forked worker."""
+    from app.services.callback_queue import callback_queue
+
+    with app.app_context():
+        # Never reuse a pooled connection inherited from the parent
+        db.engine.dispose(close=False)
+    if callback_queue.enabled and app.config['CALLBACK_QUEUE_CONSUMERS']:
+        callback_queue.start_consumers()
+
+
+def shutdown(app, timeout=None):
+    """Drain background work and close connections before the worker exits."""
+    from app.services.callback_queue import callback_queue
+    from app.services.passwords import passwords
+    from app.services.qr import qr
+    from app.services.statements import statement_worker
+    from app.services.stk_dispatcher import bulk_dispatcher, dispatcher
+
+    callback_queue.stop_consumers(timeout)
+    dispatcher.shutdown(wait=True)
+    bulk_dispatcher.shutdown(wait=True)
+    statement_worker.shutdown(wait=True)
+    qr.shutdown(wait=True)
+    passwords.shutdown(wait=True)
+    with app.app_context():
+        db.engine.dispose()
+    log.stop()
@@ -0,0 +1,89 @@
+"""Non-blocking logging.
+
+Request threads only put records on an in-memory queue; a listener thread
+formats and writes them. When the queue is full, records are dropped (and
+counted) rather than making a request wait on stderr.
+"""
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class BufferedHandler(QueueHandler):
+    """Queues records for a listener thread, (re)started lazily in each process, so it survives a fork."""
+
+    def __init__(self, target, maxsize):
+        super().__init__(queue.Queue(maxsize=maxsize))
+        self.target = target
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self._start_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        with self._start_lock:
+            if self._listener is not None and self._pid == os.getpid():
+                self._listener.stop()
+            self._listener = None
+            self._pid = None
+
+    def _start_listener(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # A forked child inherits the queue but not the listener thread
+            self.queue = queue.Queue(maxsize=self.queue.maxsize)
+            self._listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+            self._listener.start()
+            self._pid = os.getpid()
+
+
+def configure(app):
+    """Route the root logger through a ``BufferedHandler``; safe to call more than once."""
+    root = logging.getLogger()
+    for handler in root.handlers:
+        if isinstance(handler, BufferedHandler):
+            return handler
+
+    target = logging.StreamHandler(sys.stderr)
+    if app.config['LOG_FORMAT'] == 'json':
+        target.setFormatter(JsonFormatter())
+    else:
+        target.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s'))
+
+    handler = BufferedHandler(target, app.config['LOG_QUEUE_SIZE'])
+    root.addHandler(handler)
+    root.setLevel(app.config['LOG_LEVEL'])
+    return handler
+
+
+def stop():
+    """Flush and stop this process's listener, e.g. before exiting or forking."""
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, BufferedHandler):
+            handler.stop()
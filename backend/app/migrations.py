@@ -0,0 +1,97 @@
+from sqlalchemy import Float, Numeric, and_, func, inspect, select, text
+from sqlalchemy.schema import CreateColumn
+from app import db
+from app.models import checkpoint, daily_rollup, ledger_entry, statement_job, transaction, vendor  # noqa: F401  (register the models on the metadata)
+
+
+def upgrade():
+    """Bring an existing database up to date with the models.
+
+    ``db.create_all()`` only creates missing tables, so columns and indexes added
+    to existing models, and float money columns moved to DECIMAL, are applied
+    here. Vendors with a balance but no ledger lines get an opening posting,
+    and a newly created rollup table is filled from existing transactions.
+    Returns the statements that were run.
+    """
+    engine = db.engine
+    had_rollups = inspect(engine).has_table(daily_rollup.DailyRollup.__tablename__)
+    db.create_all()
+    preparer = engine.dialect.identifier_preparer
+    inspector = inspect(engine)
+    applied = []
+
+    for table in db.metadata.sorted_tables:
+        existing_columns = {c['name']: c['type'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                statement = _retype_statement(engine, table, column, existing_columns[column.name])
+                if statement:
+                    with engine.begin() as conn:
+                        conn.execute(text(statement))
+                    applied.append(statement)
+                continue
+            ddl = CreateColumn(column).compile(dialect=engine.dialect)
+            statement = f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}"
+            with engine.begin() as conn:
+                conn.execute(text(statement))
+            applied.append(statement)
+
+        existing_indexes = {i['name'] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+            if index.unique:
+                _check_unique(engine, index)
+            index.create(engine)
+            applied.append(f"CREATE INDEX {index.name} ON {table.name}")
+
+    from app.services import ledger
+    opened = ledger.open_accounts()
+    if opened:
+        applied.append(f"Posted opening ledger balances for {opened} vendor(s)")
+
+    if not had_rollups:
+        from app.services import rollups
+        written = rollups.backfill()
+        if written:
+            applied.append(f"Backfilled {written} daily rollup row(s)")
+
+    return applied
+
+
+def _retype_statement(engine, table, column, existing_type):
+    """ALTER statement moving a FLOAT/DOUBLE column to the model's DECIMAL type, if needed.
+
+    SQLite stores both the same way, so only MySQL and PostgreSQL are altered.
+    """
+    wants_decimal = isinstance(column.type, Numeric) and not isinstance(column.type, Float)
+    if not wants_decimal or not isinstance(existing_type, Float):
+        return None
+    preparer = engine.dialect.identifier_preparer
+    if engine.dialect.name == 'mysql':
+        ddl = CreateColumn(column).compile(dialect=engine.dialect)
+        return f"ALTER TABLE {preparer.format_table(table)} MODIFY COLUMN {ddl}"
+    if engine.dialect.name == 'postgresql':
+        type_ddl = column.type.compile(dialect=engine.dialect)
+        return (f"ALTER TABLE {preparer.format_table(table)} ALTER COLUMN "
+                f"{preparer.format_column(column)} TYPE {type_ddl}")
+    return None
+
+
+def _check_unique(engine, index):
+    """Refuse to build a unique index over duplicate rows, naming a few of them."""
+    columns = list(index.columns)
+    query = (
+        select(*columns)
+        .where(and_(*(c.isnot(None) for c in columns)))
+        .group_by(*columns)
+        .having(func.count() > 1)
+        .limit(5)
+    )
+    with engine.connect() as conn:
+        duplicates = [tuple(row) for row in conn.execute(query)]
+    if duplicates:
+        raise RuntimeError(
+            f"Cannot create unique index {index.name}: duplicate values {duplicates}. "
+            "Resolve them and run the upgrade again."
+        )
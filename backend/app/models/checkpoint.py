@@ -0,0 +1,15 @@
+from app import db
+from datetime import datetime
+
+class WorkerCheckpoint(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    position = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @classmethod
+    def load(cls, name):
+        checkpoint = db.session.get(cls, name)
+        if checkpoint is None:
+            checkpoint = cls(name=name, position=0)
+            db.session.add(checkpoint)
+        return checkpoint
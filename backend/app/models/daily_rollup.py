@@ -0,0 +1,10 @@
+from app import db
+
+class DailyRollup(db.Model):
+    """Per-vendor, per-day count and sum of settled transactions by type and status."""
+    vendor_id = db.Column(db.Integer, db.ForeignKey('vendor.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    type = db.Column(db.String(10), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
@@ -0,0 +1,22 @@
+from app import db
+from datetime import datetime
+
+class LedgerEntry(db.Model):
+    """Append-only double-entry posting line, in integer cents.
+
+    Every posting writes one line to the vendor's account and an opposite line
+    to a counter account (see app/services/ledger.py), so each posting sums to zero
+    and a vendor's balance is the sum of its 'vendor' lines.
+    """
+    __table_args__ = (
+        db.Index('ix_ledger_entry_vendor_account', 'vendor_id', 'account'),
+        # A transaction is posted to each account at most once
+        db.Index('ux_ledger_entry_transaction_account', 'transaction_id', 'account', unique=True),
+    )
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    vendor_id = db.Column(db.Integer, db.ForeignKey('vendor.id'), nullable=False)
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transaction.id'))
+    account = db.Column(db.String(20), nullable=False)
+    amount_cents = db.Column(db.BigInteger, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,30 @@
+from app import db
+from datetime import datetime
+
+class StatementJob(db.Model):
+    id = db.Column(db.String(32), primary_key=True)
+    vendor_id = db.Column(db.Integer, db.ForeignKey('vendor.id'), nullable=False, index=True)
+    email = db.Column(db.String(120), nullable=False)
+    duration = db.Column(db.String(20), nullable=False)
+    start_date = db.Column(db.DateTime, nullable=False)
+    end_date = db.Column(db.DateTime, nullable=False)
+    # queued -> running -> sent/failed
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    row_count = db.Column(db.Integer)
+    error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    duration_ms = db.Column(db.Integer)
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'duration': self.duration,
+            'row_count': self.row_count,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'duration_ms': self.duration_ms
+        }
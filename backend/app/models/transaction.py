@@ -2,13 +2,29 @@ from app import db
 from datetime import datetime
 
 class Transaction(db.Model):
+    __table_args__ = (
+        # Vendor history and statements filter by vendor and walk (date, id)
+        db.Index('ix_transaction_vendor_date', 'vendor_id', 'date', 'id'),
+        # Reconciliation scans pending rows in id order
+        db.Index('ix_transaction_status_id', 'status', 'id'),
+        # Delta feed pages on the vendor's change sequence
+        db.Index('ix_transaction_vendor_change_seq', 'vendor_id', 'change_seq'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     vendor_id = db.Column(db.Integer, db.ForeignKey('vendor.id'), nullable=False)
     type = db.Column(db.String(10), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    amount = db.Column(db.Numeric(12, 2), nullable=False)
     date = db.Column(db.DateTime, default=datetime.utcnow)
     customer = db.Column(db.String(100), nullable=False)
+    # queued -> pending (STK push sent) -> completed/failed; queued -> unknown when
+    # the push's response was lost, until its callback or expiry settles it
     status = db.Column(db.String(20), default='pending')
-    mpesa_checkout_request_id = db.Column(db.String(100))
+    mpesa_checkout_request_id = db.Column(db.String(100), unique=True, index=True)
+    request_id = db.Column(db.String(32), unique=True, index=True)
+    phone_number = db.Column(db.String(15))
+    # Free-form reference from the scanned QR code (e.g. a table or invoice number)
+    reference = db.Column(db.String(64))
+    change_seq = db.Column(db.BigInteger)
 
     vendor = db.relationship('Vendor', backref=db.backref('transactions', lazy=True))
\ No newline at end of file
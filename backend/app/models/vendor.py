@@ -10,7 +10,10 @@ class Vendor(db.Model):
     business_type = db.Column(db.String(50))
     registration_date = db.Column(db.DateTime, default=datetime.utcnow)
     is_verified = db.Column(db.Boolean, default=False)
-    balance = db.Column(db.Float, default=0.0)
+    # Cached from the ledger (see app/services/ledger.py)
+    balance = db.Column(db.Numeric(12, 2), default=0)
     business_number = db.Column(db.String(12), unique=True)
     full_name = db.Column(db.String(100), nullable=False)
-    id_number = db.Column(db.String(20), nullable=False)
\ No newline at end of file
+    id_number = db.Column(db.String(20), nullable=False)
+    # Bumped on every change to the vendor's transactions (see app/services/changes.py)
+    change_seq = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
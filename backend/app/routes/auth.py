@@ -1,17 +1,15 @@
 from flask import Blueprint, request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 from datetime import datetime, timedelta
-import random
+from sqlalchemy.exc import IntegrityError
 from app import db
 from app.models.vendor import Vendor
+from app.services import onboarding
+from app.services.passwords import HashingBusy, passwords
 from config.config import Config
 
 bp = Blueprint('auth', __name__)
 
-def generate_business_number():
-    return str(random.randint(1000000000, 9999999999))
-
 @bp.route('/vendor/register', methods=['POST'])
 def register():
     data = request.get_json()
@@ -19,31 +17,38 @@ def register():
     if not all(field in data for field in required_fields):
         return jsonify({'error': 'Missing required fields'}), 400
         
-    if Vendor.query.filter_by(email=data['email']).first():
-        return jsonify({'error': 'Email already registered'}), 400
-        
-    if Vendor.query.filter_by(phone_number=data['phone_number']).first():
-        return jsonify({'error': 'Phone number already registered'}), 400
+    # One query for both; the unique constraints still catch a concurrent registration
+    conflict = onboarding.find_conflict(data['email'], data['phone_number'])
+    if conflict:
+        return jsonify({'error': conflict}), 400
         
     try:
         vendor = Vendor(
             business_name=data['business_name'],
             email=data['email'],
-            password_hash=generate_password_hash(data['password']),
+            password_hash=passwords.hash(data['password']),
             phone_number=data['phone_number'],
             business_type=data['business_type'],
-            business_number=generate_business_number(),
             id_number=data['id_number'],
             full_name=data['full_name']
         )
         db.session.add(vendor)
+        db.session.flush()
+        vendor.business_number = onboarding.business_number(vendor.id)
         db.session.commit()
         
         return jsonify({
             'success': True,
             'message': 'Registration successful'
         }), 201
+    except HashingBusy:
+        return busy()
+    except IntegrityError:
+        db.session.rollback()
+        conflict = onboarding.find_conflict(data['email'], data['phone_number'])
+        return jsonify({'error': conflict or 'Registration failed, please try again'}), 400
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @bp.route('/vendor/login', methods=['POST'])
@@ -56,11 +61,27 @@ def login():
     if not vendor:
         return jsonify({'error': 'Invalid email or password'}), 401
 
-    if not check_password_hash(vendor.password_hash, password):
-        return jsonify({'error': 'Invalid email or password'}), 401
+    try:
+        if not passwords.verify(vendor.password_hash, password):
+            return jsonify({'error': 'Invalid email or password'}), 401
+    except HashingBusy:
+        return busy()
+
+    # Upgrade hashes made with older parameters while the plain password is at hand
+    try:
+        if passwords.needs_rehash(vendor.password_hash):
+            vendor.password_hash = passwords.hash(password)
+            db.session.commit()
+    except HashingBusy:
+        pass  # retried on a later login
 
     token = jwt.encode(
-        {'vendor_id': vendor.id, 'exp': datetime.utcnow() + timedelta(hours=24)},
+        {
+            'vendor_id': vendor.id,
+            'business_number': vendor.business_number,
+            'business_name': vendor.business_name,
+            'exp': datetime.utcnow() + timedelta(hours=24)
+        },
         Config.SECRET_KEY, 
         algorithm="HS256"
     )  
@@ -72,4 +93,9 @@ def login():
         'email': vendor.email,
         'phone_number': vendor.phone_number,
         'business_type': vendor.business_type,
-    }})
\ No newline at end of file
+    }})
+
+def busy():
+    response = jsonify({'error': 'Server busy, please try again'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
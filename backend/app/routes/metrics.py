@@ -0,0 +1,10 @@
+from flask import Blueprint, Response
+from app.services.metrics import metrics
+
+bp = Blueprint('metrics', __name__)
+
+
+@bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
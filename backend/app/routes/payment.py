@@ -1,11 +1,28 @@
-from flask import Blueprint, request, jsonify
-from app import db, mpesa
+from flask import Blueprint, request, jsonify, current_app
+from sqlalchemy import func, insert, select
+from app import db
 from app.models.transaction import Transaction
 from app.models.vendor import Vendor
-from config.config import Config
+from app.services import ledger, metrics, rollups
+from app.services.admission import RateLimited, admission
+from app.services.callback_queue import callback_queue
+from app.services.changes import next_change_seq
+from app.services.events import TooManySubscriptions, events
+from app.services.settlement import apply_stk_result
+from app.services.stk_dispatcher import bulk_dispatcher, dispatcher
+from app.services.vendor_cache import vendor_cache
+from datetime import datetime
 import logging
+import math
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
 bp = Blueprint('payment', __name__)
 
+# Statuses a payment can still leave; 'unknown' waits for its callback or expiry
+IN_PROGRESS = ('queued', 'pending', 'unknown')
+
 
 
 @bp.route('/pay', methods=['POST'])
@@ -15,64 +32,264 @@ def pay():
     phone_number = data.get('phone_number')
     customer = data.get('customer', 'Unknown Customer')
     business_number = data.get('account_number')
+    reference = data.get('reference')
     
     if not amount or not phone_number:
-        print("Amount and phone number are required")
         return jsonify({'error': 'Amount and phone number are required'}), 400
+
+    try:
+        amount = ledger.to_push_amount(amount)
+        phone_number = normalize_phone(phone_number)
+        reference = normalize_reference(reference)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     # Look up the vendor by business_number
-    vendor = Vendor.query.filter_by(business_number=business_number).first()
-    print("Vendor", vendor)
+    vendor = vendor_cache.by_business_number(business_number)
     if not vendor:
         return jsonify({'error': f'Vendor with business number {business_number} not found'}), 404
+
+    # A repeated tap while the first request is in flight gets that request back
+    request_id = uuid.uuid4().hex
+    existing = admission.claim(business_number, phone_number, amount, request_id)
+    if existing:
+        status = request_status(existing)
+        if status in (None,) + IN_PROGRESS:
+            return already_in_progress(existing, status)
+        # The earlier request has settled; take the claim over unless another tap just did
+        admission.release(business_number, phone_number, amount)
+        existing = admission.claim(business_number, phone_number, amount, request_id)
+        if existing:
+            return already_in_progress(existing, request_status(existing))
+
+    try:
+        admission.admit(business_number, phone_number, shortcode=True)
+    except RateLimited as e:
+        admission.release(business_number, phone_number, amount)
+        return rate_limited(e)
         
     try:
-        stk_push_response = mpesa.stk_push(
-            business_shortcode=Config.MPESA_BUSINESS_SHORTCODE,
-            passcode=Config.MPESA_PASSKEY,
-            amount=int(amount),
-            callback_url=Config.MPESA_CALLBACK_URL,
-            reference_code=business_number, 
+        # Persist the request and let the dispatcher talk to Daraja
+        transaction = Transaction(
+            vendor_id=vendor.id,
+            type='in',
+            amount=amount,
+            customer=customer,
             phone_number=phone_number,
-            description=f"Payment to {vendor.business_name}"  
+            reference=reference,
+            request_id=request_id,
+            status='queued'
         )
-        
-        if 'ResponseCode' in stk_push_response and stk_push_response['ResponseCode'] == '0':
-            checkout_request_id = stk_push_response['CheckoutRequestID']
-            
-            # Create transaction with the correct vendor.id
-            transaction = Transaction(
-                vendor_id=vendor.id,  #
-                type='in',
-                amount=amount,
-                customer=customer,
-                mpesa_checkout_request_id=checkout_request_id,
-                status='pending'
-            )
-            
-            db.session.add(transaction)
-            db.session.commit()
-            
-            return jsonify({
-                'message': 'STK Push sent successfully',
-                'checkout_request_id': checkout_request_id
-            }), 200
-        else:
-            print("Failed to initiate payment", stk_push_response)
-            return jsonify({
-                'error': 'Failed to initiate payment',
-                'details': stk_push_response
-            }), 400
+        transaction.change_seq = next_change_seq(vendor.id)
+        db.session.add(transaction)
+        db.session.commit()
+
+        dispatcher.submit(transaction.id)
+        events.publish_transaction(transaction.id, vendor.id, transaction.status,
+                                   request_id=transaction.request_id, change_seq=transaction.change_seq)
+
+        return jsonify({
+            'message': 'Payment request queued',
+            'request_id': transaction.request_id,
+            'status': transaction.status
+        }), 202
+    except Exception as e:
+        db.session.rollback()
+        admission.release(business_number, phone_number, amount)
+        logger.exception("Error occurred: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/pay/bulk', methods=['POST'])
+def pay_bulk():
+    data = request.get_json()
+    business_number = data.get('account_number')
+    items = data.get('items')
+
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'items must be a non-empty list'}), 400
+    max_items = current_app.config['PAY_BULK_MAX_ITEMS']
+    if len(items) > max_items:
+        return jsonify({'error': f'At most {max_items} items per request'}), 400
+
+    vendor = vendor_cache.by_business_number(business_number)
+    if not vendor:
+        return jsonify({'error': f'Vendor with business number {business_number} not found'}), 404
+
+    # Validate everything first; invalid items are reported, the rest are queued.
+    # Each queued push takes a vendor and a phone token; the shortcode bucket paces them in the dispatcher.
+    results = []
+    rows = []
+    vendor_limited = None
+    now = datetime.utcnow()
+    for index, item in enumerate(items):
+        result = {'index': index}
+        if isinstance(item, dict) and item.get('reference') is not None:
+            result['reference'] = item['reference']
+        results.append(result)
+        try:
+            if not isinstance(item, dict):
+                raise ValueError('Each item must be an object')
+            amount = ledger.to_push_amount(item.get('amount'))
+            phone_number = normalize_phone(item.get('phone_number'))
+            reference = normalize_reference(item.get('reference'))
+        except ValueError as e:
+            result.update(status='rejected', error=str(e))
+            continue
+        try:
+            if vendor_limited is not None:
+                raise vendor_limited
+            admission.admit(business_number, phone_number)
+        except RateLimited as e:
+            if e.scope == 'vendor':
+                # The vendor's bucket is empty; no later item would be admitted either
+                vendor_limited = e
+            result.update(status='rate_limited', error=str(e), retry_after=round(e.retry_after, 3))
+            continue
+        result.update(status='queued', request_id=uuid.uuid4().hex)
+        rows.append({
+            'vendor_id': vendor.id,
+            'type': 'in',
+            'amount': amount,
+            'date': now,
+            'customer': item.get('customer') or 'Unknown Customer',
+            'phone_number': phone_number,
+            'reference': reference,
+            'request_id': result['request_id'],
+            'status': 'queued'
+        })
+
+    if not rows:
+        if vendor_limited is not None:
+            return rate_limited(vendor_limited)
+        return jsonify({'error': 'No valid items', 'results': results}), 400
+
+    try:
+        # One sequence bump, one multi-row insert and one commit for the whole batch
+        last_seq = next_change_seq(vendor.id, count=len(rows))
+        for offset, row in enumerate(rows):
+            row['change_seq'] = last_seq - len(rows) + 1 + offset
+        db.session.execute(insert(Transaction), rows)
+        ids = dict(db.session.execute(
+            select(Transaction.request_id, Transaction.id)
+            .where(Transaction.request_id.in_([row['request_id'] for row in rows]))
+        ).all())
+        db.session.commit()
     except Exception as e:
         db.session.rollback()
-        logging.error(f"Error occurred: {str(e)}", exc_info=True)
+        logger.exception("Error occurred: %s", e)
         return jsonify({'error': str(e)}), 500
+
+    # The bulk dispatcher's pool bounds how many pushes are in flight at once
+    for row in rows:
+        bulk_dispatcher.submit(ids[row['request_id']])
+        events.publish_transaction(ids[row['request_id']], vendor.id, 'queued',
+                                   request_id=row['request_id'], change_seq=row['change_seq'])
+
+    return jsonify({
+        'message': 'Payment requests queued',
+        'queued': len(rows),
+        'rejected': len(results) - len(rows),
+        'results': results
+    }), 202
+
+def request_status(request_id):
+    return db.session.scalar(select(Transaction.status).where(Transaction.request_id == request_id))
+
+def already_in_progress(request_id, status):
+    return jsonify({
+        'message': 'Payment request already in progress',
+        'request_id': request_id,
+        'status': status or 'queued',
+        'deduplicated': True
+    }), 202
+
+def rate_limited(e):
+    response = jsonify({'error': str(e), 'retry_after': round(e.retry_after, 3)})
+    response.headers['Retry-After'] = e.retry_after_header
+    return response, 429
+
+def normalize_phone(phone_number):
+    """Return the MSISDN as digits only (e.g. 2547XXXXXXXX). Raises ValueError."""
+    digits = str(phone_number or '').strip().lstrip('+')
+    if not digits.isdigit() or not 9 <= len(digits) <= 15:
+        raise ValueError(f"Invalid phone number {phone_number!r}")
+    return digits
+
+def normalize_reference(reference):
+    """Return the payment reference stripped, or None if blank. Raises ValueError if too long."""
+    reference = str(reference or '').strip() or None
+    max_length = Transaction.reference.type.length
+    if reference and len(reference) > max_length:
+        raise ValueError(f'Reference must be at most {max_length} characters')
+    return reference
+
+@bp.route('/pay/<request_id>', methods=['GET'])
+def payment_status(request_id):
+    return status_response(Transaction.request_id == request_id, f'request:{request_id}')
+
+@bp.route('/mpesa/status/<checkout_request_id>', methods=['GET'])
+def checkout_status(checkout_request_id):
+    return status_response(
+        Transaction.mpesa_checkout_request_id == checkout_request_id,
+        f'checkout:{checkout_request_id}'
+    )
+
+def status_response(criterion, channel):
+    # ?wait=N long-polls until the payment leaves queued/pending or N seconds pass
+    try:
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        return jsonify({'error': 'Invalid wait'}), 400
+    if not math.isfinite(wait):
+        return jsonify({'error': 'Invalid wait'}), 400
+    wait = max(0, min(wait, current_app.config['STATUS_WAIT_MAX']))
+
+    deadline = time.monotonic() + wait
+    subscription = None
+    if wait > 0:
+        try:
+            subscription = events.subscribe(channel)
+        except TooManySubscriptions:
+            return waiters_full()
+    try:
+        while True:
+            transaction = db.session.query(
+                Transaction.request_id, Transaction.status, Transaction.mpesa_checkout_request_id
+            ).filter(criterion).first()
+            remaining = deadline - time.monotonic()
+            if not transaction or transaction.status not in IN_PROGRESS:
+                break
+            if subscription is None or remaining <= 0:
+                break
+            # Give the connection back to the pool while we wait; re-read regularly in case
+            # another worker settled it (its event never reaches this one)
+            db.session.rollback()
+            subscription.get(timeout=min(remaining, current_app.config['EVENTS_RECHECK_INTERVAL']))
+    finally:
+        if subscription is not None:
+            subscription.close()
+
+    if not transaction:
+        return jsonify({'error': 'Payment request not found'}), 404
+
+    return jsonify({
+        'request_id': transaction.request_id,
+        'status': transaction.status,
+        'checkout_request_id': transaction.mpesa_checkout_request_id
+    }), 200
     
+def waiters_full():
+    # Every subscription slot in this worker is held by a waiting client
+    response = jsonify({'error': 'Too many clients are waiting for payment updates, retry shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 @bp.route('/mpesa/callback', methods=['POST'])
 def mpesa_callback():
+    received = time.monotonic()
     data = request.get_json()
-    print("Callback data", data)
-    
+    logger.debug("Callback data %s", data)
+
     try:
         stk_callback = data.get('Body', {}).get('stkCallback', {})
         result_code = stk_callback.get('ResultCode')
@@ -81,28 +298,35 @@ def mpesa_callback():
         if not checkout_request_id:
             return jsonify({'error': 'Missing CheckoutRequestID'}), 400
 
-        transaction = Transaction.query.filter_by(
-            mpesa_checkout_request_id=checkout_request_id
-        ).first()
+        # Queue mode: persist the payload and let the consumers settle it
+        if callback_queue.enabled:
+            callback_queue.append(data)
+            return jsonify({'message': 'Accepted'}), 200
+
+        settlement = apply_stk_result(checkout_request_id, result_code, stk_callback)
+        if settlement and settlement.applied:
+            metrics.CALLBACK_LAG.labels('sync').observe(time.monotonic() - received)
 
-        if not transaction:
+        if not settlement:
             return jsonify({'error': 'Transaction not found'}), 404
 
-        # Handle transaction based on result_code
-        if result_code == 0:
-            transaction.status = 'completed'
-            vendor = transaction.vendor
-            vendor.balance = (vendor.balance or 0) + transaction.amount
-        else:
-            transaction.status = 'failed'
+        # Daraja may deliver the same callback more than once
+        if not settlement.applied:
+            return jsonify({'message': 'Already processed'}), 200
 
-        db.session.commit()
         return jsonify({'message': 'Success' if result_code == 0 else 'Failed'}), 200
 
     except Exception as e:
-        print("Error processing callback:", str(e))
+        db.session.rollback()
+        logger.exception("Error processing callback")
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/mpesa/callback/queue', methods=['GET'])
+def callback_queue_stats():
+    if not callback_queue.enabled:
+        return jsonify({'error': 'Callback queue is disabled'}), 404
+    return jsonify(callback_queue.stats()), 200
+
 @bp.route('/withdraw', methods=['POST'])
 def withdraw():
     data = request.get_json()
@@ -113,36 +337,50 @@ def withdraw():
     if not amount or not phone_number or not business_number:
         return jsonify({'error': 'Amount, phone number, and business number are required'}), 400
 
-    vendor = Vendor.query.filter_by(business_number=business_number).first()
+    try:
+        amount = ledger.to_amount(amount)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    vendor = vendor_cache.by_business_number(business_number)
     if not vendor:
         return jsonify({'error': f'Vendor with business number {business_number} not found'}), 404
 
-    # Check if the vendor has sufficient balance
-    if vendor.balance < float(amount):
-        return jsonify({'error': 'Insufficient balance for withdrawal'}), 400
-
     try:
+        # Debit only if the balance covers it, in one statement, so concurrent
+        # withdrawals cannot both pass the check and overdraw
+        change_seq = next_change_seq(
+            vendor.id,
+            criterion=func.coalesce(Vendor.balance, 0) >= amount,
+            balance=func.coalesce(Vendor.balance, 0) - amount
+        )
+        if change_seq is None:
+            db.session.rollback()
+            return jsonify({'error': 'Insufficient balance for withdrawal'}), 400
+
         # Create a transaction of type 'out'
         transaction = Transaction(
             vendor_id=vendor.id,
             type='out',
             amount=amount,
             customer='Withdrawal', 
-            status='completed' 
+            status='completed',
+            change_seq=change_seq
         )
-        
-        vendor.balance -= float(amount)
-
         db.session.add(transaction)
+        db.session.flush()
+        ledger.post(vendor.id, transaction.id, -amount, ledger.PAYOUTS)
+        rollups.record(vendor.id, transaction.date, 'out', 'completed', amount)
+        remaining_balance = db.session.scalar(select(Vendor.balance).where(Vendor.id == vendor.id))
         db.session.commit()
 
         return jsonify({
             'message': 'Withdrawal processed successfully',
             'transaction_id': transaction.id,
-            'remaining_balance': vendor.balance
+            'remaining_balance': remaining_balance
         }), 200
 
     except Exception as e:
         db.session.rollback()
-        logging.error(f"Error occurred: {str(e)}", exc_info=True)
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        logger.exception("Error occurred: %s", e)
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,86 @@
+import io
+from flask import Blueprint, Response, request, jsonify, current_app, send_file
+from app.services import ledger
+from app.services.qr import FORMATS, qr
+from app.services.vendor_cache import vendor_cache
+from app.utils.decorators import token_required
+
+bp = Blueprint('qr', __name__)
+
+MAX_REFERENCE_LENGTH = 64
+
+@bp.route('/qr/<business_number>', methods=['GET'])
+def vendor_qr(business_number):
+    fmt = request.args.get('format', 'png')
+    if fmt not in FORMATS:
+        return jsonify({'error': f"Format must be one of {', '.join(FORMATS)}"}), 400
+    try:
+        amount, reference = parse_code_options(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    vendor = vendor_cache.by_business_number(business_number)
+    if not vendor:
+        return jsonify({'error': f'Vendor with business number {business_number} not found'}), 404
+
+    # The ETag is a hash of the encoded content, so a match means nothing needs rendering
+    code = qr.code(vendor.business_name, vendor.business_number, amount, reference)
+    etag = qr.etag(code, fmt)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(qr.render(code, fmt), mimetype=FORMATS[fmt])
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['QR_MAX_AGE']
+    return response
+
+@bp.route('/qr/batch', methods=['POST'])
+@token_required
+def vendor_qr_batch(current_vendor):
+    """Render the vendor's codes for a list of amounts/references (e.g. one per table) as a ZIP or PDF."""
+    data = request.get_json(silent=True) or {}
+    output = data.get('output', 'zip')
+    fmt = data.get('format', 'png')
+    items = data.get('items') or [{}]
+    if output not in ('zip', 'pdf'):
+        return jsonify({'error': 'Output must be zip or pdf'}), 400
+    if fmt not in FORMATS:
+        return jsonify({'error': f"Format must be one of {', '.join(FORMATS)}"}), 400
+    if not isinstance(items, list):
+        return jsonify({'error': 'items must be a list'}), 400
+    max_items = current_app.config['QR_BATCH_MAX_ITEMS']
+    if len(items) > max_items:
+        return jsonify({'error': f'At most {max_items} items per request'}), 400
+    if not current_vendor.business_number:
+        return jsonify({'error': 'Vendor has no business number'}), 400
+
+    codes = []
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError('Item must be an object')
+            amount, reference = parse_code_options(item)
+        except ValueError as e:
+            return jsonify({'error': f'Item {index}: {e}'}), 400
+        codes.append(qr.code(current_vendor.business_name, current_vendor.business_number, amount, reference))
+
+    buffer = io.BytesIO()
+    if output == 'pdf':
+        qr.write_pdf(codes, buffer)
+        mimetype = 'application/pdf'
+    else:
+        qr.write_zip(codes, buffer, fmt)
+        mimetype = 'application/zip'
+    buffer.seek(0)
+    return send_file(buffer, mimetype=mimetype, as_attachment=True,
+                     download_name=f'qr_{current_vendor.business_number}.{output}')
+
+def parse_code_options(values):
+    """Return ``(amount, reference)`` from request values, either of which may be None. Raises ValueError."""
+    amount = values.get('amount')
+    amount = ledger.to_push_amount(amount) if amount not in (None, '') else None
+    reference = str(values.get('reference') or '').strip() or None
+    if reference and len(reference) > MAX_REFERENCE_LENGTH:
+        raise ValueError(f'Reference must be at most {MAX_REFERENCE_LENGTH} characters')
+    return amount, reference
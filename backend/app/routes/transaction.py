@@ -1,40 +1,236 @@
-from email.mime.text import MIMEText
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
+from sqlalchemy import and_, or_
+from app import db
+from app.services import rollups
+from app.services.events import TooManySubscriptions, events
+from app.services.statements import statement_worker
 from app.utils.decorators import token_required
+from app.models.statement_job import StatementJob
 from app.models.transaction import Transaction
+from app.models.vendor import Vendor
 from datetime import datetime, timedelta
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle, Spacer
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
-import os
-from reportlab.lib.units import inch
+import json
+import base64
+import time
+import uuid
 
 bp = Blueprint('transaction', __name__)
 
 @bp.route('/transactions', methods=['GET'])
 @token_required
 def get_transactions(current_vendor):
-    transactions = Transaction.query.filter_by(vendor_id=current_vendor.id).order_by(Transaction.date.desc()).all()
+    # Keyset pagination on (date, id), newest first
+    try:
+        limit = min(int(request.args.get('limit', current_app.config['TRANSACTIONS_PAGE_SIZE'])),
+                    current_app.config['TRANSACTIONS_MAX_PAGE_SIZE'])
+        cursor = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        date_from = parse_date(request.args.get('from'))
+        date_to = parse_date(request.args.get('to'))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit, cursor or date'}), 400
+    if limit < 1:
+        return jsonify({'error': 'Invalid limit, cursor or date'}), 400
+
+    query = db.session.query(
+        Transaction.id, Transaction.type, Transaction.amount,
+        Transaction.date, Transaction.customer, Transaction.status, Transaction.reference
+    ).filter(Transaction.vendor_id == current_vendor.id)
+
+    if request.args.get('type'):
+        query = query.filter(Transaction.type == request.args['type'])
+    if request.args.get('status'):
+        query = query.filter(Transaction.status == request.args['status'])
+    if date_from:
+        query = query.filter(Transaction.date >= date_from)
+    if date_to:
+        query = query.filter(Transaction.date <= date_to)
+    if cursor:
+        cursor_date, cursor_id = cursor
+        query = query.filter(or_(
+            Transaction.date < cursor_date,
+            and_(Transaction.date == cursor_date, Transaction.id < cursor_id)
+        ))
+
+    # One extra row tells us whether there is another page
+    rows = query.order_by(Transaction.date.desc(), Transaction.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
     
     result = [{
-        'id': transaction.id,
-        'type': transaction.type,
-        'amount': transaction.amount,
-        'date': transaction.date.isoformat(),
-        'customer': transaction.customer,
-        'status': transaction.status
-    } for transaction in transactions]
+        'id': row.id,
+        'type': row.type,
+        'amount': row.amount,
+        'date': row.date.isoformat(),
+        'customer': row.customer,
+        'status': row.status,
+        'reference': row.reference
+    } for row in rows[:limit]]
 
     return jsonify({
         'balance': current_vendor.balance,
-        'transactions': result
+        'transactions': result,
+        'next_cursor': next_cursor,
+        'high_water': current_vendor.change_seq
+    }), 200
+
+@bp.route('/transactions/changes', methods=['GET'])
+@token_required
+def get_transaction_changes(current_vendor):
+    # Rows created or moved to a new status since the client's high-water mark
+    try:
+        since = int(request.args.get('since', 0))
+        limit = min(int(request.args.get('limit', current_app.config['TRANSACTIONS_MAX_PAGE_SIZE'])),
+                    current_app.config['TRANSACTIONS_MAX_PAGE_SIZE'])
+    except ValueError:
+        return jsonify({'error': 'Invalid since or limit'}), 400
+    if since < 0 or limit < 1:
+        return jsonify({'error': 'Invalid since or limit'}), 400
+
+    # Read the balance and sequence together so they describe the same point in time
+    vendor = db.session.query(Vendor.balance, Vendor.change_seq).filter(Vendor.id == current_vendor.id).one()
+
+    rows = db.session.query(
+        Transaction.id, Transaction.type, Transaction.amount, Transaction.date,
+        Transaction.customer, Transaction.status, Transaction.reference, Transaction.change_seq
+    ).filter(
+        Transaction.vendor_id == current_vendor.id,
+        Transaction.change_seq > since,
+        Transaction.change_seq <= vendor.change_seq
+    ).order_by(Transaction.change_seq).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return jsonify({
+        'balance': vendor.balance,
+        'transactions': [{
+            'id': row.id,
+            'type': row.type,
+            'amount': row.amount,
+            'date': row.date.isoformat(),
+            'customer': row.customer,
+            'status': row.status,
+            'reference': row.reference
+        } for row in rows],
+        'high_water': rows[-1].change_seq if has_more else max(vendor.change_seq, since),
+        'has_more': has_more
+    }), 200
+
+def encode_cursor(row):
+    return base64.urlsafe_b64encode(f"{row.date.isoformat()}|{row.id}".encode()).decode()
+
+def decode_cursor(cursor):
+    # Malformed cursors surface as ValueError (binascii and unicode errors included)
+    date, id_ = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(date), int(id_)
+
+def parse_date(value):
+    return datetime.fromisoformat(value) if value else None
+
+@bp.route('/transactions/summary', methods=['GET'])
+@token_required
+def get_transaction_summary(current_vendor):
+    # Period totals served from the daily rollups (UTC days, today included)
+    today = datetime.utcnow().date()
+    period = request.args.get('period', 'week')
+    if period == 'today':
+        start_day = today
+    elif period == 'week':
+        start_day = today - timedelta(days=today.weekday())
+    elif period == 'month':
+        start_day = today.replace(day=1)
+    else:
+        return jsonify({'error': 'Invalid period'}), 400
+
+    totals = rollups.summarize(current_vendor.id, start_day, today)
+    summary = {}
+    for (type_, status), (count, total) in totals.items():
+        summary.setdefault(type_, {})[status] = {'count': count, 'total': total}
+
+    return jsonify({
+        'period': period,
+        'start': start_day.isoformat(),
+        'end': today.isoformat(),
+        'summary': summary
     }), 200
 
+@bp.route('/transactions/events', methods=['GET'])
+@token_required
+def transaction_events(current_vendor):
+    # Server-sent events for every status change of this vendor's transactions. Event ids are
+    # change sequence numbers, so a reconnecting client resumes where it left off (Last-Event-ID).
+    vendor_id = current_vendor.id
+    try:
+        last_event_id = request.headers.get('Last-Event-ID')
+        since = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'error': 'Invalid Last-Event-ID'}), 400
+    if since is None:
+        since = db.session.query(Vendor.change_seq).filter(Vendor.id == vendor_id).scalar() or 0
+    db.session.rollback()
+
+    try:
+        subscription = events.subscribe(f'vendor:{vendor_id}')
+    except TooManySubscriptions:
+        response = jsonify({'error': 'Too many open event streams, retry shortly'})
+        response.headers['Retry-After'] = '3'
+        return response, 503
+
+    config = current_app.config
+    keepalive = config['SSE_KEEPALIVE']
+    recheck = config['EVENTS_RECHECK_INTERVAL']
+    page_size = config['TRANSACTIONS_MAX_PAGE_SIZE']
+    # Bounded so a stream never pins its server thread for good; the client reconnects after `retry`
+    deadline = time.monotonic() + config['SSE_MAX_LIFETIME']
+
+    def stream(since):
+        try:
+            yield 'retry: 3000\n\n'
+            last_sent = time.monotonic()
+            while True:
+                # Events only wake us up; the database says what changed, including in other workers
+                while True:
+                    changes = change_events(vendor_id, since, page_size)
+                    db.session.rollback()
+                    for message in changes:
+                        since = message['change_seq']
+                        yield f"id: {since}\nevent: transaction\ndata: {json.dumps(message)}\n\n"
+                    if len(changes) < page_size:
+                        break
+                now = time.monotonic()
+                if changes:
+                    last_sent = now
+                elif now - last_sent >= keepalive:
+                    yield ': keep-alive\n\n'
+                    last_sent = now
+                if now >= deadline:
+                    return
+                if subscription.get(timeout=min(recheck, keepalive, deadline - now)) is not None:
+                    # One read covers every change that has been announced so far
+                    while subscription.get(timeout=0) is not None:
+                        pass
+        finally:
+            subscription.close()
+
+    return Response(stream_with_context(stream(since)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def change_events(vendor_id, since, limit):
+    """Status changes after change sequence ``since``, oldest first, in the event message format."""
+    rows = db.session.query(
+        Transaction.id, Transaction.request_id, Transaction.mpesa_checkout_request_id,
+        Transaction.status, Transaction.change_seq
+    ).filter(
+        Transaction.vendor_id == vendor_id,
+        Transaction.change_seq > since
+    ).order_by(Transaction.change_seq).limit(limit).all()
+    return [{
+        'transaction_id': row.id,
+        'request_id': row.request_id,
+        'checkout_request_id': row.mpesa_checkout_request_id,
+        'status': row.status,
+        'change_seq': row.change_seq
+    } for row in rows]
+
 @bp.route('/export-statement', methods=['POST'])
 @token_required
 def export_statement(current_vendor):
@@ -56,129 +252,29 @@ def export_statement(current_vendor):
     else:
         return jsonify({'error': 'Invalid duration'}), 400
 
-    # Fetch transactions within the date range
-    transactions = Transaction.query.filter(
-        Transaction.vendor_id == current_vendor.id,
-        Transaction.date >= start_date,
-        Transaction.date <= end_date
-    ).order_by(Transaction.date.desc()).all()
-
-    # Calculate totals
-    total_in = sum(t.amount for t in transactions if t.type == 'in')
-    total_out = sum(t.amount for t in transactions if t.type == 'out')
-
-    # Generate PDF
-    pdf_filename = f'statement_{current_vendor.id}_{datetime.now().strftime("%Y%m%d%H%M%S")}.pdf'
-    pdf_path = os.path.join(current_app.config['UPLOAD_FOLDER'], pdf_filename)
-    generate_pdf(pdf_path, transactions, start_date, end_date, total_in, total_out, duration, current_vendor.business_name)
+    # The PDF is built and emailed by the statement worker
+    job = StatementJob(
+        id=uuid.uuid4().hex,
+        vendor_id=current_vendor.id,
+        email=email,
+        duration=duration,
+        start_date=start_date,
+        end_date=end_date,
+        status='queued'
+    )
+    db.session.add(job)
+    db.session.commit()
+    statement_worker.submit(job.id)
 
-    send_email_with_attachment(email, pdf_path)
-
-    return jsonify({'message': 'Statement export request has been sent to your email.'}), 200
+    return jsonify({
+        'message': 'Statement export request has been queued and will be sent to your email.',
+        'job_id': job.id
+    }), 202
 
-def generate_pdf(pdf_path, transactions, start_date, end_date, total_in, total_out, duration, vendor_business_name):
-    doc = SimpleDocTemplate(pdf_path, pagesize=letter)
-    styles = getSampleStyleSheet()
-    
-    # Create a custom style for center alignment
-    centered_style = styles['Normal'].clone('CenteredStyle')
-    centered_style.alignment = 1  
-
-    elements = []
-
-    # Title
-    title = Paragraph('<b>SCAN2PAY STATEMENT</b>', styles['Title'])
-    title.alignment = 1 
-    elements.append(title)
-    elements.append(Spacer(1, 12)) 
-
-    # Vendor Business Name
-    business_name_paragraph = Paragraph(vendor_business_name, centered_style)  
-    elements.append(business_name_paragraph)
-    elements.append(Spacer(1, 12))
-
-    # Duration Heading
-    duration_text = f"{duration.capitalize()} Statement"
-    duration_paragraph = Paragraph(duration_text, centered_style)  
-    elements.append(duration_paragraph)
-    elements.append(Spacer(1, 12))  
-
-    # Date Range
-    date_range_text = f"From: {start_date.strftime('%Y-%m-%d')} To: {end_date.strftime('%Y-%m-%d')}"
-    date_range_paragraph = Paragraph(date_range_text, centered_style)  
-    elements.append(date_range_paragraph)
-    elements.append(Spacer(1, 24))  
-
-    # Summary Table
-    summary_data = [
-        ['Money In', f"KES {total_in:.2f}"],
-        ['Money Out', f"KES {total_out:.2f}"]
-    ]
-    summary_table = Table(summary_data, colWidths=[doc.width * 0.4, doc.width * 0.4])
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2A2A2A')),  
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke), 
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'), 
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),  
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),  
-        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#F5F5F5')), 
-        ('GRID', (0, 0), (-1, -1), 1, colors.black), 
-    ]))
-    elements.append(summary_table)
-    elements.append(Spacer(1, 24)) 
-
-    # Transaction Records Table
-    transaction_data = [['Date', 'Type', 'Customer', 'Amount (KES)']]
-    for t in transactions:
-        transaction_data.append([t.date.strftime('%Y-%m-%d'), t.type.capitalize(), t.customer, f"{t.amount:.2f}"])
-
-    # Set table width to 90% of the page width
-    table_width = doc.width * 0.9
-    col_widths = [table_width * 0.25, table_width * 0.25, table_width * 0.35, table_width * 0.15]
-    transaction_table = Table(transaction_data, colWidths=col_widths)
-    transaction_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2A2A2A')), 
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),  
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),  
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),  
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),  
-        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#F5F5F5')),  
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),  
-    ]))
-    elements.append(transaction_table)
-
-    # Build the PDF
-    doc.build(elements)
-
-def send_email_with_attachment(email, pdf_path):
-    smtp_server = current_app.config['SMTP_SERVER']
-    smtp_port = current_app.config['SMTP_PORT']
-    smtp_username = current_app.config['SMTP_USERNAME']
-    smtp_password = current_app.config['SMTP_PASSWORD']
-    from_email = current_app.config['FROM_EMAIL']
-
-    msg = MIMEMultipart()
-    msg['From'] = from_email
-    msg['To'] = email
-    msg['Subject'] = 'Your Transaction Statement'
-
-    body = 'Please find your transaction statement attached.'
-    msg.attach(MIMEText(body, 'plain'))
-
-    with open(pdf_path, 'rb') as attachment:
-        part = MIMEBase('application', 'octet-stream')
-        part.set_payload(attachment.read())
-        encoders.encode_base64(part)
-        part.add_header(
-            'Content-Disposition',
-            f'attachment; filename={os.path.basename(pdf_path)}'
-        )
-        msg.attach(part)
-
-    with smtplib.SMTP(smtp_server, smtp_port) as server:
-        server.starttls()
-        server.login(smtp_username, smtp_password)
-        server.send_message(msg)
-
-    # Clean up the generated PDF
-    os.remove(pdf_path)
\ No newline at end of file
+@bp.route('/export-statement/<job_id>', methods=['GET'])
+@token_required
+def export_statement_status(current_vendor, job_id):
+    job = db.session.get(StatementJob, job_id)
+    if not job or job.vendor_id != current_vendor.id:
+        return jsonify({'error': 'Statement job not found'}), 404
+    return jsonify(job.to_dict()), 200
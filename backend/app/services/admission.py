@@ -0,0 +1,208 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from werkzeug.utils import import_string
+
+
+class MemoryBackend:
+    """Token buckets and in-flight claims local to the worker process.
+
+    Each worker enforces the limits on its own, so the effective limit is
+    multiplied by the number of workers. ``RedisBackend`` shares them.
+    """
+
+    def __init__(self, app):
+        self.maxsize = app.config['RATE_LIMIT_MAX_KEYS']
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+        self._claims = OrderedDict()
+
+    def take(self, key, rate, burst, cost=1):
+        """Take ``cost`` tokens. Returns 0 if admitted, else the seconds until they would be."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+            else:
+                wait = (cost - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def give_back(self, key, burst, cost=1):
+        with self._lock:
+            if key in self._buckets:
+                tokens, updated = self._buckets[key]
+                self._buckets[key] = (min(burst, tokens + cost), updated)
+
+    def remember(self, key, value, ttl):
+        """Store ``value`` unless a live value exists. Returns the existing value, or None if stored."""
+        now = time.monotonic()
+        with self._lock:
+            existing = self._claims.get(key)
+            if existing is not None and existing[1] > now:
+                return existing[0]
+            self._claims.pop(key, None)
+            self._claims[key] = (value, now + ttl)
+            while len(self._claims) > self.maxsize:
+                self._claims.popitem(last=False)
+            return None
+
+    def forget(self, key):
+        with self._lock:
+            self._claims.pop(key, None)
+
+
+class RedisBackend:
+    """Token buckets and claims shared by every worker through Redis (``RATE_LIMIT_REDIS_URL``).
+
+    Requires the optional ``redis`` package.
+    """
+
+    TAKE = """
+    local now = redis.call('TIME')
+    now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+    local rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or burst
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+    local wait = 0
+    if tokens >= cost then tokens = tokens - cost else wait = (cost - tokens) / rate end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return tostring(wait)
+    """
+
+    GIVE_BACK = """
+    local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+    if tokens then
+        redis.call('HSET', KEYS[1], 'tokens', math.min(tonumber(ARGV[1]), tokens + tonumber(ARGV[2])))
+    end
+    return 0
+    """
+
+    def __init__(self, app):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("RedisBackend requires redis: pip install redis") from e
+        self.client = redis.Redis.from_url(app.config['RATE_LIMIT_REDIS_URL'])
+        self.prefix = 'scan2pay:admission:'
+        self._take = self.client.register_script(self.TAKE)
+        self._give_back = self.client.register_script(self.GIVE_BACK)
+
+    def take(self, key, rate, burst, cost=1):
+        return float(self._take(keys=[self.prefix + key], args=[rate, burst, cost]))
+
+    def give_back(self, key, burst, cost=1):
+        self._give_back(keys=[self.prefix + key], args=[burst, cost])
+
+    def remember(self, key, value, ttl):
+        key = self.prefix + key
+        if self.client.set(key, value, nx=True, ex=max(int(math.ceil(ttl)), 1)):
+            return None
+        existing = self.client.get(key)
+        return existing.decode() if existing is not None else None
+
+    def forget(self, key):
+        self.client.delete(self.prefix + key)
+
+
+class RateLimited(Exception):
+    def __init__(self, scope, retry_after):
+        super().__init__(f"Too many payment requests for this {scope}")
+        self.scope = scope
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self):
+        return str(max(int(math.ceil(self.retry_after)), 1))
+
+
+class Admission:
+    """Token-bucket admission for STK pushes, plus dedupe of identical in-flight requests.
+
+    Buckets are kept per business number, per payer phone number and for the
+    shared Daraja shortcode, whose limit Safaricom enforces across all vendors.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.backend = import_string(app.config['RATE_LIMIT_BACKEND'])(app)
+        app.extensions['admission'] = self
+
+    @property
+    def enabled(self):
+        return self.app is not None and self.app.config['RATE_LIMIT_ENABLED']
+
+    def limits(self, business_number=None, phone_number=None, shortcode=False):
+        """``(scope, key, rate, burst)`` for each bucket that applies."""
+        config = self.app.config
+        limits = []
+        if phone_number:
+            limits.append(('phone number', f'phone:{phone_number}',
+                           config['RATE_LIMIT_PHONE_RATE'], config['RATE_LIMIT_PHONE_BURST']))
+        if business_number:
+            limits.append(('vendor', f'vendor:{business_number}',
+                           config['RATE_LIMIT_VENDOR_RATE'], config['RATE_LIMIT_VENDOR_BURST']))
+        if shortcode:
+            limits.append(('shortcode', f"shortcode:{config['MPESA_BUSINESS_SHORTCODE']}",
+                           config['RATE_LIMIT_SHORTCODE_RATE'], config['RATE_LIMIT_SHORTCODE_BURST']))
+        return limits
+
+    def admit(self, business_number=None, phone_number=None, shortcode=False):
+        """Take a token from every applicable bucket, or none of them. Raises ``RateLimited``."""
+        if not self.enabled:
+            return
+        taken = []
+        for scope, key, rate, burst in self.limits(business_number, phone_number, shortcode):
+            wait = self.backend.take(key, rate, burst)
+            if wait > 0:
+                for _, taken_key, _, taken_burst in taken:
+                    self.backend.give_back(taken_key, taken_burst)
+                raise RateLimited(scope, wait)
+            taken.append((scope, key, rate, burst))
+
+    def wait_for_shortcode(self):
+        """Block until the shortcode bucket admits one more push (used to pace queued pushes)."""
+        if not self.enabled:
+            return
+        (_, key, rate, burst), = self.limits(shortcode=True)
+        while True:
+            wait = self.backend.take(key, rate, burst)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def claim(self, business_number, phone_number, amount, request_id):
+        """Claim a payment for the dedupe window. Returns the request_id already holding it, or None."""
+        if not self.enabled:
+            return None
+        return self.backend.remember(self._dedupe_key(business_number, phone_number, amount), request_id,
+                                     self.app.config['PAY_DEDUPE_WINDOW'])
+
+    def release(self, business_number, phone_number, amount):
+        if not self.enabled:
+            return
+        self.backend.forget(self._dedupe_key(business_number, phone_number, amount))
+
+    @staticmethod
+    def _dedupe_key(business_number, phone_number, amount):
+        digest = hashlib.sha256(f'{business_number}|{phone_number}|{amount}'.encode()).hexdigest()
+        return f'pay:{digest}'
+
+
+admission = Admission()
@@ -0,0 +1,117 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundPool:
+    """Runs jobs on a thread pool inside an application context.
+
+    The pool is sized from ``app.config[workers_key]``, created on first use and
+    re-created after a fork, so it is safe to build the app in a pre-forking
+    server's master process.
+    """
+
+    extension_name = None
+    workers_key = None
+    thread_name_prefix = 'background'
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions[self.extension_name] = self
+
+    def submit(self, fn, *args):
+        return self._get_executor().submit(self._run, fn, *args)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.app.config[self.workers_key],
+                    thread_name_prefix=self.thread_name_prefix
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        with self.app.app_context():
+            try:
+                return fn(*args)
+            except Exception:
+                db.session.rollback()
+                logger.exception("%s job %s%r failed", self.thread_name_prefix, fn.__name__, args)
+
+
+class ProcessPool:
+    """Runs CPU-bound functions in worker processes, outside the GIL.
+
+    The pool is sized from ``app.config[workers_key]`` (0 runs everything
+    inline), created on first use and re-created after a fork. Workers are
+    started with spawn rather than fork, because the serving process has
+    threads (and locks they may hold) of its own. Functions and arguments
+    must be picklable and must not need the app.
+    """
+
+    extension_name = None
+    workers_key = None
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions[self.extension_name] = self
+
+    @property
+    def workers(self):
+        return self.app.config[self.workers_key]
+
+    def call(self, fn, *args):
+        """Run ``fn(*args)`` in a worker process and wait for its result."""
+        if self.workers < 1:
+            return fn(*args)
+        return self._get_executor().submit(fn, *args).result()
+
+    def map(self, fn, *iterables, chunksize=1):
+        if self.workers < 1:
+            return map(fn, *iterables)
+        return self._get_executor().map(fn, *iterables, chunksize=chunksize)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                self._pid = os.getpid()
+            return self._executor
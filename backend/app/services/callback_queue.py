@@ -0,0 +1,193 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from app import db
+from app.services import metrics
+from app.services.settlement import apply_stk_result
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS callbacks (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    payload TEXT NOT NULL,
+    received_at REAL NOT NULL,
+    claimed_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    dead INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_callbacks_claim ON callbacks (dead, claimed_until, seq);
+"""
+
+
+class CallbackQueue:
+    """Durable, SQLite-backed write-ahead log for Daraja callbacks.
+
+    The callback route appends the raw payload and replies straight away;
+    consumer threads claim batches under a lease, settle them with
+    ``apply_stk_result`` and delete them once applied. A consumer that dies
+    mid-batch leaves its claims to expire, after which another consumer (or the
+    restarted process) replays them. Settlement is idempotent, so a replay is
+    harmless. Payloads that keep failing are parked as dead after
+    ``CALLBACK_QUEUE_MAX_ATTEMPTS``.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._consumers = []
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['callback_queue'] = self
+
+    @property
+    def enabled(self):
+        return self.app is not None and self.app.config['CALLBACK_INTAKE_MODE'] == 'queue'
+
+    def append(self, payload):
+        """Durably record a callback payload and return its sequence number."""
+        conn = self._connect()
+        cursor = conn.execute(
+            "INSERT INTO callbacks (payload, received_at) VALUES (?, ?)",
+            (json.dumps(payload), time.time())
+        )
+        self._wakeup.set()
+        return cursor.lastrowid
+
+    def claim(self, limit, lease):
+        """Lease up to ``limit`` unclaimed (or expired) entries, oldest first.
+
+        Returns ``(seq, payload, attempts, received_at)`` tuples.
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT seq, payload, attempts, received_at FROM callbacks "
+                "WHERE dead = 0 AND (claimed_until IS NULL OR claimed_until < ?) "
+                "ORDER BY seq LIMIT ?",
+                (now, limit)
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE callbacks SET claimed_until = ?, attempts = attempts + 1 WHERE seq = ?",
+                    [(now + lease, row[0]) for row in rows]
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [(seq, json.loads(payload), attempts + 1, received_at)
+                for seq, payload, attempts, received_at in rows]
+
+    def ack(self, seqs):
+        if seqs:
+            self._connect().executemany("DELETE FROM callbacks WHERE seq = ?", [(seq,) for seq in seqs])
+
+    def bury(self, seqs):
+        if seqs:
+            self._connect().executemany("UPDATE callbacks SET dead = 1 WHERE seq = ?", [(seq,) for seq in seqs])
+
+    def stats(self):
+        """Queue depth, age of the oldest waiting entry in seconds, and dead entries."""
+        depth, oldest = self._connect().execute(
+            "SELECT COUNT(*), MIN(received_at) FROM callbacks WHERE dead = 0"
+        ).fetchone()
+        dead = self._connect().execute("SELECT COUNT(*) FROM callbacks WHERE dead = 1").fetchone()[0]
+        return {
+            'depth': depth,
+            'lag_seconds': round(time.time() - oldest, 3) if oldest else 0.0,
+            'dead': dead
+        }
+
+    def start_consumers(self, count=None):
+        """Start consumer threads in this process (again, after a fork)."""
+        count = self.app.config['CALLBACK_QUEUE_CONSUMERS'] if count is None else count
+        with self._lock:
+            if self._pid == os.getpid() and self._consumers:
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._consumers = [
+                threading.Thread(target=self._consume, name=f'callback-consumer-{i}', daemon=True)
+                for i in range(count)
+            ]
+            for thread in self._consumers:
+                thread.start()
+
+    def stop_consumers(self, timeout=None):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._consumers:
+            thread.join(timeout)
+        self._consumers = []
+
+    def drain(self):
+        """Apply one batch in the calling thread. Returns the number of entries claimed."""
+        config = self.app.config
+        batch = self.claim(config['CALLBACK_QUEUE_BATCH_SIZE'], config['CALLBACK_QUEUE_LEASE'])
+        if not batch:
+            return 0
+
+        done, dead = [], []
+        with self.app.app_context():
+            for seq, payload, attempts, received_at in batch:
+                try:
+                    stk_callback = payload['Body']['stkCallback']
+                    settlement = apply_stk_result(
+                        stk_callback['CheckoutRequestID'], stk_callback.get('ResultCode'), stk_callback
+                    )
+                    # The callback can beat the dispatcher's commit of the
+                    # CheckoutRequestID; retry it until the lease expires.
+                    if settlement is None:
+                        raise LookupError(f"Transaction {stk_callback['CheckoutRequestID']} not found")
+                    if settlement.applied:
+                        metrics.CALLBACK_LAG.labels('queue').observe(time.time() - received_at)
+                    done.append(seq)
+                except Exception as e:
+                    db.session.rollback()
+                    if attempts >= config['CALLBACK_QUEUE_MAX_ATTEMPTS']:
+                        logger.error("Giving up on callback %s after %d attempts: %s", seq, attempts, e)
+                        dead.append(seq)
+                    else:
+                        logger.warning("Callback %s failed (attempt %d): %s", seq, attempts, e)
+        self.ack(done)
+        self.bury(dead)
+        return len(batch)
+
+    def _consume(self):
+        while not self._stop.is_set():
+            try:
+                claimed = self.drain()
+            except Exception:
+                logger.exception("Callback consumer failed")
+                claimed = 0
+            if not claimed:
+                self._wakeup.wait(self.app.config['CALLBACK_QUEUE_POLL_INTERVAL'])
+                self._wakeup.clear()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.app.config['CALLBACK_QUEUE_PATH'], timeout=30,
+                                   isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+
+callback_queue = CallbackQueue()
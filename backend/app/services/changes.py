@@ -0,0 +1,23 @@
+from sqlalchemy import select, update
+from app import db
+from app.models.vendor import Vendor
+
+
+def next_change_seq(vendor_id, count=1, criterion=None, **values):
+    """Advance the vendor's change sequence by ``count`` and return the new value.
+
+    Every insert or status transition of a vendor's transactions stamps the row
+    with a number from this sequence, which is what the delta feed pages on.
+    The UPDATE holds the vendor row lock until the caller commits, so a vendor's
+    changes commit in sequence order and a client's high-water mark never skips
+    a row that commits late. Extra ``values`` (e.g. a balance increment) are
+    applied in the same statement, guarded by an optional ``criterion``; if the
+    criterion does not match, nothing changes and None is returned.
+    """
+    stmt = update(Vendor).where(Vendor.id == vendor_id)
+    if criterion is not None:
+        stmt = stmt.where(criterion)
+    result = db.session.execute(stmt.values(change_seq=Vendor.change_seq + count, **values))
+    if criterion is not None and result.rowcount != 1:
+        return None
+    return db.session.scalar(select(Vendor.change_seq).where(Vendor.id == vendor_id))
@@ -0,0 +1,149 @@
+import logging
+import queue
+import threading
+from collections import defaultdict
+from werkzeug.utils import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class TooManySubscriptions(Exception):
+    """Every subscription slot in this worker (``EVENTS_MAX_SUBSCRIPTIONS``) is taken."""
+
+
+class Subscription:
+    def __init__(self, backend, channels, maxsize=100):
+        self.backend = backend
+        self.channels = channels
+        self.queue = queue.Queue(maxsize=maxsize)
+        # Called once when the subscription is closed
+        self.on_close = None
+        self._closed = False
+
+    def get(self, timeout=None):
+        """Return the next message, or None if nothing arrived within ``timeout`` seconds."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def deliver(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            # A slow subscriber only loses wake-ups; readers re-check the database
+            logger.debug("Dropping event for a full subscription on %s", self.channels)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.backend.unsubscribe(self)
+        if self.on_close is not None:
+            self.on_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LocalBackend:
+    """In-process pub/sub.
+
+    Only reaches subscribers in the same worker; subscribers see changes made
+    by other workers when they re-read the database, at least every
+    ``EVENTS_RECHECK_INTERVAL`` seconds. A cross-worker backend (Redis
+    pub/sub, Postgres LISTEN/NOTIFY, ...) implements the same ``publish``,
+    ``subscribe`` and ``unsubscribe`` methods and is selected with
+    ``EVENTS_BACKEND``.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.deliver(message)
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, channels)
+        with self._lock:
+            for channel in channels:
+                self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscriptions.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[channel]
+
+
+class EventBus:
+    """Publishes payment status changes to long-poll and SSE subscribers.
+
+    Every subscriber holds a server thread while it waits, so a worker accepts
+    at most ``EVENTS_MAX_SUBSCRIPTIONS`` at once (0 for no limit) and leaves
+    the rest of its threads to ordinary requests.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self._slots = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.backend = import_string(app.config['EVENTS_BACKEND'])(app)
+        limit = app.config['EVENTS_MAX_SUBSCRIPTIONS']
+        self._slots = threading.BoundedSemaphore(limit) if limit > 0 else None
+        app.extensions['events'] = self
+
+    def publish(self, channel, message):
+        if self.backend is None:
+            return
+        try:
+            self.backend.publish(channel, message)
+        except Exception:
+            # Subscribers fall back to re-reading the database on timeout
+            logger.exception("Failed to publish event on %s", channel)
+
+    def subscribe(self, *channels):
+        """Subscribe to ``channels``; close the subscription when done. Raises ``TooManySubscriptions``."""
+        if self._slots is not None and not self._slots.acquire(blocking=False):
+            raise TooManySubscriptions()
+        try:
+            subscription = self.backend.subscribe(channels)
+        except Exception:
+            if self._slots is not None:
+                self._slots.release()
+            raise
+        if self._slots is not None:
+            subscription.on_close = self._slots.release
+        return subscription
+
+    def publish_transaction(self, transaction_id, vendor_id, status, request_id=None,
+                            checkout_request_id=None, change_seq=None):
+        message = {
+            'transaction_id': transaction_id,
+            'request_id': request_id,
+            'checkout_request_id': checkout_request_id,
+            'status': status,
+            'change_seq': change_seq
+        }
+        self.publish(f'vendor:{vendor_id}', message)
+        if request_id:
+            self.publish(f'request:{request_id}', message)
+        if checkout_request_id:
+            self.publish(f'checkout:{checkout_request_id}', message)
+
+
+events = EventBus()
@@ -0,0 +1,100 @@
+from collections import namedtuple
+from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from sqlalchemy import func, insert, select
+from app import db
+from app.models.ledger_entry import LedgerEntry
+from app.models.vendor import Vendor
+
+VENDOR = 'vendor'
+# Counter accounts: money collected through M-Pesa, paid out to vendors, and
+# balances carried over from before the ledger existed
+COLLECTIONS = 'collections'
+PAYOUTS = 'payouts'
+OPENING = 'opening'
+
+CENT = Decimal('0.01')
+
+Mismatch = namedtuple('Mismatch', ['vendor_id', 'balance_cents', 'ledger_cents'])
+
+
+def to_amount(value):
+    """Parse a request amount into a positive Decimal with two places. Raises ValueError."""
+    try:
+        amount = Decimal(str(value)).quantize(CENT, rounding=ROUND_HALF_UP)
+    except (InvalidOperation, TypeError):
+        raise ValueError(f"Invalid amount {value!r}")
+    if not amount.is_finite() or amount <= 0:
+        raise ValueError(f"Invalid amount {value!r}")
+    return amount
+
+
+def to_push_amount(value):
+    """Parse an amount to collect by STK push. Daraja only takes whole KES, so a fraction is
+    refused rather than pushing less than settlement would credit. Raises ValueError."""
+    amount = to_amount(value)
+    if amount != amount.to_integral_value():
+        raise ValueError(f"Amount must be a whole number of KES, got {value!r}")
+    return amount
+
+
+def to_cents(amount):
+    return int((Decimal(str(amount)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def post(vendor_id, transaction_id, amount, counter_account):
+    """Append a posting in the caller's transaction: ``amount`` to the vendor, its negation to ``counter_account``."""
+    cents = to_cents(amount)
+    now = datetime.utcnow()
+    db.session.execute(insert(LedgerEntry), [
+        {'vendor_id': vendor_id, 'transaction_id': transaction_id, 'account': VENDOR,
+         'amount_cents': cents, 'created_at': now},
+        {'vendor_id': vendor_id, 'transaction_id': transaction_id, 'account': counter_account,
+         'amount_cents': -cents, 'created_at': now},
+    ])
+
+
+def open_accounts():
+    """Post an opening balance for vendors with a balance but no ledger lines yet. Returns how many."""
+    has_entries = select(LedgerEntry.id).where(LedgerEntry.vendor_id == Vendor.id).exists()
+    rows = db.session.execute(
+        select(Vendor.id, Vendor.balance).where(Vendor.balance != 0, ~has_entries)
+    ).all()
+    for vendor_id, balance in rows:
+        post(vendor_id, None, balance, OPENING)
+    db.session.commit()
+    return len(rows)
+
+
+def check(vendor_id=None):
+    """Compare cached vendor balances with their ledger sums.
+
+    Returns ``(mismatches, unbalanced)``: vendors whose balance differs from the
+    sum of their 'vendor' lines, and ``(vendor_id, transaction_id, sum)`` for
+    postings whose lines do not sum to zero.
+    """
+    ledger_sum = (
+        select(LedgerEntry.vendor_id, func.sum(LedgerEntry.amount_cents).label('cents'))
+        .where(LedgerEntry.account == VENDOR)
+        .group_by(LedgerEntry.vendor_id)
+        .subquery()
+    )
+    balances = select(Vendor.id, Vendor.balance, func.coalesce(ledger_sum.c.cents, 0)).outerjoin(
+        ledger_sum, ledger_sum.c.vendor_id == Vendor.id
+    )
+    postings = (
+        select(LedgerEntry.vendor_id, LedgerEntry.transaction_id, func.sum(LedgerEntry.amount_cents))
+        .group_by(LedgerEntry.vendor_id, LedgerEntry.transaction_id)
+        .having(func.sum(LedgerEntry.amount_cents) != 0)
+    )
+    if vendor_id is not None:
+        balances = balances.where(Vendor.id == vendor_id)
+        postings = postings.where(LedgerEntry.vendor_id == vendor_id)
+
+    mismatches = []
+    for vid, balance, cents in db.session.execute(balances):
+        balance_cents = to_cents(balance or 0)
+        if balance_cents != int(cents):
+            mismatches.append(Mismatch(vid, balance_cents, int(cents)))
+    unbalanced = [tuple(row) for row in db.session.execute(postings)]
+    return mismatches, unbalanced
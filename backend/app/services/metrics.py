@@ -0,0 +1,149 @@
+import os
+import time
+from urllib.parse import urlsplit
+from flask import g, has_request_context, request
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# With PROMETHEUS_MULTIPROC_DIR set (see gunicorn.conf.py) every worker writes its
+# samples to that directory and /metrics aggregates them, whichever worker answers.
+REQUEST_LATENCY = Histogram(
+    'scan2pay_http_request_duration_seconds', 'HTTP request latency by route.',
+    ['method', 'route', 'status']
+)
+REQUEST_DB_QUERIES = Histogram(
+    'scan2pay_http_request_db_queries', 'Database queries issued per HTTP request.',
+    ['route'], buckets=(0, 1, 2, 3, 4, 6, 8, 12, 16, 24, 32, 64)
+)
+REQUEST_DB_SECONDS = Histogram(
+    'scan2pay_http_request_db_seconds', 'Time spent in database queries per HTTP request.', ['route']
+)
+DB_QUERY_SECONDS = Histogram(
+    'scan2pay_db_query_duration_seconds', 'Latency of individual database queries.',
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5)
+)
+DARAJA_LATENCY = Histogram(
+    'scan2pay_daraja_request_duration_seconds', 'Daraja API latency per attempt.', ['endpoint', 'outcome']
+)
+DARAJA_ERRORS = Counter(
+    'scan2pay_daraja_errors_total',
+    'Daraja attempts answered with a 4xx/5xx or failed before a response.', ['endpoint', 'outcome']
+)
+CALLBACK_LAG = Histogram(
+    'scan2pay_callback_settle_lag_seconds', 'From receiving a Daraja callback to settling it.', ['intake'],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 300)
+)
+PAYMENT_COMPLETION = Histogram(
+    'scan2pay_payment_completion_seconds', 'From the /pay request to the payment settling.', ['status'],
+    buckets=(1, 2.5, 5, 10, 15, 20, 30, 45, 60, 120, 300, 900, 3600)
+)
+PASSWORD_HASH_SECONDS = Histogram(
+    'scan2pay_password_hash_duration_seconds', 'Password hash/verify latency, including time queued.',
+    ['operation', 'outcome'], buckets=(.01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+)
+VENDOR_CACHE_LOOKUPS = Counter(
+    'scan2pay_vendor_cache_lookups_total', 'Vendor identity cache lookups.', ['result']
+)
+QR_RENDERS = Counter(
+    'scan2pay_qr_renders_total', 'Single QR code renders by format and cache result.', ['format', 'cache']
+)
+STATEMENT_JOBS = Histogram(
+    'scan2pay_statement_job_duration_seconds', 'Time to build and email a statement.', ['status'],
+    buckets=(.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+)
+
+
+class QueueCollector:
+    """Reports the callback queue's depth and lag at scrape time."""
+
+    def collect(self):
+        from app.services.callback_queue import callback_queue
+
+        if not callback_queue.enabled:
+            return
+        stats = callback_queue.stats()
+        yield GaugeMetricFamily('scan2pay_callback_queue_depth', 'Callbacks waiting to be settled.',
+                                value=stats['depth'])
+        yield GaugeMetricFamily('scan2pay_callback_queue_lag_seconds', 'Age of the oldest waiting callback.',
+                                value=stats['lag_seconds'])
+        yield GaugeMetricFamily('scan2pay_callback_queue_dead', 'Callbacks parked after too many attempts.',
+                                value=stats['dead'])
+
+
+class Metrics:
+    """Times every request and counts the database queries it makes."""
+
+    def __init__(self, app=None):
+        self._queue_collector = QueueCollector()
+        self._registered = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['metrics'] = self
+        app.before_request(_start_request)
+        app.after_request(_finish_request)
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        if not os.getenv('PROMETHEUS_MULTIPROC_DIR') and not self._registered:
+            REGISTRY.register(self._queue_collector)
+            self._registered = True
+
+    def render(self):
+        """Return ``(body, content_type)`` in the Prometheus text format."""
+        if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+            from prometheus_client import multiprocess
+
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+            registry.register(self._queue_collector)
+        else:
+            registry = REGISTRY
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def observe_daraja(method, url, seconds, outcome):
+    """``MpesaBase`` observer: latency per attempt, and errors by outcome."""
+    endpoint = urlsplit(url).path
+    outcome_label = str(outcome)
+    DARAJA_LATENCY.labels(endpoint, outcome_label).observe(seconds)
+    if not isinstance(outcome, int) or outcome >= 400:
+        DARAJA_ERRORS.labels(endpoint, outcome_label).inc()
+
+
+def _start_request():
+    g.metrics_started = time.perf_counter()
+    g.db_queries = 0
+    g.db_seconds = 0.0
+
+
+def _finish_request(response):
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_LATENCY.labels(request.method, route, response.status_code).observe(time.perf_counter() - started)
+        REQUEST_DB_QUERIES.labels(route).observe(g.get('db_queries', 0))
+        REQUEST_DB_SECONDS.labels(route).observe(g.get('db_seconds', 0.0))
+    return response
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, 'metrics_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    DB_QUERY_SECONDS.observe(elapsed)
+    if has_request_context() and 'metrics_started' in g:
+        g.db_queries += 1
+        g.db_seconds += elapsed
+
+
+metrics = Metrics()
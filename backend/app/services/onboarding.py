@@ -0,0 +1,214 @@
+import hashlib
+import hmac
+from collections import namedtuple
+from flask import current_app
+from sqlalchemy import insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.vendor import Vendor
+from app.services.passwords import passwords
+
+# Business numbers are ten digits without a leading zero
+BUSINESS_NUMBER_MIN = 10 ** 9
+BUSINESS_NUMBER_HALF = 10 ** 5
+FEISTEL_ROUNDS = 4
+
+IMPORT_FIELDS = ('business_name', 'email', 'password', 'phone_number', 'business_type', 'id_number', 'full_name')
+REQUIRED_IMPORT_FIELDS = ('business_name', 'email', 'password', 'phone_number', 'id_number', 'full_name')
+
+ImportResult = namedtuple('ImportResult', ['line', 'email', 'status', 'business_number', 'error'])
+
+
+def business_number(vendor_id):
+    """Map a vendor id to its ten-digit business number (see ``business_numbers``)."""
+    return business_numbers([vendor_id])[vendor_id]
+
+
+def business_numbers(vendor_ids):
+    """Map vendor ids to ten-digit business numbers. Returns ``{vendor_id: business_number}``.
+
+    A keyed Feistel network permutes 0..10^10-1 and cycle walking keeps the
+    result among ten-digit numbers, so distinct ids never share a number and
+    consecutive ids do not get guessable consecutive numbers.
+    ``BUSINESS_NUMBER_KEY`` must therefore never change once vendors exist.
+
+    Vendors registered before this scheme hold random ten-digit numbers, so the
+    walk also steps over numbers another vendor holds. Numbers are never given
+    up, so an id's walk keeps ending on the same number.
+    """
+    key = current_app.config['BUSINESS_NUMBER_KEY'].encode()
+    pending = {}
+    for vendor_id in vendor_ids:
+        value = BUSINESS_NUMBER_MIN + vendor_id - 1
+        if not BUSINESS_NUMBER_MIN <= value < BUSINESS_NUMBER_HALF ** 2:
+            raise ValueError(f"No business number for vendor id {vendor_id}")
+        pending[vendor_id] = _walk(value, key)
+
+    numbers = {}
+    assigned = set()
+    while pending:
+        holders = _holders(pending.values())
+        for vendor_id, value in list(pending.items()):
+            if holders.get(value, vendor_id) != vendor_id or value in assigned:
+                pending[vendor_id] = _walk(value, key)
+                continue
+            numbers[vendor_id] = str(value)
+            assigned.add(value)
+            del pending[vendor_id]
+    return numbers
+
+
+def _walk(value, key):
+    """The next ten-digit number after ``value`` in the permutation's cycle."""
+    while True:
+        value = _permute(value, key)
+        if value >= BUSINESS_NUMBER_MIN:
+            return value
+
+
+def _holders(values, chunk_size=500):
+    """``{number: vendor_id}`` for those of ``values`` that are already registered."""
+    values = list(values)
+    holders = {}
+    for start in range(0, len(values), chunk_size):
+        rows = db.session.execute(
+            select(Vendor.business_number, Vendor.id)
+            .where(Vendor.business_number.in_([str(value) for value in values[start:start + chunk_size]]))
+        )
+        holders.update((int(number), vendor_id) for number, vendor_id in rows)
+    return holders
+
+
+def _permute(value, key):
+    left, right = divmod(value, BUSINESS_NUMBER_HALF)
+    for round_ in range(FEISTEL_ROUNDS):
+        digest = hmac.new(key, f'{round_}:{right}'.encode(), hashlib.sha256).digest()
+        left, right = right, (left + int.from_bytes(digest[:8], 'big')) % BUSINESS_NUMBER_HALF
+    return left * BUSINESS_NUMBER_HALF + right
+
+
+def find_conflict(email, phone_number):
+    """Return the error for an email or phone number that is already registered, or None."""
+    rows = db.session.execute(
+        select(Vendor.email, Vendor.phone_number)
+        .where(or_(Vendor.email == email, Vendor.phone_number == phone_number))
+        .limit(2)
+    ).all()
+    if any(row.email == email for row in rows):
+        return 'Email already registered'
+    if rows:
+        return 'Phone number already registered'
+    return None
+
+
+def import_vendors(rows, batch_size):
+    """Register vendors from CSV ``rows`` (dicts keyed by ``IMPORT_FIELDS``).
+
+    Rows are validated, checked against existing vendors with one query per
+    batch and inserted ``batch_size`` at a time. Yields an ``ImportResult`` per
+    row; rows that fail validation are reported as soon as they are read.
+    Raises ValueError if required columns are missing.
+    """
+    fieldnames = getattr(rows, 'fieldnames', None)
+    if fieldnames is not None:
+        missing = [field for field in REQUIRED_IMPORT_FIELDS if field not in fieldnames]
+        if missing:
+            raise ValueError(f"Missing column(s): {', '.join(missing)}")
+
+    seen_emails, seen_phones = set(), set()
+    batch = []
+    # Line 1 is the header
+    for line, row in enumerate(rows, start=2):
+        values = {field: (row.get(field) or '').strip() or None for field in IMPORT_FIELDS}
+        error = _validate(values)
+        if error is None and values['email'] in seen_emails:
+            error = 'Email appears earlier in the file'
+        elif error is None and values['phone_number'] in seen_phones:
+            error = 'Phone number appears earlier in the file'
+        if error:
+            yield ImportResult(line, values['email'], 'error', None, error)
+            continue
+        seen_emails.add(values['email'])
+        seen_phones.add(values['phone_number'])
+        batch.append((line, values))
+        if len(batch) >= batch_size:
+            yield from _import_batch(batch)
+            batch = []
+    if batch:
+        yield from _import_batch(batch)
+
+
+def _validate(values):
+    missing = [field for field in REQUIRED_IMPORT_FIELDS if not values[field]]
+    if missing:
+        return f"Missing {', '.join(missing)}"
+    for field, value in values.items():
+        column = Vendor.__table__.columns.get(field)
+        length = getattr(column.type, 'length', None) if column is not None else None
+        if value and length and len(value) > length:
+            return f"{field} is longer than {length} characters"
+    return None
+
+
+def _import_batch(batch):
+    taken = db.session.execute(
+        select(Vendor.email, Vendor.phone_number).where(or_(
+            Vendor.email.in_([values['email'] for _, values in batch]),
+            Vendor.phone_number.in_([values['phone_number'] for _, values in batch])
+        ))
+    ).all()
+    taken_emails = {row.email for row in taken}
+    taken_phones = {row.phone_number for row in taken}
+
+    errors = {}
+    fresh = []
+    for line, values in batch:
+        if values['email'] in taken_emails:
+            errors[line] = 'Email already registered'
+        elif values['phone_number'] in taken_phones:
+            errors[line] = 'Phone number already registered'
+        else:
+            fresh.append((line, values))
+
+    hashes = passwords.hash_many([values['password'] for _, values in fresh])
+    records = []
+    for (line, values), password_hash in zip(fresh, hashes):
+        record = {field: value for field, value in values.items() if field != 'password'}
+        record['password_hash'] = password_hash
+        records.append((line, record))
+
+    numbers = {}
+    try:
+        with db.session.begin_nested():
+            numbers.update(_insert([record for _, record in records]))
+    except IntegrityError:
+        # A concurrent registration took one of these; retry row by row to find it
+        for line, record in records:
+            try:
+                with db.session.begin_nested():
+                    numbers.update(_insert([record]))
+            except IntegrityError:
+                errors[line] = 'Email or phone number already registered'
+    db.session.commit()
+
+    for line, values in batch:
+        if line in errors:
+            yield ImportResult(line, values['email'], 'error', None, errors[line])
+        else:
+            yield ImportResult(line, values['email'], 'imported', numbers[values['email']], None)
+
+
+def _insert(records):
+    """Insert vendors, then give each its business number. Returns ``{email: business_number}``."""
+    if not records:
+        return {}
+    emails = [record['email'] for record in records]
+    db.session.execute(insert(Vendor), records)
+    ids = db.session.execute(
+        select(Vendor.id, Vendor.email).where(Vendor.email.in_(emails), Vendor.business_number.is_(None))
+    ).all()
+    numbers = [{'id': vendor_id, 'business_number': number}
+               for vendor_id, number in business_numbers([row.id for row in ids]).items()]
+    db.session.execute(update(Vendor), numbers)
+    by_id = {row.id: row.email for row in ids}
+    return {by_id[number['id']]: number['business_number'] for number in numbers}
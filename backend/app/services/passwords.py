@@ -0,0 +1,71 @@
+import itertools
+import threading
+import time
+from werkzeug.security import check_password_hash, generate_password_hash
+from app.services import metrics
+from app.services.background import ProcessPool
+
+
+class HashingBusy(Exception):
+    """Too many password operations are already waiting in this process."""
+
+
+class PasswordHasher(ProcessPool):
+    """Hashes and verifies passwords in worker processes.
+
+    Key derivation is CPU-bound and holds the GIL, so on the request thread it
+    stalls every other request in the worker. At most
+    ``PASSWORD_HASH_MAX_PENDING`` operations wait here at once; beyond that,
+    callers get ``HashingBusy`` rather than queueing behind a login storm.
+    """
+
+    extension_name = 'passwords'
+    workers_key = 'PASSWORD_HASH_WORKERS'
+
+    def __init__(self, app=None):
+        self._slots = None
+        self._prefix = None
+        super().__init__(app)
+
+    def init_app(self, app):
+        super().init_app(app)
+        self._slots = threading.BoundedSemaphore(app.config['PASSWORD_HASH_MAX_PENDING'])
+        self._prefix = None
+
+    @property
+    def method(self):
+        return self.app.config['PASSWORD_HASH_METHOD']
+
+    def hash(self, password):
+        return self._call('hash', generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._call('verify', check_password_hash, password_hash, password)
+
+    def hash_many(self, passwords):
+        """Hash a batch across the pool (for imports; not bounded by ``PASSWORD_HASH_MAX_PENDING``)."""
+        passwords = list(passwords)
+        chunksize = max(len(passwords) // (max(self.workers, 1) * 4), 1)
+        return list(self.map(generate_password_hash, passwords, itertools.repeat(self.method), chunksize=chunksize))
+
+    def needs_rehash(self, password_hash):
+        """Whether ``password_hash`` was made with other parameters than ``PASSWORD_HASH_METHOD``."""
+        if self._prefix is None:
+            # werkzeug fills in the defaults ("scrypt" becomes "scrypt:32768:8:1"); hash once to learn them
+            self._prefix = self.hash('').split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._prefix
+
+    def _call(self, operation, fn, *args):
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.app.config['PASSWORD_HASH_QUEUE_TIMEOUT']):
+            metrics.PASSWORD_HASH_SECONDS.labels(operation, 'busy').observe(time.perf_counter() - started)
+            raise HashingBusy()
+        try:
+            result = self.call(fn, *args)
+        finally:
+            self._slots.release()
+        metrics.PASSWORD_HASH_SECONDS.labels(operation, 'ok').observe(time.perf_counter() - started)
+        return result
+
+
+passwords = PasswordHasher()
@@ -0,0 +1,276 @@
+import functools
+import hashlib
+import hmac
+import io
+import itertools
+import json
+import re
+import threading
+import zipfile
+from base64 import b64encode
+from collections import OrderedDict, namedtuple
+from app.services import metrics
+from app.services.background import ProcessPool
+
+FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+# Smaller batches are rendered in-process; shipping them to the pool costs more than it saves
+POOL_MIN_ITEMS = 32
+
+QrCode = namedtuple('QrCode', ['business_name', 'business_number', 'amount', 'reference', 'payload'])
+
+
+# The mobile app derives the same key with crypto-js (PBKDF2, SHA-256, 1000 iterations)
+@functools.lru_cache(maxsize=None)
+def payload_key(passphrase):
+    return hashlib.pbkdf2_hmac('sha256', passphrase.encode(), b'salt', 1000, 32)
+
+
+def encrypt_payload(data, passphrase):
+    """Encrypt ``data`` as the app's scanner expects: ``<iv hex>:<base64 AES-256-CBC ciphertext>``.
+
+    The IV is an HMAC of the plaintext instead of random bytes, so the same
+    vendor, amount and reference always give the same code (and ETag).
+    """
+    from cryptography.hazmat.primitives import padding
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+    key = payload_key(passphrase)
+    plaintext = json.dumps(data, separators=(',', ':')).encode()
+    iv = hmac.new(key, plaintext, hashlib.sha256).digest()[:16]
+    padder = padding.PKCS7(128).padder()
+    padded = padder.update(plaintext) + padder.finalize()
+    encryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).encryptor()
+    ciphertext = encryptor.update(padded) + encryptor.finalize()
+    return f'{iv.hex()}:{b64encode(ciphertext).decode()}'
+
+
+def encode(payload, border, mask_pattern=None):
+    """Encode ``payload`` as a QR symbol. Returns ``(size, runs)``, one
+    ``(row, column, length)`` run per horizontal stretch of dark modules.
+
+    Without a ``mask_pattern`` all eight masks are scored and the best kept,
+    which is most of the encoding time.
+    """
+    try:
+        import qrcode
+    except ImportError as e:
+        raise ImportError("QR codes require qrcode: pip install qrcode") from e
+
+    symbol = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, border=border,
+                           mask_pattern=mask_pattern)
+    symbol.add_data(payload)
+    symbol.make(fit=True)
+    matrix = symbol.get_matrix()
+    runs = []
+    for y, row in enumerate(matrix):
+        x = 0
+        for dark, group in itertools.groupby(row):
+            length = sum(1 for _ in group)
+            if dark:
+                runs.append((y, x, length))
+            x += length
+    return len(matrix), runs
+
+
+def to_svg(size, runs, box_size):
+    path = ''.join(f'M{x} {y}h{n}v1h-{n}z' for y, x, n in runs)
+    pixels = size * box_size
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{pixels}" height="{pixels}" '
+        f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/><path d="{path}" fill="#000"/></svg>'
+    ).encode()
+
+
+def to_png(size, runs, box_size):
+    try:
+        from PIL import Image
+    except ImportError as e:
+        raise ImportError("PNG QR codes require Pillow: pip install pillow") from e
+
+    image = Image.new('1', (size, size), 1)
+    for y, x, n in runs:
+        image.paste(0, (x, y, x + n, y + 1))
+    image = image.resize((size * box_size, size * box_size), Image.NEAREST)
+    out = io.BytesIO()
+    image.save(out, 'PNG')
+    return out.getvalue()
+
+
+RENDERERS = {'png': to_png, 'svg': to_svg}
+
+
+def render_job(job):
+    """Pool entry point: ``(payload, fmt, box_size, border, mask_pattern)`` to image bytes,
+    or to ``(size, runs)`` for 'pdf'."""
+    payload, fmt, box_size, border, mask_pattern = job
+    size, runs = encode(payload, border, mask_pattern)
+    if fmt == 'pdf':
+        return size, runs
+    return RENDERERS[fmt](size, runs, box_size)
+
+
+class QrSheet:
+    """Lays QR codes out on letter pages as vector rectangles, with a caption under each."""
+
+    columns = 3
+    rows = 4
+    margin = 36
+    caption_height = 30
+
+    def __init__(self, fileobj):
+        from reportlab.lib.pagesizes import letter
+        from reportlab.pdfgen import canvas
+
+        self.canvas = canvas.Canvas(fileobj, pagesize=letter)
+        page_width, self.page_height = letter
+        self.cell_width = (page_width - 2 * self.margin) / self.columns
+        self.cell_height = (self.page_height - 2 * self.margin) / self.rows
+        self.count = 0
+
+    def add(self, size, runs, captions):
+        slot = self.count % (self.columns * self.rows)
+        if slot == 0 and self.count:
+            self.canvas.showPage()
+        left = self.margin + (slot % self.columns) * self.cell_width
+        top = self.page_height - self.margin - (slot // self.columns) * self.cell_height
+        side = min(self.cell_width, self.cell_height - self.caption_height)
+        module = side / size
+        x0 = left + (self.cell_width - side) / 2
+
+        path = self.canvas.beginPath()
+        for y, x, n in runs:
+            path.rect(x0 + x * module, top - (y + 1) * module, n * module, module)
+        self.canvas.drawPath(path, stroke=0, fill=1)
+        self.canvas.setFont('Helvetica', 9)
+        for i, caption in enumerate(captions):
+            self.canvas.drawCentredString(left + self.cell_width / 2, top - side - 10 - i * 11, caption)
+        self.count += 1
+
+    def close(self):
+        self.canvas.showPage()
+        self.canvas.save()
+
+
+class RenderCache:
+    """Rendered images keyed by content hash; least recently used entries are dropped first."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def set(self, key, body):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = body
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+class QrService(ProcessPool):
+    """Builds and renders vendor QR codes.
+
+    Single codes are cached by the hash of their content, which doubles as the
+    ETag. Batches are rendered in the process pool (``QR_RENDER_WORKERS``).
+    """
+
+    extension_name = 'qr'
+    workers_key = 'QR_RENDER_WORKERS'
+
+    def __init__(self, app=None):
+        self.cache = None
+        super().__init__(app)
+
+    def init_app(self, app):
+        super().init_app(app)
+        self.cache = RenderCache(app.config['QR_CACHE_SIZE'])
+
+    def code(self, business_name, business_number, amount=None, reference=None):
+        data = {'accountName': business_name, 'accountNumber': business_number}
+        if amount is not None:
+            data['amount'] = f'{amount:.2f}'
+        if reference:
+            data['reference'] = reference
+        payload = encrypt_payload(data, self.app.config['QR_PASSPHRASE'])
+        return QrCode(business_name, business_number, amount, reference, payload)
+
+    def etag(self, code, fmt):
+        config = self.app.config
+        content = f"{code.payload}|{fmt}|{config['QR_BOX_SIZE']}|{config['QR_BORDER']}|{config['QR_MASK_PATTERN']}"
+        return hashlib.sha256(content.encode()).hexdigest()[:32]
+
+    def render(self, code, fmt):
+        key = self.etag(code, fmt)
+        body = self.cache.get(key)
+        metrics.QR_RENDERS.labels(fmt, 'hit' if body is not None else 'miss').inc()
+        if body is None:
+            body = render_job(self._job(code, fmt))
+            self.cache.set(key, body)
+        return body
+
+    def render_many(self, codes, fmt):
+        """Render ``codes`` in order, as image bytes or, for 'pdf', as ``(size, runs)``."""
+        jobs = [self._job(code, fmt) for code in codes]
+        if len(jobs) < POOL_MIN_ITEMS:
+            return map(render_job, jobs)
+        return self.map(render_job, jobs, chunksize=max(len(jobs) // (max(self.workers, 1) * 4), 1))
+
+    def write_zip(self, codes, fileobj, fmt='png'):
+        """Write one image per code into a ZIP archive. Returns the number of codes."""
+        codes = list(codes)
+        compression = zipfile.ZIP_STORED if fmt == 'png' else zipfile.ZIP_DEFLATED
+        names = set()
+        with zipfile.ZipFile(fileobj, 'w', compression) as archive:
+            for code, body in zip(codes, self.render_many(codes, fmt)):
+                archive.writestr(unique_name(code, fmt, names), body)
+        return len(codes)
+
+    def write_pdf(self, codes, fileobj):
+        """Write the codes onto printable pages. Returns the number of codes."""
+        codes = list(codes)
+        sheet = QrSheet(fileobj)
+        for code, (size, runs) in zip(codes, self.render_many(codes, 'pdf')):
+            sheet.add(size, runs, captions(code))
+        sheet.close()
+        return len(codes)
+
+    def _job(self, code, fmt):
+        config = self.app.config
+        return code.payload, fmt, config['QR_BOX_SIZE'], config['QR_BORDER'], config['QR_MASK_PATTERN']
+
+
+def captions(code):
+    lines = [code.business_name or code.business_number]
+    details = [part for part in (code.reference, f'KES {code.amount:.2f}' if code.amount is not None else None)
+               if part]
+    lines.append(' - '.join(details) if details else code.business_number)
+    return lines
+
+
+def unique_name(code, ext, names):
+    parts = [code.business_number]
+    if code.reference:
+        parts.append(re.sub(r'[^A-Za-z0-9._]+', '-', code.reference).strip('-')[:40])
+    if code.amount is not None:
+        parts.append(f'{code.amount:.2f}')
+    base = '-'.join(part for part in parts if part)
+    name = f'{base}.{ext}'
+    counter = 1
+    while name in names:
+        counter += 1
+        name = f'{base}-{counter}.{ext}'
+    names.add(name)
+    return name
+
+
+qr = QrService()
@@ -0,0 +1,140 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db, mpesa
+from app.models.checkpoint import WorkerCheckpoint
+from app.models.transaction import Transaction
+from app.services.settlement import apply_stk_result
+from app.services.statements import requeue_stale_jobs
+from app.services.stk_dispatcher import expire_unknown, requeue_stale
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_NAME = 'stk-reconciliation'
+
+
+class RateLimiter:
+    """Spaces calls out so that at most ``qps`` start per second across all threads."""
+
+    def __init__(self, qps):
+        self.interval = 1.0 / qps if qps > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class Reconciler:
+    """Settles stale pending transactions whose callback never arrived.
+
+    Pending rows older than ``min_age`` seconds are read in id order, ``batch_size``
+    at a time, and queried on Daraja concurrently at no more than ``qps`` requests
+    per second. Results go through ``apply_stk_result``, the same transition the
+    callback uses. The last id handled is checkpointed in ``WorkerCheckpoint`` so a
+    restart resumes the pass; the checkpoint resets once the pass reaches the end.
+
+    Each batch first re-dispatches rows stuck in ``queued`` for longer than
+    ``RECONCILE_QUEUED_AGE`` seconds, whose dispatcher task died with its worker,
+    and fails ``unknown`` rows (push outcome lost) older than ``RECONCILE_UNKNOWN_AGE``.
+    Statement jobs left queued or running by a dead worker are submitted again too.
+    """
+
+    def __init__(self, batch_size=None, qps=None, concurrency=None, min_age=None):
+        config = current_app.config
+        self.batch_size = batch_size or config['RECONCILE_BATCH_SIZE']
+        self.concurrency = concurrency or config['RECONCILE_CONCURRENCY']
+        self.min_age = min_age if min_age is not None else config['RECONCILE_MIN_AGE']
+        self.queued_age = config['RECONCILE_QUEUED_AGE']
+        self.unknown_age = config['RECONCILE_UNKNOWN_AGE']
+        self.statement_ages = (config['STATEMENT_QUEUED_AGE'], config['STATEMENT_RUNNING_AGE'])
+        self.limiter = RateLimiter(qps or config['RECONCILE_QPS'])
+
+    def run_once(self):
+        """Reconcile one batch. Returns the number of transactions Daraja answered for.
+
+        The checkpoint only moves past rows whose query got an answer, so a
+        failed query (Daraja down, breaker open) is retried by the next batch.
+        """
+        requeued = requeue_stale(self.queued_age, self.batch_size)
+        if requeued:
+            logger.info("Re-dispatched %d stale queued transactions", requeued)
+        expired = expire_unknown(self.unknown_age, self.batch_size)
+        if expired:
+            logger.info("Failed %d transactions whose STK push outcome was lost", expired)
+        jobs = requeue_stale_jobs(*self.statement_ages, self.batch_size)
+        if jobs:
+            logger.info("Re-submitted %d stale statement jobs", jobs)
+
+        checkpoint = WorkerCheckpoint.load(CHECKPOINT_NAME)
+        cutoff = datetime.utcnow() - timedelta(seconds=self.min_age)
+        rows = db.session.query(Transaction.id, Transaction.mpesa_checkout_request_id).filter(
+            Transaction.status == 'pending',
+            Transaction.mpesa_checkout_request_id.isnot(None),
+            Transaction.date <= cutoff,
+            Transaction.id > checkpoint.position
+        ).order_by(Transaction.id).limit(self.batch_size).all()
+
+        if not rows:
+            checkpoint.position = 0
+            db.session.commit()
+            return 0
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            results = list(pool.map(self._query, [row.mpesa_checkout_request_id for row in rows]))
+
+        settled = 0
+        answered = 0
+        position = checkpoint.position
+        for row, result in zip(rows, results):
+            if result is None:
+                # The query itself failed; stop here so the next batch starts with this row
+                break
+            answered += 1
+            position = row.id
+            # Daraja answers with an errorCode instead of a ResultCode while the
+            # customer has not yet acted on the prompt; leave those pending.
+            if 'ResultCode' in result:
+                apply_stk_result(row.mpesa_checkout_request_id, result['ResultCode'])
+                settled += 1
+
+        checkpoint = WorkerCheckpoint.load(CHECKPOINT_NAME)
+        checkpoint.position = position
+        db.session.commit()
+        logger.info("Reconciled %d/%d pending transactions up to id %d", settled, len(rows), position)
+        return answered
+
+    def run(self, interval=None):
+        """Reconcile forever, sleeping ``interval`` seconds after each complete pass."""
+        interval = interval or current_app.config['RECONCILE_INTERVAL']
+        while True:
+            try:
+                answered = self.run_once()
+            except Exception:
+                db.session.rollback()
+                logger.exception("Reconciliation batch failed")
+                answered = 0
+            # Nothing left, or Daraja not answering: wait before the next batch
+            if not answered:
+                time.sleep(interval)
+
+    def _query(self, checkout_request_id):
+        try:
+            return mpesa.query(
+                business_shortcode=Config.MPESA_BUSINESS_SHORTCODE,
+                checkout_request_id=checkout_request_id,
+                passcode=Config.MPESA_PASSKEY,
+                throttle=self.limiter.acquire
+            )
+        except Exception as e:
+            logger.warning("STK query for %s failed: %s", checkout_request_id, e)
+            return None
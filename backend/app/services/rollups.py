@@ -0,0 +1,97 @@
+from datetime import datetime, time, timedelta
+from sqlalchemy import delete, func, insert, select
+from app import db
+from app.models.daily_rollup import DailyRollup
+from app.models.transaction import Transaction
+
+# Statuses a transaction never leaves, and so the only ones rolled up
+SETTLED_STATUSES = ('completed', 'failed')
+
+
+def record(vendor_id, date, type_, status, amount):
+    """Add one settled transaction to its day's rollup row, in the caller's transaction."""
+    values = {'vendor_id': vendor_id, 'day': date.date(), 'type': type_, 'status': status,
+              'count': 1, 'total': amount}
+    increments = {'count': DailyRollup.count + 1, 'total': DailyRollup.total + amount}
+    # Only the running dialect's insert construct is imported
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as upsert
+        stmt = upsert(DailyRollup).values(**values).on_duplicate_key_update(**increments)
+    else:
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        stmt = upsert(DailyRollup).values(**values).on_conflict_do_update(
+            index_elements=['vendor_id', 'day', 'type', 'status'], set_=increments
+        )
+    db.session.execute(stmt)
+
+
+def summarize(vendor_id, start_day, end_day):
+    """Count and total per (type, status) for whole days in ``[start_day, end_day]``."""
+    rows = db.session.query(
+        DailyRollup.type, DailyRollup.status,
+        func.sum(DailyRollup.count), func.sum(DailyRollup.total)
+    ).filter(
+        DailyRollup.vendor_id == vendor_id,
+        DailyRollup.day >= start_day,
+        DailyRollup.day <= end_day
+    ).group_by(DailyRollup.type, DailyRollup.status).all()
+    return {(type_, status): (int(count or 0), total or 0) for type_, status, count, total in rows}
+
+
+def statement_totals(vendor_id, start_date, end_date):
+    """Completed money in and out between two datetimes.
+
+    Whole days come from the rollups; only the partial days at either edge of
+    the window are aggregated from raw transactions.
+    """
+    first_day = start_date.date() if start_date.time() == time.min else start_date.date() + timedelta(days=1)
+    last_day = end_date.date() - timedelta(days=1)
+
+    totals = {'in': 0, 'out': 0}
+    if first_day <= last_day:
+        for (type_, status), (_, total) in summarize(vendor_id, first_day, last_day).items():
+            if status == 'completed' and type_ in totals:
+                totals[type_] += total
+        edges = [(start_date, datetime.combine(first_day, time.min), False),
+                 (datetime.combine(last_day + timedelta(days=1), time.min), end_date, True)]
+    else:
+        edges = [(start_date, end_date, True)]
+
+    for edge_start, edge_end, inclusive in edges:
+        rows = db.session.query(Transaction.type, func.sum(Transaction.amount)).filter(
+            Transaction.vendor_id == vendor_id,
+            Transaction.status == 'completed',
+            Transaction.date >= edge_start,
+            Transaction.date <= edge_end if inclusive else Transaction.date < edge_end
+        ).group_by(Transaction.type).all()
+        for type_, total in rows:
+            if type_ in totals:
+                totals[type_] += total or 0
+    return totals['in'], totals['out']
+
+
+def backfill(vendor_id=None):
+    """Rebuild rollup rows from the transaction table. Returns the number of rows written."""
+    day = func.date(Transaction.date)
+    source = select(
+        Transaction.vendor_id, day, Transaction.type, Transaction.status,
+        func.count(), func.sum(Transaction.amount)
+    ).where(Transaction.status.in_(SETTLED_STATUSES))
+    purge = delete(DailyRollup)
+    if vendor_id is not None:
+        source = source.where(Transaction.vendor_id == vendor_id)
+        purge = purge.where(DailyRollup.vendor_id == vendor_id)
+    source = source.group_by(Transaction.vendor_id, day, Transaction.type, Transaction.status)
+
+    db.session.execute(purge)
+    result = db.session.execute(
+        insert(DailyRollup).from_select(
+            ['vendor_id', 'day', 'type', 'status', 'count', 'total'], source
+        )
+    )
+    db.session.commit()
+    return result.rowcount
@@ -0,0 +1,102 @@
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import func, select, update
+from app import db
+from app.models.transaction import Transaction
+from app.models.vendor import Vendor
+from app.services import ledger, metrics, rollups
+from app.services.changes import next_change_seq
+from app.services.events import events
+
+Settlement = namedtuple('Settlement', ['transaction_id', 'vendor_id', 'status', 'applied'])
+
+
+def apply_stk_result(checkout_request_id, result_code, callback=None):
+    """Apply a Daraja STK result to its transaction.
+
+    Shared by the callback route and the reconciliation worker so both make the
+    same state transition. The transition is idempotent on the CheckoutRequestID:
+    the status moves with a conditional ``UPDATE ... WHERE status = 'pending'``, and
+    only the caller whose update matched credits the vendor, using an in-database
+    ``balance = balance + amount`` increment plus a ledger posting. Duplicate or
+    racing deliveries see ``applied=False``. Returns a ``Settlement``, or None if
+    the transaction is unknown.
+
+    Pass the ``stkCallback`` as ``callback`` to let an unmatched success claim a
+    push whose Daraja response was lost (see ``adopt_lost_push``).
+    """
+    row = _settlement_row(checkout_request_id)
+    if row is None and callback is not None and adopt_lost_push(checkout_request_id, callback):
+        row = _settlement_row(checkout_request_id)
+
+    if row is None:
+        return None
+
+    if row.status != 'pending':
+        return Settlement(row.id, row.vendor_id, row.status, False)
+
+    status = 'completed' if str(result_code) == '0' else 'failed'
+    result = db.session.execute(
+        update(Transaction)
+        .where(Transaction.id == row.id, Transaction.status == 'pending')
+        .values(status=status)
+    )
+    if result.rowcount != 1:
+        # Another delivery settled it between our read and our update
+        db.session.rollback()
+        current = db.session.scalar(select(Transaction.status).where(Transaction.id == row.id))
+        return Settlement(row.id, row.vendor_id, current, False)
+
+    if status == 'completed':
+        change_seq = next_change_seq(row.vendor_id, balance=func.coalesce(Vendor.balance, 0) + row.amount)
+    else:
+        change_seq = next_change_seq(row.vendor_id)
+    db.session.execute(
+        update(Transaction).where(Transaction.id == row.id).values(change_seq=change_seq)
+    )
+    if status == 'completed':
+        ledger.post(row.vendor_id, row.id, row.amount, ledger.COLLECTIONS)
+    rollups.record(row.vendor_id, row.date, row.type, status, row.amount)
+
+    db.session.commit()
+    metrics.PAYMENT_COMPLETION.labels(status).observe((datetime.utcnow() - row.date).total_seconds())
+    events.publish_transaction(row.id, row.vendor_id, status, request_id=row.request_id,
+                               checkout_request_id=checkout_request_id, change_seq=change_seq)
+    return Settlement(row.id, row.vendor_id, status, True)
+
+
+def adopt_lost_push(checkout_request_id, callback):
+    """Give ``checkout_request_id`` to the oldest ``unknown`` transaction matching the callback.
+
+    A push whose response timed out never learned its CheckoutRequestID. A
+    successful callback names the paying phone number and amount, which is
+    enough to claim it; the row moves to pending, uncommitted, for
+    ``apply_stk_result`` to settle. Returns True if a transaction was claimed.
+    """
+    items = {item.get('Name'): item.get('Value')
+             for item in callback.get('CallbackMetadata', {}).get('Item', [])}
+    if items.get('PhoneNumber') is None or items.get('Amount') is None:
+        return False
+    transaction_id = db.session.scalar(
+        select(Transaction.id)
+        .where(Transaction.status == 'unknown',
+               Transaction.phone_number == str(items['PhoneNumber']),
+               Transaction.amount == items['Amount'])
+        .order_by(Transaction.id)
+        .limit(1)
+    )
+    if transaction_id is None:
+        return False
+    result = db.session.execute(
+        update(Transaction)
+        .where(Transaction.id == transaction_id, Transaction.status == 'unknown')
+        .values(status='pending', mpesa_checkout_request_id=checkout_request_id)
+    )
+    return result.rowcount == 1
+
+
+def _settlement_row(checkout_request_id):
+    return db.session.query(
+        Transaction.id, Transaction.vendor_id, Transaction.amount, Transaction.status,
+        Transaction.request_id, Transaction.type, Transaction.date
+    ).filter_by(mpesa_checkout_request_id=checkout_request_id).first()
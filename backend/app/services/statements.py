@@ -0,0 +1,326 @@
+import functools
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_, select, update
+from app import db
+from app.models.statement_job import StatementJob
+from app.models.transaction import Transaction
+from app.models.vendor import Vendor
+from app.services import metrics, rollups
+from app.services.background import BackgroundPool
+
+logger = logging.getLogger(__name__)
+
+HEADER_ROW = ['Date', 'Type', 'Customer', 'Amount (KES)']
+
+
+# reportlab and smtplib are only imported by the code paths that use them, so
+# worker startup does not pay for them until the first statement export.
+@functools.lru_cache(maxsize=None)
+def table_style():
+    from reportlab.lib import colors
+    from reportlab.platypus import TableStyle
+
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2A2A2A')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#F5F5F5')),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ])
+
+
+class StatementPdf:
+    """Writes a statement page by page, so only one page of rows is held in memory."""
+
+    margin = 72  # one inch, in points
+    header_height = 27
+    row_height = 18
+
+    def __init__(self, path, vendor_business_name, duration, start_date, end_date, total_in, total_out):
+        from reportlab.lib.pagesizes import letter
+        from reportlab.lib.styles import getSampleStyleSheet
+        from reportlab.pdfgen import canvas
+        from reportlab.platypus import Paragraph, Spacer, Table
+
+        self.canvas = canvas.Canvas(path, pagesize=letter)
+        self.page_width, self.page_height = letter
+        self.width = self.page_width - 2 * self.margin
+        table_width = self.width * 0.9
+        self.col_widths = [table_width * 0.25, table_width * 0.25, table_width * 0.35, table_width * 0.15]
+        self.rows = []
+        self.row_count = 0
+        self._new_page()
+
+        styles = getSampleStyleSheet()
+        centered_style = styles['Normal'].clone('CenteredStyle')
+        centered_style.alignment = 1
+
+        self._draw(Paragraph('<b>SCAN2PAY STATEMENT</b>', styles['Title']))
+        self._draw(Spacer(1, 12))
+        self._draw(Paragraph(vendor_business_name, centered_style))
+        self._draw(Spacer(1, 12))
+        self._draw(Paragraph(f"{duration.capitalize()} Statement", centered_style))
+        self._draw(Spacer(1, 12))
+        self._draw(Paragraph(
+            f"From: {start_date.strftime('%Y-%m-%d')} To: {end_date.strftime('%Y-%m-%d')}", centered_style
+        ))
+        self._draw(Spacer(1, 24))
+
+        summary_table = Table([
+            ['Money In', f"KES {total_in:.2f}"],
+            ['Money Out', f"KES {total_out:.2f}"]
+        ], colWidths=[self.width * 0.4, self.width * 0.4])
+        summary_table.setStyle(table_style())
+        self._draw(summary_table)
+        self._draw(Spacer(1, 24))
+
+    def add(self, date, type_, customer, amount):
+        self.rows.append([date.strftime('%Y-%m-%d'), type_.capitalize(), customer, f"{amount:.2f}"])
+        self.row_count += 1
+        if len(self.rows) >= self._capacity():
+            self._flush_page()
+            self.canvas.showPage()
+            self._new_page()
+
+    def close(self):
+        if self.rows or self.row_count == 0:
+            self._flush_page()
+        # add() may have just broken the page; do not end the document with a blank one
+        if self.page_drawn:
+            self.canvas.showPage()
+        self.canvas.save()
+
+    def _capacity(self):
+        return max(int((self.y - self.margin - self.header_height) // self.row_height), 1)
+
+    def _flush_page(self):
+        from reportlab.platypus import Table
+
+        table = Table([HEADER_ROW] + self.rows, colWidths=self.col_widths)
+        table.setStyle(table_style())
+        self._draw(table)
+        self.rows = []
+
+    def _new_page(self):
+        self.y = self.page_height - self.margin
+        self.page_drawn = False
+
+    def _draw(self, flowable):
+        width, height = flowable.wrapOn(self.canvas, self.width, self.y - self.margin)
+        flowable.drawOn(self.canvas, self.margin + (self.width - width) / 2, self.y - height)
+        self.y -= height
+        self.page_drawn = True
+
+
+class SmtpPool:
+    """Keeps up to ``size`` logged-in SMTP connections alive between statements."""
+
+    def __init__(self, config, size):
+        self.config = config
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def send(self, message):
+        import smtplib
+
+        with self._slots:
+            conn = self._checkout()
+            try:
+                try:
+                    conn.send_message(message)
+                except smtplib.SMTPServerDisconnected:
+                    # Dropped since its last use; retry once on a fresh connection
+                    conn = self._connect()
+                    conn.send_message(message)
+            except Exception:
+                self._discard(conn)
+                raise
+            self._idle.put(conn)
+
+    def _checkout(self):
+        import smtplib
+
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+        try:
+            if conn.noop()[0] == 250:
+                return conn
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._discard(conn)
+        return self._connect()
+
+    def _connect(self):
+        import smtplib
+
+        conn = smtplib.SMTP(self.config['SMTP_SERVER'], self.config['SMTP_PORT'], timeout=30)
+        conn.starttls()
+        conn.login(self.config['SMTP_USERNAME'], self.config['SMTP_PASSWORD'])
+        return conn
+
+    @staticmethod
+    def _discard(conn):
+        import smtplib
+
+        try:
+            conn.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+
+
+class StatementWorker(BackgroundPool):
+    """Builds and emails statements for queued ``StatementJob`` rows."""
+
+    extension_name = 'statement_worker'
+    workers_key = 'STATEMENT_WORKERS'
+    thread_name_prefix = 'statement'
+
+    def __init__(self, app=None):
+        self.smtp = None
+        self._stats_lock = threading.Lock()
+        self.stats = {'sent': 0, 'failed': 0, 'duration_ms_total': 0}
+        super().__init__(app)
+
+    def init_app(self, app):
+        super().init_app(app)
+        self.smtp = SmtpPool(app.config, app.config['STATEMENT_SMTP_POOL_SIZE'])
+
+    def submit(self, job_id):
+        return super().submit(run_statement_job, job_id)
+
+    def record(self, status, duration_ms):
+        with self._stats_lock:
+            self.stats[status] += 1
+            self.stats['duration_ms_total'] += duration_ms
+        metrics.STATEMENT_JOBS.labels(status).observe(duration_ms / 1000)
+
+
+def build_statement(pdf_path, job, vendor_business_name, chunk_size):
+    """Stream the job's transactions into a PDF. Returns the number of rows written."""
+    total_in, total_out = rollups.statement_totals(job.vendor_id, job.start_date, job.end_date)
+    pdf = StatementPdf(pdf_path, vendor_business_name, job.duration, job.start_date, job.end_date,
+                       total_in, total_out)
+    rows = db.session.execute(
+        select(Transaction.date, Transaction.type, Transaction.customer, Transaction.amount)
+        .where(
+            Transaction.vendor_id == job.vendor_id,
+            Transaction.date >= job.start_date,
+            Transaction.date <= job.end_date
+        )
+        .order_by(Transaction.date.desc())
+        .execution_options(yield_per=chunk_size)
+    )
+    for row in rows:
+        pdf.add(row.date, row.type, row.customer, row.amount)
+    pdf.close()
+    return pdf.row_count
+
+
+def build_message(config, email, pdf_path):
+    from email import encoders
+    from email.mime.base import MIMEBase
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
+    msg = MIMEMultipart()
+    msg['From'] = config['FROM_EMAIL']
+    msg['To'] = email
+    msg['Subject'] = 'Your Transaction Statement'
+    msg.attach(MIMEText('Please find your transaction statement attached.', 'plain'))
+
+    with open(pdf_path, 'rb') as attachment:
+        part = MIMEBase('application', 'octet-stream')
+        part.set_payload(attachment.read())
+    encoders.encode_base64(part)
+    part.add_header('Content-Disposition', f'attachment; filename={os.path.basename(pdf_path)}')
+    msg.attach(part)
+    return msg
+
+
+def run_statement_job(job_id):
+    job = db.session.get(StatementJob, job_id)
+    if job is None or job.status != 'queued':
+        return
+
+    # The same job may be submitted by more than one process (see requeue_stale_jobs)
+    claimed = db.session.execute(
+        update(StatementJob)
+        .where(StatementJob.id == job_id, StatementJob.status == 'queued')
+        .values(status='running', started_at=datetime.utcnow())
+    )
+    if claimed.rowcount != 1:
+        db.session.rollback()
+        return
+    db.session.commit()
+
+    config = statement_worker.app.config
+    os.makedirs(config['UPLOAD_FOLDER'], exist_ok=True)
+    pdf_path = os.path.join(config['UPLOAD_FOLDER'], f'statement_{job.vendor_id}_{job.id}.pdf')
+    started = time.monotonic()
+    try:
+        vendor_business_name = db.session.scalar(
+            select(Vendor.business_name).where(Vendor.id == job.vendor_id)
+        )
+        row_count = build_statement(pdf_path, job, vendor_business_name, config['STATEMENT_CHUNK_SIZE'])
+        statement_worker.smtp.send(build_message(config, job.email, pdf_path))
+        job.row_count = row_count
+        job.status = 'sent'
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("Statement job %s failed", job_id)
+        job = db.session.get(StatementJob, job_id)
+        job.status = 'failed'
+        job.error = str(e)[:500]
+    finally:
+        if os.path.exists(pdf_path):
+            os.remove(pdf_path)
+
+    job.finished_at = datetime.utcnow()
+    job.duration_ms = int((time.monotonic() - started) * 1000)
+    db.session.commit()
+    statement_worker.record(job.status, job.duration_ms)
+
+
+def requeue_stale_jobs(queued_age, running_age, limit):
+    """Submit statement jobs whose worker died before finishing them, oldest first.
+
+    Jobs queued for longer than ``queued_age`` seconds lost their task with the
+    worker process; jobs running for longer than ``running_age`` seconds died
+    mid-export and are queued again. ``run_statement_job`` claims a job with a
+    conditional update, so a job also waiting in a live worker still runs once.
+    Returns the number of jobs submitted.
+    """
+    now = datetime.utcnow()
+    stuck_running = and_(StatementJob.status == 'running',
+                         StatementJob.started_at <= now - timedelta(seconds=running_age))
+    ids = db.session.scalars(
+        select(StatementJob.id)
+        .where(or_(
+            and_(StatementJob.status == 'queued',
+                 StatementJob.created_at <= now - timedelta(seconds=queued_age)),
+            stuck_running
+        ))
+        .order_by(StatementJob.created_at)
+        .limit(limit)
+    ).all()
+    if ids:
+        db.session.execute(
+            update(StatementJob).where(StatementJob.id.in_(ids), stuck_running).values(status='queued')
+        )
+    db.session.commit()
+    for job_id in ids:
+        logger.warning("Re-submitting statement job %s left unfinished", job_id)
+        statement_worker.submit(job_id)
+    return len(ids)
+
+
+statement_worker = StatementWorker()
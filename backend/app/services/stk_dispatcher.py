@@ -0,0 +1,166 @@
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import select, update
+from app import db, mpesa
+from app.models.transaction import Transaction
+from app.services import rollups
+from app.services.background import BackgroundPool
+from app.services.changes import next_change_seq
+from app.services.admission import admission
+from app.services.events import events
+from app.services.vendor_cache import vendor_cache
+from config.config import Config
+from config.http import may_have_been_sent
+
+logger = logging.getLogger(__name__)
+
+
+class StkDispatcher(BackgroundPool):
+    """Sends STK pushes for queued transactions on a background thread pool."""
+
+    extension_name = 'stk_dispatcher'
+    workers_key = 'STK_DISPATCH_WORKERS'
+    thread_name_prefix = 'stk-dispatch'
+    paced = False
+
+    def submit(self, transaction_id):
+        return super().submit(dispatch_stk_push, transaction_id, self.paced)
+
+
+class BulkStkDispatcher(StkDispatcher):
+    """Sends bulk pushes, paced by the shortcode bucket, on threads of their own.
+
+    Paced pushes spend most of their time waiting for shortcode tokens; on the
+    main dispatcher's threads they would hold up single /pay pushes.
+    """
+
+    extension_name = 'stk_bulk_dispatcher'
+    workers_key = 'STK_BULK_DISPATCH_WORKERS'
+    thread_name_prefix = 'stk-bulk'
+    paced = True
+
+
+def dispatch_stk_push(transaction_id, paced=False):
+    """Send the STK push for a queued transaction and move it to pending (or failed).
+
+    ``paced`` pushes were admitted without a shortcode token (bulk requests) and
+    wait here for one instead. A push whose response was lost after it may have
+    reached Daraja moves to ``unknown`` instead: it is neither sent again nor
+    counted as failed, and is settled by ``expire_unknown`` or by its callback.
+    """
+    transaction = db.session.get(Transaction, transaction_id)
+    if transaction is None or transaction.status != 'queued':
+        return
+    vendor = vendor_cache.by_id(transaction.vendor_id)
+    if vendor is None:
+        logger.warning("Vendor %s for transaction %s not found", transaction.vendor_id, transaction_id)
+        response = {}
+    else:
+        response = send_stk_push(transaction, vendor, paced)
+
+    if response is None:
+        values = {'status': 'unknown'}
+    elif response.get('ResponseCode') == '0':
+        values = {'status': 'pending', 'mpesa_checkout_request_id': response['CheckoutRequestID']}
+    else:
+        logger.warning("STK push for transaction %s rejected: %s", transaction_id, response)
+        values = {'status': 'failed'}
+    _transition(transaction, 'queued', values)
+
+
+def _transition(transaction, from_status, values):
+    """Move ``transaction`` out of ``from_status``, unless someone else already did. Returns True if moved."""
+    # Only the transition out of from_status is ours to make
+    result = db.session.execute(
+        update(Transaction)
+        .where(Transaction.id == transaction.id, Transaction.status == from_status)
+        .values(**values)
+    )
+    if result.rowcount != 1:
+        db.session.rollback()
+        return False
+
+    change_seq = next_change_seq(transaction.vendor_id)
+    db.session.execute(
+        update(Transaction).where(Transaction.id == transaction.id).values(change_seq=change_seq)
+    )
+    if values['status'] == 'failed':
+        rollups.record(transaction.vendor_id, transaction.date, transaction.type, 'failed', transaction.amount)
+    db.session.commit()
+    events.publish_transaction(transaction.id, transaction.vendor_id, values['status'],
+                               request_id=transaction.request_id,
+                               checkout_request_id=values.get('mpesa_checkout_request_id'),
+                               change_seq=change_seq)
+    return True
+
+
+def send_stk_push(transaction, vendor, paced=False):
+    """Ask Daraja for the push. Returns its response, {} if the request failed,
+    or None if it failed after it may have reached Daraja."""
+    if paced:
+        admission.wait_for_shortcode()
+    try:
+        return mpesa.stk_push(
+            business_shortcode=Config.MPESA_BUSINESS_SHORTCODE,
+            passcode=Config.MPESA_PASSKEY,
+            amount=int(transaction.amount),
+            callback_url=Config.MPESA_CALLBACK_URL,
+            reference_code=vendor.business_number,
+            phone_number=transaction.phone_number,
+            description=f"Payment to {vendor.business_name}"
+        )
+    except Exception as e:
+        if may_have_been_sent(e):
+            logger.error("STK push for transaction %s may have been sent, outcome unknown: %s",
+                         transaction.id, e)
+            return None
+        logger.error("STK push for transaction %s raised: %s", transaction.id, e)
+        return {}
+
+
+def requeue_stale(min_age, limit):
+    """Dispatch queued transactions older than ``min_age`` seconds, oldest first.
+
+    Their dispatcher task was lost with its worker (crash, timeout or
+    recycling). ``min_age`` must exceed the longest time a row can
+    legitimately wait in a live dispatcher, or the push may be sent twice.
+    Returns the number of transactions dispatched.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=min_age)
+    ids = db.session.scalars(
+        select(Transaction.id)
+        .where(Transaction.status == 'queued', Transaction.date <= cutoff)
+        .order_by(Transaction.id)
+        .limit(limit)
+    ).all()
+    db.session.rollback()
+    for transaction_id in ids:
+        logger.warning("Re-dispatching transaction %s left queued", transaction_id)
+        dispatch_stk_push(transaction_id, paced=True)
+    return len(ids)
+
+
+def expire_unknown(min_age, limit):
+    """Fail ``unknown`` transactions older than ``min_age`` seconds, oldest first.
+
+    Their push may have reached the customer, but no callback has claimed
+    them (see ``settlement.adopt_lost_push``) and the prompt has long
+    expired. Returns the number of transactions failed.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=min_age)
+    transactions = db.session.scalars(
+        select(Transaction)
+        .where(Transaction.status == 'unknown', Transaction.date <= cutoff)
+        .order_by(Transaction.id)
+        .limit(limit)
+    ).all()
+    db.session.rollback()
+    expired = 0
+    for transaction in transactions:
+        logger.warning("Failing transaction %s, its STK push outcome was never learned", transaction.id)
+        expired += _transition(transaction, 'unknown', {'status': 'failed'})
+    return expired
+
+
+dispatcher = StkDispatcher()
+bulk_dispatcher = BulkStkDispatcher()
@@ -0,0 +1,157 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, object_session
+from werkzeug.utils import import_string
+from app import db
+from app.models.vendor import Vendor
+from app.services import metrics
+
+# Only fields that practically never change; never balance or anything else mutable
+VendorIdentity = namedtuple('VendorIdentity', ['id', 'business_name', 'business_number'])
+IDENTITY_FIELDS = VendorIdentity._fields
+
+
+class MemoryBackend:
+    """Bounded LRU with a per-entry TTL, local to the worker process.
+
+    A shared backend (memcached, Redis, ...) implements the same ``get``,
+    ``set`` and ``delete`` methods and is selected with ``VENDOR_CACHE_BACKEND``.
+    """
+
+    def __init__(self, app):
+        self.maxsize = app.config['VENDOR_CACHE_SIZE']
+        self.ttl = app.config['VENDOR_CACHE_TTL']
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class VendorCache:
+    """Caches vendor identity by business number and by id for the /pay and /withdraw hot paths.
+
+    Entries are dropped after any committed ORM change to an identity field.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.backend = import_string(app.config['VENDOR_CACHE_BACKEND'])(app)
+        app.extensions['vendor_cache'] = self
+        if not event.contains(Vendor, 'after_update', _track_update):
+            event.listen(Vendor, 'after_update', _track_update)
+            event.listen(Vendor, 'after_delete', _track_delete)
+            # Load the old business number on assignment, even when the row was
+            # expired by a commit, so its stale entry can be dropped as well
+            event.listen(Vendor.business_number, 'set', _keep_history, active_history=True)
+            event.listen(Session, 'after_commit', _invalidate_committed)
+            event.listen(Session, 'after_rollback', _discard_tracked)
+
+    def by_business_number(self, business_number):
+        if not business_number:
+            return None
+        return self._lookup(f'bn:{business_number}', Vendor.business_number == business_number)
+
+    def by_id(self, vendor_id):
+        return self._lookup(f'id:{vendor_id}', Vendor.id == vendor_id)
+
+    def invalidate(self, vendor_id=None, business_number=None):
+        if vendor_id is not None:
+            self.backend.delete(f'id:{vendor_id}')
+        if business_number:
+            self.backend.delete(f'bn:{business_number}')
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def _lookup(self, key, criterion):
+        cached = self.backend.get(key)
+        if cached is not None:
+            self._count(hit=True)
+            return VendorIdentity(*cached)
+
+        self._count(hit=False)
+        row = db.session.execute(
+            select(Vendor.id, Vendor.business_name, Vendor.business_number).where(criterion)
+        ).first()
+        if row is None:
+            return None
+        identity = VendorIdentity(*row)
+        self.backend.set(f'id:{identity.id}', tuple(identity))
+        if identity.business_number:
+            self.backend.set(f'bn:{identity.business_number}', tuple(identity))
+        return identity
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        metrics.VENDOR_CACHE_LOOKUPS.labels('hit' if hit else 'miss').inc()
+
+
+def _keep_history(target, value, oldvalue, initiator):
+    pass
+
+
+def _track_update(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in IDENTITY_FIELDS):
+        _mark_dirty(target, state.attrs.business_number.history.deleted)
+
+
+def _track_delete(mapper, connection, target):
+    _mark_dirty(target)
+
+
+def _mark_dirty(target, old_business_numbers=()):
+    keys = {('id', target.id), ('bn', target.business_number)}
+    keys.update(('bn', value) for value in old_business_numbers)
+    object_session(target).info.setdefault('vendor_cache_dirty', set()).update(keys)
+
+
+def _invalidate_committed(session):
+    # Invalidate after commit, so a concurrent miss cannot re-cache the old row
+    for kind, value in session.info.pop('vendor_cache_dirty', ()):
+        if kind == 'id':
+            vendor_cache.invalidate(vendor_id=value)
+        else:
+            vendor_cache.invalidate(business_number=value)
+
+
+def _discard_tracked(session):
+    session.info.pop('vendor_cache_dirty', None)
+
+
+vendor_cache = VendorCache()
@@ -1,22 +1,102 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
-from flask import request, jsonify
+from flask import request, jsonify, current_app
 import jwt
+from app import db
 from app.models.vendor import Vendor
 from config.config import Config
 
+# Claims copied into the token at login, readable without touching the database
+VENDOR_CLAIMS = ('business_number', 'business_name')
+
+
+class VendorClaims:
+    """Vendor identity taken from a verified token.
+
+    Any attribute the token does not carry (balance, email, ...) loads the full
+    ``Vendor`` row on first access and is read from it from then on.
+    """
+
+    def __init__(self, claims):
+        self.id = claims['vendor_id']
+        for name in VENDOR_CLAIMS:
+            if name in claims:
+                setattr(self, name, claims[name])
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        vendor = self.__dict__.get('_vendor')
+        if vendor is None:
+            vendor = self._vendor = db.session.get(Vendor, self.id)
+        return getattr(vendor, name)
+
+
+class TokenCache:
+    """Verified token claims keyed by token hash, each kept until the token's ``exp``."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, token):
+        key = hashlib.sha256(token.encode()).digest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            claims, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return claims
+
+    def set(self, token, claims):
+        if 'exp' not in claims or self.maxsize <= 0:
+            return
+        key = hashlib.sha256(token.encode()).digest()
+        with self._lock:
+            self._entries[key] = (claims, claims['exp'])
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+token_cache = TokenCache(Config.AUTH_TOKEN_CACHE_SIZE)
+
+
+def decode_token(token):
+    data = token_cache.get(token)
+    if data is None:
+        data = jwt.decode(token, Config.SECRET_KEY, algorithms=["HS256"])
+        token_cache.set(token, data)
+    return data
+
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
         token = request.headers.get('Authorization')
         if not token:
             return jsonify({'error': 'Token is missing'}), 401
-        
+
         try:
             token = token.split(' ')[1]
-            data = jwt.decode(token, Config.SECRET_KEY, algorithms=["HS256"])
-            current_vendor = Vendor.query.get(data['vendor_id'])
-        except:
+            data = decode_token(token)
+            vendor_id = data['vendor_id']
+        except jwt.ExpiredSignatureError:
+            return jsonify({'error': 'Token has expired'}), 401
+        except (IndexError, KeyError, jwt.InvalidTokenError):
             return jsonify({'error': 'Invalid token'}), 401
-            
+
+        if current_app.config['AUTH_STATELESS_CLAIMS']:
+            current_vendor = VendorClaims(data)
+        else:
+            current_vendor = db.session.get(Vendor, vendor_id)
+
         return f(current_vendor, *args, **kwargs)
-    return decorated
\ No newline at end of file
+    return decorated
@@ -0,0 +1,12 @@
+from decimal import Decimal
+from flask.json.provider import DefaultJSONProvider
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Emits DECIMAL amounts and balances as JSON numbers, as the apps expect, rather than strings."""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Decimal):
+            return float(o)
+        return DefaultJSONProvider.default(o)
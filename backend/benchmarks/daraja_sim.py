@@ -0,0 +1,213 @@
+"""Local stand-in for the Daraja endpoints the backend calls.
+
+Implements OAuth (``/oauth/v1/generate``), STK push
+(``/mpesa/stkpush/v1/processrequest``) and STK query
+(``/mpesa/stkpushquery/v1/query``) with configurable latency and error rates,
+and posts the asynchronous STK result back to the callback URL after a delay,
+the way Safaricom does. ``GET /stats`` reports request counts and callback
+delivery latency for the load driver (see benchmarks/load.py).
+
+Run from the backend directory, then point the backend at it:
+
+    python -m benchmarks.daraja_sim --port 8081 --latency-ms 150 --error-rate 0.01
+    MPESA_SANDBOX_URL=http://127.0.0.1:8081 \\
+    MPESA_CALLBACK_URL=http://127.0.0.1:5000/mpesa/callback \\
+        gunicorn -c gunicorn.conf.py wsgi:app
+"""
+import argparse
+import random
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import requests
+from flask import Flask, jsonify, request
+
+# STK results the simulator can report; 1032 is "Request cancelled by user"
+SUCCESS = (0, 'The service request is processed successfully.')
+CANCELLED = (1032, 'Request cancelled by user')
+
+
+class Simulator:
+    def __init__(self, latency_ms=100, jitter_ms=50, error_rate=0.0, fail_rate=0.1,
+                 callback_delay_ms=1000, callback_drop_rate=0.0, callback_url=None, callback_workers=16):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.fail_rate = fail_rate
+        self.callback_delay_ms = callback_delay_ms
+        self.callback_drop_rate = callback_drop_rate
+        self.callback_url = callback_url
+        self.tokens = set()
+        self.results = {}
+        self.counts = {'oauth': 0, 'stkpush': 0, 'query': 0, 'errors': 0,
+                       'callbacks_sent': 0, 'callbacks_failed': 0, 'callbacks_dropped': 0}
+        self.callback_latencies = []
+        self._lock = threading.Lock()
+        self._callbacks = ThreadPoolExecutor(max_workers=callback_workers, thread_name_prefix='callback')
+        self._session = requests.Session()
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def delay(self):
+        seconds = max(random.gauss(self.latency_ms, self.jitter_ms), 0) / 1000
+        time.sleep(seconds)
+
+    def fails(self):
+        return random.random() < self.error_rate
+
+    def schedule_callback(self, checkout_request_id, merchant_request_id, amount, phone_number, callback_url):
+        code, desc = CANCELLED if random.random() < self.fail_rate else SUCCESS
+        with self._lock:
+            self.results[checkout_request_id] = (code, desc, False)
+        self._callbacks.submit(self._deliver, checkout_request_id, merchant_request_id, code, desc,
+                               amount, phone_number, self.callback_url or callback_url)
+
+    def _deliver(self, checkout_request_id, merchant_request_id, code, desc, amount, phone_number, url):
+        time.sleep(self.callback_delay_ms / 1000)
+        with self._lock:
+            self.results[checkout_request_id] = (code, desc, True)
+        if random.random() < self.callback_drop_rate:
+            # Leaves the transaction pending for `flask reconcile` to find
+            self.count('callbacks_dropped')
+            return
+        callback = {
+            'MerchantRequestID': merchant_request_id,
+            'CheckoutRequestID': checkout_request_id,
+            'ResultCode': code,
+            'ResultDesc': desc,
+        }
+        if code == 0:
+            callback['CallbackMetadata'] = {'Item': [
+                {'Name': 'Amount', 'Value': amount},
+                {'Name': 'MpesaReceiptNumber', 'Value': uuid.uuid4().hex[:10].upper()},
+                {'Name': 'TransactionDate', 'Value': int(datetime.now().strftime('%Y%m%d%H%M%S'))},
+                {'Name': 'PhoneNumber', 'Value': phone_number},
+            ]}
+        started = time.perf_counter()
+        try:
+            r = self._session.post(url, json={'Body': {'stkCallback': callback}}, timeout=30)
+            ok = r.status_code < 500
+        except requests.RequestException:
+            ok = False
+        with self._lock:
+            self.callback_latencies.append((time.perf_counter() - started) * 1000)
+            self.counts['callbacks_sent' if ok else 'callbacks_failed'] += 1
+
+    def reset(self):
+        with self._lock:
+            self.counts = dict.fromkeys(self.counts, 0)
+            self.callback_latencies = []
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self.callback_latencies)
+            counts = dict(self.counts)
+        if latencies:
+            counts['callback_p50_ms'] = round(statistics.median(latencies), 2)
+            counts['callback_p99_ms'] = round(latencies[max(int(len(latencies) * 0.99) - 1, 0)], 2)
+        return counts
+
+
+def create_sim_app(sim):
+    app = Flask(__name__)
+
+    def authorized():
+        header = request.headers.get('Authorization', '')
+        return header.startswith('Bearer ') and header[7:] in sim.tokens
+
+    def error(status, code, message):
+        sim.count('errors')
+        return jsonify({'requestId': uuid.uuid4().hex, 'errorCode': code, 'errorMessage': message}), status
+
+    @app.route('/oauth/v1/generate', methods=['GET'])
+    def oauth():
+        sim.count('oauth')
+        sim.delay()
+        token = uuid.uuid4().hex
+        sim.tokens.add(token)
+        return jsonify({'access_token': token, 'expires_in': '3599'})
+
+    @app.route('/mpesa/stkpush/v1/processrequest', methods=['POST'])
+    def stk_push():
+        sim.count('stkpush')
+        if not authorized():
+            return error(401, '404.001.03', 'Invalid Access Token')
+        sim.delay()
+        if sim.fails():
+            return error(503, '503.001.01', 'Service unavailable')
+        payload = request.get_json()
+        checkout_request_id = f"ws_CO_{datetime.now().strftime('%d%m%Y%H%M%S')}{uuid.uuid4().hex[:12]}"
+        merchant_request_id = uuid.uuid4().hex[:20]
+        sim.schedule_callback(checkout_request_id, merchant_request_id, payload.get('Amount'),
+                              payload.get('PhoneNumber'), payload.get('CallBackURL'))
+        return jsonify({
+            'MerchantRequestID': merchant_request_id,
+            'CheckoutRequestID': checkout_request_id,
+            'ResponseCode': '0',
+            'ResponseDescription': 'Success. Request accepted for processing',
+            'CustomerMessage': 'Success. Request accepted for processing'
+        })
+
+    @app.route('/mpesa/stkpushquery/v1/query', methods=['POST'])
+    def stk_query():
+        sim.count('query')
+        if not authorized():
+            return error(401, '404.001.03', 'Invalid Access Token')
+        sim.delay()
+        if sim.fails():
+            return error(503, '503.001.01', 'Service unavailable')
+        checkout_request_id = request.get_json().get('CheckoutRequestID')
+        result = sim.results.get(checkout_request_id)
+        if result is None:
+            return error(400, '400.002.02', 'Bad Request - Invalid CheckoutRequestID')
+        code, desc, settled = result
+        if not settled:
+            return error(500, '500.001.1001', 'The transaction is being processed')
+        return jsonify({
+            'ResponseCode': '0',
+            'ResponseDescription': 'The service request has been accepted successsfully',
+            'MerchantRequestID': uuid.uuid4().hex[:20],
+            'CheckoutRequestID': checkout_request_id,
+            'ResultCode': str(code),
+            'ResultDesc': desc
+        })
+
+    @app.route('/stats', methods=['GET'])
+    def stats():
+        return jsonify(sim.stats())
+
+    @app.route('/stats/reset', methods=['POST'])
+    def reset_stats():
+        sim.reset()
+        return jsonify(sim.stats())
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=100, help='Mean response latency.')
+    parser.add_argument('--jitter-ms', type=float, default=50, help='Standard deviation of the latency.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of calls answered with a 503.')
+    parser.add_argument('--fail-rate', type=float, default=0.1, help='Share of STK pushes the customer cancels.')
+    parser.add_argument('--callback-delay-ms', type=float, default=1000)
+    parser.add_argument('--callback-drop-rate', type=float, default=0.0,
+                        help='Share of callbacks never delivered.')
+    parser.add_argument('--callback-url', help='Deliver callbacks here instead of the CallBackURL sent.')
+    parser.add_argument('--callback-workers', type=int, default=16)
+    args = parser.parse_args()
+
+    sim = Simulator(args.latency_ms, args.jitter_ms, args.error_rate, args.fail_rate,
+                    args.callback_delay_ms, args.callback_drop_rate, args.callback_url, args.callback_workers)
+    create_sim_app(sim).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
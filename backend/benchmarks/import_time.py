@@ -0,0 +1,72 @@
+"""Import-time profile of worker startup, usable as a regression check.
+
+Runs ``python -X importtime`` on building the app in a fresh interpreter,
+prints the slowest imports by cumulative time and fails if startup exceeds the
+budget or pulls in a module that should only load on first use (reportlab,
+smtplib, the Daraja HTTP client, ...).
+
+Run from the backend directory:
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --budget-ms 500 --top 30
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+STARTUP = "from app import create_app; create_app()"
+
+# Heavy modules owned by code paths that import them on first use
+DEFERRED = ['reportlab', 'smtplib', 'email.mime', 'requests', 'httpx', 'config.mpesa', 'config.auth',
+            'qrcode', 'PIL']
+
+LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def profile(code=STARTUP):
+    """Return ``[(module, self_us, cumulative_us, depth)]`` for running ``code`` in a fresh interpreter."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(result.stderr)
+    rows = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget-ms', type=float, default=float(os.getenv('IMPORT_TIME_BUDGET_MS', 1000)))
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    # Leave out what the interpreter imports before running any code (site, encodings, ...)
+    baseline = {module for module, _, _, _ in profile('pass')}
+    rows = [row for row in profile() if row[0] not in baseline]
+    total_ms = sum(cumulative for _, _, cumulative, depth in rows if depth == 0) / 1000
+    print(f"{'module':50} {'self (ms)':>10} {'cumulative (ms)':>16}")
+    for module, self_us, cumulative_us, _ in sorted(rows, key=lambda r: r[2], reverse=True)[:args.top]:
+        print(f"{module:50} {self_us / 1000:>10.1f} {cumulative_us / 1000:>16.1f}")
+    print(f"Total import time: {total_ms:.0f} ms (budget {args.budget_ms:.0f} ms)")
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f"import time {total_ms:.0f} ms exceeds the {args.budget_ms:.0f} ms budget")
+    imported = {module for module, _, _, _ in rows}
+    for prefix in DEFERRED:
+        eager = sorted(m for m in imported if m == prefix or m.startswith(prefix + '.'))
+        if eager:
+            failures.append(f"{prefix} is imported at startup ({', '.join(eager[:3])})")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
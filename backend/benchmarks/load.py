@@ -0,0 +1,221 @@
+"""Load driver for the payment, callback, history and statement endpoints.
+
+Runs the selected scenarios side by side against a running backend for
+``--duration`` seconds, each with ``--concurrency`` closed-loop clients, and
+reports sustained requests per second with p50/p99 latency. Requests refused
+with a 429 are counted in their own column rather than as successes or errors:
+
+* pay: ``POST /pay``, then ``GET /pay/<request_id>?wait=`` until it settles
+  (reported separately as pay->settled).
+* history: ``GET /transactions``.
+* statement: ``POST /export-statement``, then polling its job until it is done.
+* callback: ``POST /mpesa/callback`` as timed by the Daraja simulator while it
+  delivers the results of the pay scenario (needs ``--sim-url``).
+
+Pair it with the simulator for a reproducible baseline on one machine. The
+admission limits on /pay (``RATE_LIMIT_*``) are sized for real traffic and
+would refuse most of the load, so turn them off unless they are what is being
+measured, and let every client long-poll at once:
+
+    python -m benchmarks.daraja_sim --port 8081 &
+    MPESA_SANDBOX_URL=http://127.0.0.1:8081 MPESA_CALLBACK_URL=http://127.0.0.1:5000/mpesa/callback \\
+    RATE_LIMIT_ENABLED=false EVENTS_MAX_SUBSCRIPTIONS=0 \\
+        gunicorn -c gunicorn.conf.py wsgi:app &
+    python -m benchmarks.load --sim-url http://127.0.0.1:8081 --duration 60 --concurrency 16
+"""
+import argparse
+import random
+import statistics
+import threading
+import time
+import uuid
+import requests
+
+SCENARIOS = ('pay', 'history', 'statement')
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.limited = {}
+
+    def record(self, name, started, ok=True, limited=False):
+        """Record one request; ``limited`` ones (429) are counted apart from successes and errors."""
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.latencies.setdefault(name, [])
+            self.errors.setdefault(name, 0)
+            self.limited.setdefault(name, 0)
+            if limited:
+                self.limited[name] += 1
+            elif ok:
+                self.latencies[name].append(elapsed)
+            else:
+                self.errors[name] += 1
+
+    def report(self, duration):
+        rows = []
+        for name in sorted(self.latencies):
+            latencies = sorted(self.latencies[name])
+            if latencies:
+                p50 = statistics.median(latencies)
+                p99 = latencies[max(int(len(latencies) * 0.99) - 1, 0)]
+            else:
+                p50 = p99 = float('nan')
+            rows.append((name, len(latencies), self.errors[name], self.limited[name],
+                         len(latencies) / duration, p50, p99))
+        return rows
+
+
+def register_vendor(base_url):
+    suffix = uuid.uuid4().hex[:8]
+    credentials = {'email': f'load-{suffix}@example.com', 'password': uuid.uuid4().hex}
+    r = requests.post(f'{base_url}/vendor/register', json={
+        **credentials,
+        'business_name': f'Load test {suffix}',
+        'phone_number': f'07{random.randint(0, 99999999):08d}',
+        'business_type': 'retail',
+        'id_number': suffix,
+        'full_name': 'Load Test'
+    }, timeout=30)
+    r.raise_for_status()
+    return credentials
+
+
+def login(base_url, email, password):
+    r = requests.post(f'{base_url}/vendor/login', json={'email': email, 'password': password}, timeout=30)
+    r.raise_for_status()
+    data = r.json()
+    return data['token'], data['vendor']['business_number']
+
+
+def pay_client(session, base_url, business_number, recorder, settle_timeout):
+    started = time.perf_counter()
+    try:
+        r = session.post(f'{base_url}/pay', json={
+            'amount': random.randint(1, 500),
+            'phone_number': f'2547{random.randint(0, 99999999):08d}',
+            'account_number': business_number,
+            'customer': 'Load test'
+        }, timeout=30)
+    except requests.RequestException:
+        recorder.record('pay', started, ok=False)
+        return
+    recorder.record('pay', started, ok=r.status_code == 202, limited=r.status_code == 429)
+    if r.status_code != 202:
+        return
+
+    request_id = r.json()['request_id']
+    deadline = time.monotonic() + settle_timeout
+    while time.monotonic() < deadline:
+        try:
+            r = session.get(f'{base_url}/pay/{request_id}', params={'wait': 30}, timeout=40)
+            if r.status_code == 503:
+                # Every long-poll slot in that worker is taken; ask again shortly
+                time.sleep(0.5)
+                continue
+            status = r.json()['status']
+        except (requests.RequestException, ValueError, KeyError):
+            break
+        if status not in ('queued', 'pending'):
+            recorder.record('pay->settled', started)
+            return
+    recorder.record('pay->settled', started, ok=False)
+
+
+def history_client(session, base_url, headers, recorder):
+    started = time.perf_counter()
+    try:
+        r = session.get(f'{base_url}/transactions', params={'limit': 50}, headers=headers, timeout=30)
+        recorder.record('history', started, ok=r.status_code == 200)
+    except requests.RequestException:
+        recorder.record('history', started, ok=False)
+
+
+def statement_client(session, base_url, headers, recorder, email):
+    started = time.perf_counter()
+    try:
+        r = session.post(f'{base_url}/export-statement', json={'email': email, 'duration': '3 months'},
+                         headers=headers, timeout=30)
+    except requests.RequestException:
+        recorder.record('statement', started, ok=False)
+        return
+    recorder.record('statement', started, ok=r.status_code == 202)
+    if r.status_code != 202:
+        return
+
+    job_url = f"{base_url}/export-statement/{r.json()['job_id']}"
+    while True:
+        time.sleep(0.2)
+        try:
+            status = session.get(job_url, headers=headers, timeout=30).json()['status']
+        except (requests.RequestException, ValueError, KeyError):
+            recorder.record('statement->done', started, ok=False)
+            return
+        if status not in ('queued', 'running'):
+            # Without SMTP configured the job ends 'failed' after building the PDF
+            recorder.record('statement->done', started, ok=status == 'sent')
+            return
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--sim-url', help='Daraja simulator, for callback latency.')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=8, help='Clients per scenario.')
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--settle-timeout', type=float, default=60)
+    parser.add_argument('--email', help='Existing vendor to log in as; a new one is registered otherwise.')
+    parser.add_argument('--password')
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    credentials = ({'email': args.email, 'password': args.password} if args.email
+                   else register_vendor(args.base_url))
+    token, business_number = login(args.base_url, credentials['email'], credentials['password'])
+    headers = {'Authorization': f'Bearer {token}'}
+    if args.sim_url:
+        requests.post(f'{args.sim_url}/stats/reset', timeout=10).raise_for_status()
+
+    recorder = Recorder()
+    stop_at = time.monotonic() + args.duration
+
+    def client(scenario):
+        session = requests.Session()
+        while time.monotonic() < stop_at:
+            if scenario == 'pay':
+                pay_client(session, args.base_url, business_number, recorder, args.settle_timeout)
+            elif scenario == 'history':
+                history_client(session, args.base_url, headers, recorder)
+            else:
+                statement_client(session, args.base_url, headers, recorder, credentials['email'])
+
+    threads = [threading.Thread(target=client, args=(scenario,), daemon=True)
+               for scenario in scenarios for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Rates are over the load window; requests in flight at its end still count
+    elapsed = args.duration
+
+    print(f"{'endpoint':18} {'ok':>8} {'errors':>7} {'429s':>7} {'rps':>8} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    for name, ok, errors, limited, rps, p50, p99 in recorder.report(elapsed):
+        print(f"{name:18} {ok:>8} {errors:>7} {limited:>7} {rps:>8.1f} {p50:>10.1f} {p99:>10.1f}")
+
+    if args.sim_url:
+        sim = requests.get(f'{args.sim_url}/stats', timeout=10).json()
+        print(f"{'callback':18} {sim['callbacks_sent']:>8} {sim['callbacks_failed']:>7} {'-':>7} "
+              f"{sim['callbacks_sent'] / elapsed:>8.1f} {sim.get('callback_p50_ms', float('nan')):>10.1f} "
+              f"{sim.get('callback_p99_ms', float('nan')):>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
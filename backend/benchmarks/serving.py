@@ -0,0 +1,104 @@
+"""Measure cold start and steady-state throughput of the gunicorn serving profile.
+
+Starts ``gunicorn -c gunicorn.conf.py wsgi:app`` with the given worker and
+thread counts, times how long it takes to answer its first request, then keeps
+``--concurrency`` clients busy for ``--duration`` seconds and reports requests
+per second and latency percentiles. The default path is answered without a
+database round trip (an unauthenticated request), so it measures the serving
+stack itself; point ``--path`` at a real route to include the database.
+
+Run from the backend directory:
+
+    python -m benchmarks.serving --workers 4 --threads 8
+    python -m benchmarks.serving --no-preload
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import requests
+
+
+def wait_until_serving(url, deadline):
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return True
+        except requests.ConnectionError:
+            time.sleep(0.02)
+    return False
+
+
+def drive(url, concurrency, duration):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client():
+        session = requests.Session()
+        local = []
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                session.get(url, timeout=10)
+            except requests.RequestException:
+                with lock:
+                    errors[0] += 1
+                continue
+            local.append((time.perf_counter() - started) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    return latencies, errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--no-preload', action='store_true')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--path', default='/transactions')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+
+    env = dict(os.environ,
+               GUNICORN_BIND=f'127.0.0.1:{args.port}',
+               GUNICORN_WORKERS=str(args.workers),
+               GUNICORN_THREADS=str(args.threads),
+               GUNICORN_PRELOAD='false' if args.no_preload else 'true',
+               GUNICORN_ACCESS_LOG='/dev/null')
+    url = f'http://127.0.0.1:{args.port}{args.path}'
+
+    started = time.monotonic()
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'], env=env)
+    try:
+        if not wait_until_serving(url, started + 60):
+            sys.exit("Server did not start within 60s")
+        cold_start = time.monotonic() - started
+        latencies, errors = drive(url, args.concurrency, args.duration)
+    finally:
+        server.terminate()
+        server.wait(30)
+
+    print(f"workers={args.workers} threads={args.threads} preload={not args.no_preload}")
+    print(f"cold start (spawn to first response): {cold_start:.2f}s")
+    if latencies:
+        print(f"requests: {len(latencies)} ({len(latencies) / args.duration:.0f}/s), errors: {errors}")
+        print(f"latency p50/p99 (ms): {statistics.median(latencies):.2f} / "
+              f"{latencies[int(len(latencies) * 0.99) - 1]:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""Measure callback and history query latency before and after the Transaction indexes.
+
+Seeds a throwaway database with vendors and transactions, times the queries the
+callback, /transactions and /export-statement routes run with the new indexes
+dropped, then creates the indexes and times them again. Every table in the
+database is dropped first, so a database that already has tables is refused
+unless ``--force`` is given.
+
+Run from the backend directory:
+
+    python -m benchmarks.transaction_indexes --rows 2000000
+    python -m benchmarks.transaction_indexes --database-url mysql+pymysql://user:pw@localhost/bench
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import insert, inspect, select, text
+from app import create_app, db
+from app.models.transaction import Transaction
+from app.models.vendor import Vendor
+
+INDEXES = ['ix_transaction_vendor_date', 'ix_transaction_status_id',
+           'ix_transaction_mpesa_checkout_request_id']
+
+
+def seed(rows, vendors, chunk=20000):
+    db.session.execute(insert(Vendor), [{
+        'business_name': f'Vendor {i}',
+        'email': f'vendor{i}@example.com',
+        'password_hash': 'x',
+        'phone_number': f'0700{i:07d}',
+        'business_number': f'{1000000000 + i}',
+        'full_name': f'Owner {i}',
+        'id_number': str(i),
+        'balance': 0.0
+    } for i in range(vendors)])
+    db.session.commit()
+
+    now = datetime.utcnow()
+    for start in range(0, rows, chunk):
+        db.session.execute(insert(Transaction), [{
+            # A few busy vendors hold most of the history
+            'vendor_id': min(int(random.paretovariate(1.2)), vendors),
+            'type': 'in' if n % 10 else 'out',
+            'amount': float(random.randint(10, 5000)),
+            'date': now - timedelta(seconds=random.randint(0, 2 * 365 * 86400)),
+            'customer': 'Customer',
+            'status': 'pending' if n % 50 == 0 else 'completed',
+            'mpesa_checkout_request_id': f'ws_CO_{n:012d}'
+        } for n in range(start, min(start + chunk, rows))])
+        db.session.commit()
+
+
+def timed(fn, samples):
+    latencies = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+
+def measure(rows, samples):
+    busiest = 1
+    year_ago = datetime.utcnow() - timedelta(days=365)
+
+    def callback_lookup():
+        checkout_id = f'ws_CO_{random.randrange(rows):012d}'
+        db.session.execute(
+            select(Transaction.id).where(Transaction.mpesa_checkout_request_id == checkout_id)
+        ).first()
+
+    def history_page():
+        db.session.execute(
+            select(Transaction.id, Transaction.date, Transaction.amount)
+            .where(Transaction.vendor_id == busiest)
+            .order_by(Transaction.date.desc(), Transaction.id.desc())
+            .limit(50)
+        ).all()
+
+    def statement_range():
+        db.session.execute(
+            select(Transaction.id, Transaction.amount)
+            .where(Transaction.vendor_id == random.randint(2, 50), Transaction.date >= year_ago)
+        ).all()
+
+    return {
+        'callback lookup': timed(callback_lookup, samples),
+        'history page (busiest vendor)': timed(history_page, samples),
+        'statement range (1 year)': timed(statement_range, samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default='sqlite:///bench_transactions.sqlite3')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--vendors', type=int, default=5000)
+    parser.add_argument('--samples', type=int, default=200)
+    parser.add_argument('--force', action='store_true',
+                        help='Drop and re-create the tables even if the database already has some.')
+    args = parser.parse_args()
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': args.database_url})
+    with app.app_context():
+        tables = inspect(db.engine).get_table_names()
+        if tables and not args.force:
+            parser.error(f"{db.engine.url.render_as_string(hide_password=True)} already has tables ({', '.join(sorted(tables)[:5])}"
+                         f"{', ...' if len(tables) > 5 else ''}); they would all be dropped. "
+                         "Point --database-url at a scratch database, or pass --force.")
+        db.drop_all()
+        db.create_all()
+        for name in INDEXES:
+            db.session.execute(text(f'DROP INDEX {name}' if db.engine.name != 'mysql'
+                                    else f'DROP INDEX {name} ON `transaction`'))
+        db.session.commit()
+
+        started = time.perf_counter()
+        seed(args.rows, args.vendors)
+        print(f"Seeded {args.rows} transactions in {time.perf_counter() - started:.1f}s")
+
+        before = measure(args.rows, args.samples)
+        for index in Transaction.__table__.indexes:
+            if index.name in INDEXES:
+                index.create(db.engine)
+        after = measure(args.rows, args.samples)
+
+    print(f"{'query':32} {'before p50/p99 (ms)':>22} {'after p50/p99 (ms)':>22}")
+    for name in before:
+        b50, b99 = before[name]
+        a50, a99 = after[name]
+        print(f"{name:32} {b50:>10.2f} / {b99:<9.2f} {a50:>10.2f} / {a99:<9.2f}")
+
+
+if __name__ == '__main__':
+    main()
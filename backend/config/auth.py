@@ -1,20 +1,160 @@
 import os
+import logging
+import threading
+import time
 import requests
 from dotenv import load_dotenv
 from requests.auth import HTTPBasicAuth
+from config.http import CircuitBreaker, CircuitOpenError, backoff_delay, create_session
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+class AccessTokenCache:
+    """Thread-safe cache for the Daraja OAuth access token.
+
+    The token is refreshed in the background once it enters the refresh window
+    (``refresh_margin`` seconds before ``expires_in`` runs out), so callers keep
+    using the current token instead of waiting on OAuth. Concurrent refreshes are
+    collapsed into a single in-flight request; other callers wait for its result.
+    """
+
+    def __init__(self, fetch, refresh_margin=300):
+        self._fetch = fetch
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._refreshed = threading.Condition(self._lock)
+        self._token = None
+        self._expires_at = 0.0
+        self._refreshing = False
+        self._error = None
+
+    def get(self):
+        """Return a valid token, fetching one only if none is usable."""
+        token = self._current()
+        if token is not None:
+            return token
+        return self.refresh()
+
+    def refresh(self):
+        """Fetch a new token, or wait for the refresh already in flight."""
+        with self._lock:
+            if self._refreshing:
+                while self._refreshing:
+                    self._refreshed.wait()
+                if self._error is not None:
+                    raise self._error
+                return self._token
+            self._refreshing = True
+        return self._do_refresh()
+
+    def invalidate(self, token):
+        """Drop ``token`` after Daraja rejected it, unless it was already replaced."""
+        with self._lock:
+            if self._token == token:
+                self._token = None
+                self._expires_at = 0.0
+
+    def _current(self):
+        """The cached token while it is valid, starting a background refresh once it is due; else None."""
+        with self._lock:
+            now = time.monotonic()
+            if not self._token or now >= self._expires_at:
+                return None
+            if now >= self._expires_at - self.refresh_margin and not self._refreshing:
+                self._refreshing = True
+                self._start_background_refresh()
+            return self._token
+
+    def _start_background_refresh(self):
+        threading.Thread(target=self._refresh_in_background, daemon=True).start()
+
+    def _refresh_in_background(self):
+        try:
+            self._do_refresh()
+        except Exception as e:
+            logger.warning("Background Mpesa token refresh failed: %s", e)
+
+    def _do_refresh(self):
+        try:
+            token, expires_in = self._fetch()
+        except Exception as e:
+            self._failed(e)
+            raise
+        self._stored(token, expires_in)
+        return token
+
+    def _stored(self, token, expires_in):
+        with self._lock:
+            self._token = token
+            self._expires_at = time.monotonic() + expires_in
+            self._refreshing = False
+            self._error = None
+            self._refreshed.notify_all()
+
+    def _failed(self, error):
+        with self._lock:
+            self._refreshing = False
+            self._error = error
+            self._refreshed.notify_all()
+
+
+def is_business_error(response):
+    """Whether a Daraja 500 is an answer about the request (it names an ``errorCode``) rather than a fault.
+
+    502/503/504 are left to the retry policy even when they carry an ``errorCode``.
+    """
+    if response.status_code != 500:
+        return False
+    try:
+        return 'errorCode' in response.json()
+    except ValueError:
+        return False
+
+
 class MpesaBase:
     def __init__(self, env=None, app_key=None, app_secret=None,
                  sandbox_url="https://sandbox.safaricom.co.ke",
-                 live_url="https://api.safaricom.co.ke"):
-        self.env = env or os.getenv("ENV", "sandbox") 
+                 live_url="https://api.safaricom.co.ke", observer=None, transport=True):
+        """Read the Daraja settings. With ``transport=False`` no session, circuit breaker or
+        token cache is built, for clients that hand every call to another one."""
+        self.env = env or os.getenv("ENV", "sandbox")
         self.app_key = app_key or os.getenv("APP_KEY")
         self.app_secret = app_secret or os.getenv("APP_SECRET")
         self.sandbox_url = sandbox_url or os.getenv("SANDBOX_URL")
         self.live_url = live_url or os.getenv("LIVE_URL")
-        self.token = None
+        self.timeout = (
+            float(os.getenv("MPESA_CONNECT_TIMEOUT", 3.05)),
+            float(os.getenv("MPESA_READ_TIMEOUT", 15))
+        )
+        self.max_retries = int(os.getenv("MPESA_MAX_RETRIES", 2))
+        self.retry_backoff = float(os.getenv("MPESA_RETRY_BACKOFF", 0.5))
+        self.pool_size = int(os.getenv("MPESA_POOL_SIZE", 10))
+        self.refresh_margin = int(os.getenv("MPESA_TOKEN_REFRESH_MARGIN", 300))
+        # Called as observer(method, url, seconds, outcome) after every attempt, where
+        # outcome is the HTTP status code or the name of the exception raised
+        self.observer = observer
+        self.session = self.breaker = self.tokens = None
+        if transport:
+            self._init_transport()
+
+    def _init_transport(self):
+        self.session = create_session(self.pool_size)
+        self.breaker = self._create_breaker()
+        self.tokens = AccessTokenCache(self._fetch_token, refresh_margin=self.refresh_margin)
+
+    @staticmethod
+    def _create_breaker():
+        return CircuitBreaker(
+            threshold=int(os.getenv("MPESA_BREAKER_THRESHOLD", 5)),
+            cooldown=float(os.getenv("MPESA_BREAKER_COOLDOWN", 30))
+        )
+
+    @property
+    def token(self):
+        return self.tokens.get()
 
     def authenticate(self):
         """To make Mpesa API calls, you will need to authenticate your app. This method is used to fetch the access token
@@ -22,6 +162,9 @@ class MpesaBase:
         you will need a Basic Auth over HTTPS authorization token. The Basic Auth string is a base64 encoded string
         of your app's client key and client secret.
 
+        The token is stored in ``self.tokens`` together with its expiry, so API calls reuse it until it is due
+        for a refresh. Calling this method forces a refresh.
+
             **Args:**
                 - env (str): Current app environment. Options: sandbox, live.
                 - app_key (str): The app key obtained from the developer portal.
@@ -33,13 +176,101 @@ class MpesaBase:
                 - access_token (str): This token is to be used with the Bearer header for further API calls to Mpesa.
 
             """
+        return self.tokens.refresh()
+
+    def base_url(self):
         if self.env == "production":
-            base_safaricom_url = self.live_url
-        else:
-            base_safaricom_url = self.sandbox_url
-        authenticate_uri = "/oauth/v1/generate?grant_type=client_credentials"
-        authenticate_url = f"{base_safaricom_url}{authenticate_uri}"
-        r = requests.get(authenticate_url,
-                         auth=HTTPBasicAuth(str(self.app_key), str(self.app_secret)))
-        self.token = r.json()['access_token']
-        return r.json()['access_token']
\ No newline at end of file
+            return self.live_url
+        return self.sandbox_url
+
+    def _fetch_token(self):
+        r = self._send("GET", self._token_url(), idempotent=True,
+                       auth=HTTPBasicAuth(str(self.app_key), str(self.app_secret)))
+        return self._parse_token(r)
+
+    def _token_url(self):
+        return f"{self.base_url()}/oauth/v1/generate?grant_type=client_credentials"
+
+    @staticmethod
+    def _parse_token(r):
+        """``(access_token, expires_in)`` from an OAuth response; raises on an error status."""
+        r.raise_for_status()
+        data = r.json()
+        return data['access_token'], int(data.get('expires_in', 3599))
+
+    def _post(self, path, payload, idempotent=False, business_errors=False, throttle=None):
+        """POST ``payload`` to a Daraja endpoint, retrying once with a fresh token on a 401."""
+        url = f"{self.base_url()}{path}"
+        token = self.tokens.get()
+        r = self._send("POST", url, idempotent, business_errors, throttle,
+                       headers=self._headers(token), json=payload)
+        if r.status_code == 401:
+            self.tokens.invalidate(token)
+            token = self.tokens.get()
+            r = self._send("POST", url, idempotent, business_errors, throttle,
+                           headers=self._headers(token), json=payload)
+        return r.json()
+
+    def _send(self, method, url, idempotent=False, business_errors=False, throttle=None, **kwargs):
+        """Send a request through the pooled session behind the circuit breaker.
+
+        Idempotent calls are retried up to ``max_retries`` times with jittered backoff on
+        connection errors, timeouts and 5xx responses. Non-idempotent calls such as an STK
+        push are sent once, since a retry could prompt the customer twice.
+
+        With ``business_errors``, a 500 whose JSON body carries an ``errorCode`` is Daraja
+        answering (e.g. 500.001.1001, "still being processed"), not an outage: it is
+        returned as is, without a retry or a breaker failure. ``throttle`` is called
+        before every attempt, so a rate limiter counts HTTP requests, not calls.
+        """
+        attempts = self._attempts(idempotent)
+        for attempt in range(attempts):
+            if throttle is not None:
+                throttle()
+            self._before_attempt(method, url)
+            started = time.monotonic()
+            try:
+                r = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record_error(method, url, started, e)
+                if attempt == attempts - 1:
+                    raise
+            else:
+                if self._record_response(method, url, started, r, business_errors) or attempt == attempts - 1:
+                    return r
+            time.sleep(backoff_delay(attempt, base=self.retry_backoff))
+
+    def _attempts(self, idempotent):
+        return 1 + (self.max_retries if idempotent else 0)
+
+    def _before_attempt(self, method, url):
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError as e:
+            self._observe(method, url, 0.0, type(e).__name__)
+            raise
+
+    def _record_error(self, method, url, started, error):
+        self._observe(method, url, time.monotonic() - started, type(error).__name__)
+        self.breaker.record_failure()
+
+    def _record_response(self, method, url, started, r, business_errors=False):
+        """Observe a response and report it to the breaker. Returns True if it is final, False if worth a retry."""
+        self._observe(method, url, time.monotonic() - started, r.status_code)
+        if r.status_code < 500 or (business_errors and is_business_error(r)):
+            self.breaker.record_success()
+            return True
+        self.breaker.record_failure()
+        return False
+
+    def _observe(self, method, url, seconds, outcome):
+        if self.observer is None:
+            return
+        try:
+            self.observer(method, url, seconds, outcome)
+        except Exception:
+            logger.exception("Mpesa request observer failed")
+
+    @staticmethod
+    def _headers(token):
+        return {'Authorization': f"Bearer {token}", 'Content-Type': "application/json"}
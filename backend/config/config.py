@@ -13,14 +13,110 @@ class Config:
     DB_PASSWORD = os.getenv('DB_PASSWORD')
     DB_PORT = os.getenv('DB_PORT', 3306)
     
-    SQLALCHEMY_DATABASE_URI = (
+    # DATABASE_URL overrides the DB_* settings (e.g. SQLite for local load tests)
+    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL') or (
         f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
     )
+    # Per-process connection pool; size it to the worker's threads plus background pools
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+        # Recycle before MySQL's wait_timeout closes idle connections server-side
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 280)),
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true',
+    }
     
     # MPesa Config
+    MPESA_ENV = os.getenv('MPESA_ENV', 'sandbox')
+    MPESA_SANDBOX_URL = os.getenv('MPESA_SANDBOX_URL', 'https://sandbox.safaricom.co.ke')
+    MPESA_LIVE_URL = os.getenv('MPESA_LIVE_URL', 'https://api.safaricom.co.ke')
     MPESA_BUSINESS_SHORTCODE = "174379"
     MPESA_PASSKEY = "bfb279f9aa9bdbcf158e97dd71a467cd2e0c893059b10f78e6b72ada1ed2c919"
-    MPESA_CALLBACK_URL = "https://ffd8-154-159-252-60.ngrok-free.app/mpesa/callback"
+    MPESA_CALLBACK_URL = os.getenv("MPESA_CALLBACK_URL", "https://ffd8-154-159-252-60.ngrok-free.app/mpesa/callback")
+    # Send Daraja calls through the httpx-based AsyncMpesaExpress (needs httpx)
+    MPESA_ASYNC = os.getenv('MPESA_ASYNC', 'false').lower() == 'true'
+    STK_DISPATCH_WORKERS = int(os.getenv('STK_DISPATCH_WORKERS', 8))
+    # Bulk pushes wait for shortcode tokens on their own threads
+    STK_BULK_DISPATCH_WORKERS = int(os.getenv('STK_BULK_DISPATCH_WORKERS', 2))
+    PAY_BULK_MAX_ITEMS = int(os.getenv('PAY_BULK_MAX_ITEMS', 500))
+
+    # Admission control on /pay: token buckets (tokens per second, burst size)
+    RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'app.services.admission.MemoryBackend')
+    RATE_LIMIT_REDIS_URL = os.getenv('RATE_LIMIT_REDIS_URL', 'redis://localhost:6379/0')
+    RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', 100000))
+    RATE_LIMIT_VENDOR_RATE = float(os.getenv('RATE_LIMIT_VENDOR_RATE', 5))
+    RATE_LIMIT_VENDOR_BURST = float(os.getenv('RATE_LIMIT_VENDOR_BURST', 20))
+    RATE_LIMIT_PHONE_RATE = float(os.getenv('RATE_LIMIT_PHONE_RATE', 0.2))
+    RATE_LIMIT_PHONE_BURST = float(os.getenv('RATE_LIMIT_PHONE_BURST', 3))
+    RATE_LIMIT_SHORTCODE_RATE = float(os.getenv('RATE_LIMIT_SHORTCODE_RATE', 30))
+    RATE_LIMIT_SHORTCODE_BURST = float(os.getenv('RATE_LIMIT_SHORTCODE_BURST', 60))
+    # Identical /pay requests (vendor, phone, amount) within this window return the first one
+    PAY_DEDUPE_WINDOW = int(os.getenv('PAY_DEDUPE_WINDOW', 30))
+
+    # Reconciliation of pending payments whose callback never arrived
+    RECONCILE_BATCH_SIZE = int(os.getenv('RECONCILE_BATCH_SIZE', 100))
+    RECONCILE_QPS = float(os.getenv('RECONCILE_QPS', 5))
+    RECONCILE_CONCURRENCY = int(os.getenv('RECONCILE_CONCURRENCY', 4))
+    RECONCILE_MIN_AGE = int(os.getenv('RECONCILE_MIN_AGE', 300))
+    RECONCILE_INTERVAL = int(os.getenv('RECONCILE_INTERVAL', 60))
+    # Queued rows older than this lost their dispatcher task; keep it above the dispatcher's worst backlog
+    RECONCILE_QUEUED_AGE = int(os.getenv('RECONCILE_QUEUED_AGE', 300))
+    # Pushes whose response was lost are failed once no callback has claimed them for this long
+    RECONCILE_UNKNOWN_AGE = int(os.getenv('RECONCILE_UNKNOWN_AGE', 3600))
+
+    # Callback intake: 'sync' settles in the request, 'queue' appends to a local log
+    CALLBACK_INTAKE_MODE = os.getenv('CALLBACK_INTAKE_MODE', 'sync')
+    CALLBACK_QUEUE_PATH = os.getenv('CALLBACK_QUEUE_PATH', 'callback_queue.sqlite3')
+    CALLBACK_QUEUE_CONSUMERS = int(os.getenv('CALLBACK_QUEUE_CONSUMERS', 2))
+    CALLBACK_QUEUE_BATCH_SIZE = int(os.getenv('CALLBACK_QUEUE_BATCH_SIZE', 50))
+    CALLBACK_QUEUE_LEASE = int(os.getenv('CALLBACK_QUEUE_LEASE', 60))
+    CALLBACK_QUEUE_MAX_ATTEMPTS = int(os.getenv('CALLBACK_QUEUE_MAX_ATTEMPTS', 10))
+    CALLBACK_QUEUE_POLL_INTERVAL = float(os.getenv('CALLBACK_QUEUE_POLL_INTERVAL', 0.5))
+
+    # Transaction history paging
+    TRANSACTIONS_PAGE_SIZE = int(os.getenv('TRANSACTIONS_PAGE_SIZE', 50))
+    TRANSACTIONS_MAX_PAGE_SIZE = int(os.getenv('TRANSACTIONS_MAX_PAGE_SIZE', 200))
+
+    # Logging goes through a bounded in-memory queue; 'json' emits one object per line
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+
+    # Authentication: pass token claims to routes instead of loading the vendor row
+    AUTH_STATELESS_CLAIMS = os.getenv('AUTH_STATELESS_CLAIMS', 'true').lower() == 'true'
+    AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 4096))
+
+    # Password hashing, as a werkzeug method string (e.g. scrypt:32768:8:1 or pbkdf2:sha256:600000).
+    # Stored hashes made with other parameters are upgraded on the vendor's next login.
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 32))
+    PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv('PASSWORD_HASH_QUEUE_TIMEOUT', 5))
+
+    # Business numbers are derived from vendor ids with this key; never change it once vendors exist
+    BUSINESS_NUMBER_KEY = os.getenv('BUSINESS_NUMBER_KEY', 'scan2pay-business-number')
+    VENDOR_IMPORT_BATCH_SIZE = int(os.getenv('VENDOR_IMPORT_BATCH_SIZE', 500))
+
+    # Vendor identity cache for the /pay and /withdraw lookups
+    VENDOR_CACHE_BACKEND = os.getenv('VENDOR_CACHE_BACKEND', 'app.services.vendor_cache.MemoryBackend')
+    VENDOR_CACHE_SIZE = int(os.getenv('VENDOR_CACHE_SIZE', 10000))
+    VENDOR_CACHE_TTL = int(os.getenv('VENDOR_CACHE_TTL', 300))
+
+    # Payment status push (long-poll and SSE)
+    EVENTS_BACKEND = os.getenv('EVENTS_BACKEND', 'app.services.events.LocalBackend')
+    STATUS_WAIT_MAX = int(os.getenv('STATUS_WAIT_MAX', 30))
+    SSE_KEEPALIVE = int(os.getenv('SSE_KEEPALIVE', 15))
+    # Streams are closed after this long; clients reconnect and resume from Last-Event-ID
+    SSE_MAX_LIFETIME = int(os.getenv('SSE_MAX_LIFETIME', 300))
+    # Waiters re-read the database at least this often, catching changes from other workers
+    EVENTS_RECHECK_INTERVAL = float(os.getenv('EVENTS_RECHECK_INTERVAL', 5))
+    # Long-polls and streams each hold a thread; keep some of every worker's threads for other requests
+    EVENTS_MAX_SUBSCRIPTIONS = int(os.getenv(
+        'EVENTS_MAX_SUBSCRIPTIONS', max(int(os.getenv('GUNICORN_THREADS', 4)) // 2, 1)
+    ))
 
     # Email Config
     SMTP_SERVER = os.getenv('SMTP_SERVER')
@@ -29,5 +125,24 @@ class Config:
     SMTP_PASSWORD = os.getenv('SMTP_PASSWORD')
     FROM_EMAIL = os.getenv('FROM_EMAIL')
 
+    # Statement export jobs
+    STATEMENT_WORKERS = int(os.getenv('STATEMENT_WORKERS', 2))
+    STATEMENT_SMTP_POOL_SIZE = int(os.getenv('STATEMENT_SMTP_POOL_SIZE', 2))
+    STATEMENT_CHUNK_SIZE = int(os.getenv('STATEMENT_CHUNK_SIZE', 500))
+    # Jobs queued or running for longer than these lost their worker and are run again
+    STATEMENT_QUEUED_AGE = int(os.getenv('STATEMENT_QUEUED_AGE', 300))
+    STATEMENT_RUNNING_AGE = int(os.getenv('STATEMENT_RUNNING_AGE', 1800))
+
+    # Vendor QR codes; the passphrase must match the one in the mobile app
+    QR_PASSPHRASE = os.getenv('QR_PASSPHRASE', '4rever2moro')
+    QR_BOX_SIZE = int(os.getenv('QR_BOX_SIZE', 10))
+    QR_BORDER = int(os.getenv('QR_BORDER', 4))
+    # 0-7 fixes the mask instead of scoring all eight, making each code ~5x cheaper to encode
+    QR_MASK_PATTERN = int(os.getenv('QR_MASK_PATTERN')) if os.getenv('QR_MASK_PATTERN') else None
+    QR_CACHE_SIZE = int(os.getenv('QR_CACHE_SIZE', 1024))
+    QR_MAX_AGE = int(os.getenv('QR_MAX_AGE', 86400))
+    QR_RENDER_WORKERS = int(os.getenv('QR_RENDER_WORKERS', 2))
+    QR_BATCH_MAX_ITEMS = int(os.getenv('QR_BATCH_MAX_ITEMS', 1000))
+
     # Uploads
     UPLOAD_FOLDER = 'uploads'
\ No newline at end of file
@@ -0,0 +1,99 @@
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling Daraja while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Fail fast after ``threshold`` consecutive failures.
+
+    Once open, calls are rejected for ``cooldown`` seconds. After that a single
+    trial call is let through; its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, threshold=5, cooldown=30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.cooldown:
+                return 'half-open'
+            return 'open'
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self.cooldown - (time.monotonic() - self._opened_at)
+            if remaining > 0 or self._trial_in_flight:
+                raise CircuitOpenError(
+                    f"Daraja circuit open, retry in {max(remaining, 0):.0f}s"
+                )
+            self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+def may_have_been_sent(error):
+    """Whether a request that raised ``error`` may still have reached Daraja.
+
+    A read timeout or a connection dropped mid-request leaves the outcome
+    unknown; a refused or timed-out connect and an open circuit mean nothing
+    was sent. Covers both ``requests`` and ``httpx`` transport errors.
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return False
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return not _refused(error)
+    try:
+        import httpx
+    except ImportError:
+        return False
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return False
+    return isinstance(error, httpx.TransportError)
+
+
+def _refused(error):
+    """Whether a ``requests.ConnectionError`` failed while opening the connection."""
+    from urllib3.exceptions import NewConnectionError
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def create_session(pool_size=10):
+    """Build a keep-alive session whose connection pool holds ``pool_size`` sockets per host."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def backoff_delay(attempt, base=0.5, cap=8.0):
+    """Exponential backoff with full jitter for the given zero-based retry attempt."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
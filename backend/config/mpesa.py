@@ -1,12 +1,69 @@
 from config.auth import MpesaBase
 import base64
-import requests
 import datetime
 
+
+
+def _timestamp():
+    return str(datetime.datetime.now()).split(".")[0].replace(
+        "-", "").replace(" ", "").replace(":", "")
+
+
+def _password(business_shortcode, passcode, time):
+    password = f"{business_shortcode}{passcode}{time}"
+    return base64.b64encode(password.encode()).decode('utf-8')
+
+
+def stk_push_payload(business_shortcode, passcode, amount, callback_url, reference_code,
+                     phone_number, description):
+    time = _timestamp()
+    return {
+        "BusinessShortCode": business_shortcode,
+        "Password": _password(business_shortcode, passcode, time),
+        "Timestamp": time,
+        "TransactionType": "CustomerPayBillOnline",
+        "Amount": amount,
+        "PartyA": int(phone_number),
+        "PartyB": business_shortcode,
+        "PhoneNumber": int(phone_number),
+        "CallBackURL": callback_url,
+        "AccountReference": reference_code,
+        "TransactionDesc": description
+    }
+
+
+def query_payload(business_shortcode, checkout_request_id, passcode):
+    time = _timestamp()
+    return {
+        "BusinessShortCode": business_shortcode,
+        "Password": _password(business_shortcode, passcode, time),
+        "Timestamp": time,
+        "CheckoutRequestID": checkout_request_id
+    }
+
+
 class MpesaExpress(MpesaBase):
-    def __init__(self, env=None, sandbox_url=None, live_url=None):
-        super().__init__(env, sandbox_url=sandbox_url, live_url=live_url)
-        self.authentication_token = self.authenticate()
+    def __init__(self, env=None, sandbox_url=None, live_url=None, async_client=None, observer=None):
+        """Blocking Mpesa Express client.
+
+        Pass an ``AsyncMpesaExpress`` as ``async_client`` to run every call through it instead;
+        the calls then share its token, connection pool and concurrency limit.
+        """
+        super().__init__(env, sandbox_url=sandbox_url, live_url=live_url, observer=observer,
+                         transport=async_client is None)
+        self.async_client = async_client
+
+    @property
+    def token(self):
+        if self.async_client is not None:
+            return self.async_client.run_sync(self.async_client.tokens.get())
+        return super().token
+
+    def authenticate(self):
+        """Force an access token refresh; see ``MpesaBase.authenticate``."""
+        if self.async_client is not None:
+            return self.async_client.run_sync(self.async_client.authenticate())
+        return super().authenticate()
 
     def stk_push(self, business_shortcode, passcode, amount, callback_url, reference_code,
                  phone_number, description):
@@ -33,39 +90,20 @@ class MpesaExpress(MpesaBase):
 
         """
 
-        time = str(datetime.datetime.now()).split(".")[0].replace(
-            "-", "").replace(" ", "").replace(":", "")
-        password = f"{business_shortcode}{passcode}{time}"
-        encoded = base64.b64encode(password.encode())
-        payload = {
-            "BusinessShortCode": business_shortcode,
-            "Password": encoded.decode('utf-8'),
-            "Timestamp": time,
-            "TransactionType": "CustomerPayBillOnline",
-            "Amount": amount,
-            "PartyA": int(phone_number),
-            "PartyB": business_shortcode,
-            "PhoneNumber": int(phone_number),
-            "CallBackURL": callback_url,
-            "AccountReference": reference_code,
-            "TransactionDesc": description
-        }
-        headers = {'Authorization': f"Bearer {self.authentication_token}", 'Content-Type': "application/json"}
-        if self.env == "production":
-            base_safaricom_url = self.live_url
-        else:
-            base_safaricom_url = self.sandbox_url
-        saf_url = f"{base_safaricom_url}/mpesa/stkpush/v1/processrequest"
-        r = requests.post(saf_url, headers=headers, json=payload)
-        return r.json()
-
-    def query(self, business_shortcode=None, checkout_request_id=None, passcode=None):
+        payload = stk_push_payload(business_shortcode, passcode, amount, callback_url, reference_code,
+                                   phone_number, description)
+        if self.async_client is not None:
+            return self.async_client.run_sync(self.async_client.send_stk_push(payload))
+        return self._post("/mpesa/stkpush/v1/processrequest", payload)
+
+    def query(self, business_shortcode=None, checkout_request_id=None, passcode=None, throttle=None):
         """This method uses Mpesa's Express API to check the status of a Lipa Na M-Pesa Online Payment..
 
                                                     **Args:**
                                                         - business_shortcode (int): This is organizations shortcode (Paybill or Buygoods - A 5 to 6 digit account number) used to identify an organization and receive the transaction.
                                                         - checkout_request_id (str): This is a global unique identifier of the processed checkout transaction request.
                                                         - passcode (str): Get from developer portal
+                                                        - throttle (callable): Called before every HTTP attempt, e.g. a rate limiter's acquire.
 
 
                                                     **Returns:**
@@ -78,21 +116,8 @@ class MpesaExpress(MpesaBase):
 
         """
 
-        time = str(datetime.datetime.now()).split(".")[0].replace(
-            "-", "").replace(" ", "").replace(":", "")
-        password = f"{business_shortcode}{passcode}{time}"
-        encoded = base64.b64encode(password.encode())
-        payload = {
-            "BusinessShortCode": business_shortcode,
-            "Password": str(encoded),
-            "Timestamp": time,
-            "CheckoutRequestID": checkout_request_id
-        }
-        headers = {'Authorization': f"Bearer {self.authentication_token}", 'Content-Type': "application/json"}
-        if self.env == "production":
-            base_safaricom_url = self.live_url
-        else:
-            base_safaricom_url = self.sandbox_url
-        saf_url = f"{base_safaricom_url}/mpesa/stkpushquery/v1/query"
-        r = requests.post(saf_url, headers=headers, json=payload)
-        return r.json()
\ No newline at end of file
+        payload = query_payload(business_shortcode, checkout_request_id, passcode)
+        if self.async_client is not None:
+            return self.async_client.run_sync(self.async_client.send_query(payload, throttle))
+        return self._post("/mpesa/stkpushquery/v1/query", payload, idempotent=True,
+                          business_errors=True, throttle=throttle)
\ No newline at end of file
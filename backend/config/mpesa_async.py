@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from config.auth import AccessTokenCache, MpesaBase
+from config.http import backoff_delay
+from config.mpesa import query_payload, stk_push_payload
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncAccessTokenCache(AccessTokenCache):
+    """``AccessTokenCache`` for a coroutine ``fetch``, used from a single event loop.
+
+    Concurrent refreshes share one in-flight task instead of waiting on a condition.
+    """
+
+    def __init__(self, fetch, refresh_margin=300):
+        super().__init__(fetch, refresh_margin)
+        self._task = None
+
+    async def get(self):
+        token = self._current()
+        if token is not None:
+            return token
+        return await self.refresh()
+
+    async def refresh(self):
+        # Shielded so a cancelled caller does not cancel the refresh the others are waiting on
+        return await asyncio.shield(self._in_flight())
+
+    def _start_background_refresh(self):
+        self._in_flight().add_done_callback(self._refreshed_in_background)
+
+    def _in_flight(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._do_refresh())
+        return self._task
+
+    async def _do_refresh(self):
+        try:
+            token, expires_in = await self._fetch()
+        except Exception as e:
+            self._task = None
+            self._failed(e)
+            raise
+        self._task = None
+        self._stored(token, expires_in)
+        return token
+
+    @staticmethod
+    def _refreshed_in_background(task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Background Mpesa token refresh failed: %s", task.exception())
+
+
+class AsyncMpesaExpress(MpesaBase):
+    """Non-blocking Mpesa Express client built on ``httpx.AsyncClient``.
+
+    Settings, retry and circuit-breaker policy are ``MpesaBase``'s. Every
+    coroutine shares one access token, one connection pool and one semaphore
+    that caps the number of in-flight Daraja calls (``MPESA_MAX_CONCURRENCY``).
+    The client binds to the event loop it is first used from; ``run_sync``
+    drives it from a private loop thread so blocking code (see
+    ``MpesaExpress(async_client=...)``) can share it too.
+
+    Requires the optional ``httpx`` package.
+    """
+
+    def __init__(self, env=None, app_key=None, app_secret=None,
+                 sandbox_url="https://sandbox.safaricom.co.ke",
+                 live_url="https://api.safaricom.co.ke",
+                 max_concurrency=None, pool_size=None, observer=None):
+        try:
+            import httpx
+        except ImportError as e:
+            raise ImportError("AsyncMpesaExpress requires httpx: pip install httpx") from e
+        self._httpx = httpx
+        self._client = None
+        self._semaphore = None
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        super().__init__(env, app_key, app_secret, sandbox_url, live_url, observer=observer)
+        self.max_concurrency = max_concurrency or int(os.getenv("MPESA_MAX_CONCURRENCY", 100))
+        self.pool_size = pool_size or self.pool_size
+
+    def _init_transport(self):
+        self.breaker = self._create_breaker()
+        self.tokens = AsyncAccessTokenCache(self._fetch_token, refresh_margin=self.refresh_margin)
+
+    async def authenticate(self):
+        """Fetch a new access token (see ``MpesaBase.authenticate``) and cache it for every coroutine."""
+        return await self.tokens.refresh()
+
+    async def stk_push(self, business_shortcode, passcode, amount, callback_url, reference_code,
+                       phone_number, description):
+        """Async counterpart of ``MpesaExpress.stk_push``."""
+        payload = stk_push_payload(business_shortcode, passcode, amount, callback_url, reference_code,
+                                   phone_number, description)
+        return await self.send_stk_push(payload)
+
+    async def query(self, business_shortcode=None, checkout_request_id=None, passcode=None, throttle=None):
+        """Async counterpart of ``MpesaExpress.query``."""
+        return await self.send_query(query_payload(business_shortcode, checkout_request_id, passcode), throttle)
+
+    async def send_stk_push(self, payload):
+        return await self._post("/mpesa/stkpush/v1/processrequest", payload)
+
+    async def send_query(self, payload, throttle=None):
+        return await self._post("/mpesa/stkpushquery/v1/query", payload, idempotent=True,
+                                business_errors=True, throttle=throttle)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def run_sync(self, coro):
+        """Run ``coro`` on this client's loop thread and block until it finishes."""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name='mpesa-async', daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _fetch_token(self):
+        r = await self._send("GET", self._token_url(), idempotent=True,
+                             auth=(str(self.app_key), str(self.app_secret)))
+        return self._parse_token(r)
+
+    async def _post(self, path, payload, idempotent=False, business_errors=False, throttle=None):
+        url = f"{self.base_url()}{path}"
+        token = await self.tokens.get()
+        r = await self._send("POST", url, idempotent, business_errors, throttle,
+                             headers=self._headers(token), json=payload)
+        if r.status_code == 401:
+            self.tokens.invalidate(token)
+            token = await self.tokens.get()
+            r = await self._send("POST", url, idempotent, business_errors, throttle,
+                                 headers=self._headers(token), json=payload)
+        return r.json()
+
+    async def _send(self, method, url, idempotent=False, business_errors=False, throttle=None, **kwargs):
+        """``MpesaBase._send`` on ``httpx``, bounded by the concurrency limit.
+
+        A blocking ``throttle`` (such as a rate limiter's acquire) runs in a thread
+        so it does not stall the other coroutines on the loop.
+        """
+        attempts = self._attempts(idempotent)
+        async with self._get_semaphore():
+            for attempt in range(attempts):
+                if throttle is not None:
+                    await asyncio.to_thread(throttle)
+                self._before_attempt(method, url)
+                started = time.monotonic()
+                try:
+                    r = await self._get_client().request(method, url, **kwargs)
+                except self._httpx.TransportError as e:
+                    self._record_error(method, url, started, e)
+                    if attempt == attempts - 1:
+                        raise
+                else:
+                    if self._record_response(method, url, started, r, business_errors) or attempt == attempts - 1:
+                        return r
+                await asyncio.sleep(backoff_delay(attempt, base=self.retry_backoff))
+
+    def _get_client(self):
+        if self._client is None:
+            connect, read = self.timeout
+            limits = self._httpx.Limits(max_connections=self.pool_size,
+                                        max_keepalive_connections=self.pool_size)
+            self._client = self._httpx.AsyncClient(limits=limits,
+                                                   timeout=self._httpx.Timeout(read, connect=connect))
+        return self._client
+
+    def _get_semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
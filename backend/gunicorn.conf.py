@@ -0,0 +1,61 @@
+"""Production serving profile.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Workers are forked from a master that has already built the app
+(``preload_app``), so each worker starts serving immediately. Every setting
+can be tuned from the environment.
+
+For /metrics to cover every worker, point PROMETHEUS_MULTIPROC_DIR at an empty
+directory before starting gunicorn.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+# Requests mostly wait on MySQL and Daraja, so each worker also runs threads
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+# Long enough for in-flight STK pushes and statement emails to finish
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+# Recycle workers now and then to bound memory growth
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = os.getenv('GUNICORN_ERROR_LOG', '-')
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def _app():
+    from wsgi import app
+    return app
+
+
+def when_ready(server):
+    if preload_app:
+        from app import lifecycle
+        lifecycle.before_fork(_app())
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from app import lifecycle
+        lifecycle.after_fork(_app())
+
+
+def worker_exit(server, worker):
+    from app import lifecycle
+    lifecycle.shutdown(_app(), timeout=graceful_timeout)
+
+
+def child_exit(server, worker):
+    # Drop the exited worker's live gauges from the shared metrics directory
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+import jwt
+import pytest
+from app import create_app, db
+from app.migrations import upgrade
+from app.models.transaction import Transaction
+from app.models.vendor import Vendor
+from app.services import onboarding
+from config.config import Config
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SECRET_KEY': 'test-secret',
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'scan2pay.sqlite3'}",
+        'CALLBACK_INTAKE_MODE': 'sync',
+        'RATE_LIMIT_ENABLED': False,
+        # Hash inline and cheaply; the pools are exercised by the benchmarks
+        'PASSWORD_HASH_WORKERS': 0,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'QR_RENDER_WORKERS': 0,
+    })
+    with app.app_context():
+        upgrade()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def vendor(app):
+    """A registered vendor with a zero balance. Returns ``(id, business_number)``."""
+    with app.app_context():
+        vendor = Vendor(business_name='Test Shop', email='shop@example.com', password_hash='x',
+                        phone_number='0700000000', business_type='retail', id_number='1',
+                        full_name='Test Owner', balance=0)
+        db.session.add(vendor)
+        db.session.flush()
+        vendor.business_number = onboarding.business_number(vendor.id)
+        db.session.commit()
+        return vendor.id, vendor.business_number
+
+
+@pytest.fixture
+def auth_headers(vendor):
+    """Authorization header for ``vendor``, as issued by /vendor/login."""
+    token = jwt.encode({'vendor_id': vendor[0], 'business_number': vendor[1], 'business_name': 'Test Shop',
+                        'exp': datetime.utcnow() + timedelta(hours=1)}, Config.SECRET_KEY, algorithm='HS256')
+    return {'Authorization': f'Bearer {token}'}
+
+
+def add_pending(app, vendor_id, amount, checkout_request_id):
+    """Insert a transaction whose STK push was sent and is awaiting its callback. Returns its id."""
+    with app.app_context():
+        transaction = Transaction(vendor_id=vendor_id, type='in', amount=amount, customer='Customer',
+                                  phone_number='254700000001', status='pending', date=datetime.utcnow(),
+                                  mpesa_checkout_request_id=checkout_request_id)
+        db.session.add(transaction)
+        db.session.commit()
+        return transaction.id
+
+
+def stk_callback(checkout_request_id, result_code=0, amount=100):
+    callback = {
+        'MerchantRequestID': 'merchant-1',
+        'CheckoutRequestID': checkout_request_id,
+        'ResultCode': result_code,
+        'ResultDesc': 'The service request is processed successfully.',
+    }
+    if result_code == 0:
+        callback['CallbackMetadata'] = {'Item': [
+            {'Name': 'Amount', 'Value': amount},
+            {'Name': 'MpesaReceiptNumber', 'Value': 'RCPT000001'},
+            {'Name': 'PhoneNumber', 'Value': 254700000001},
+        ]}
+    return {'Body': {'stkCallback': callback}}
@@ -0,0 +1,89 @@
+import time
+import pytest
+from app import db
+from app.models.transaction import Transaction
+from app.routes import payment
+from app.services.admission import admission
+
+
+@pytest.fixture
+def limited(app, monkeypatch):
+    """Admission on, with pushes recorded instead of dispatched to Daraja."""
+    app.config['RATE_LIMIT_ENABLED'] = True
+    submitted = []
+    monkeypatch.setattr(payment.dispatcher, 'submit', submitted.append)
+    return submitted
+
+
+def pay(client, business_number, amount=100, phone_number='254700000001'):
+    return client.post('/pay', json={'amount': amount, 'phone_number': phone_number,
+                                     'account_number': business_number})
+
+
+def test_duplicate_tap_returns_the_first_request(app, client, vendor, limited):
+    first = pay(client, vendor[1])
+    second = pay(client, vendor[1])
+
+    assert first.status_code == second.status_code == 202
+    assert second.json['deduplicated'] is True
+    assert second.json['request_id'] == first.json['request_id']
+    assert len(limited) == 1
+    with app.app_context():
+        assert Transaction.query.count() == 1
+
+
+def test_settled_request_no_longer_dedupes(app, client, vendor, limited):
+    first = pay(client, vendor[1])
+    with app.app_context():
+        Transaction.query.filter_by(request_id=first.json['request_id']).update({'status': 'failed'})
+        db.session.commit()
+
+    second = pay(client, vendor[1])
+
+    assert second.status_code == 202 and 'deduplicated' not in second.json
+    assert second.json['request_id'] != first.json['request_id']
+
+
+def test_takeover_lost_to_another_tap_returns_that_tap(app, client, vendor, limited, monkeypatch):
+    first = pay(client, vendor[1])
+    with app.app_context():
+        Transaction.query.filter_by(request_id=first.json['request_id']).update({'status': 'completed'})
+        db.session.commit()
+    # Another tap claims the key between our release and our re-claim
+    claims = iter([first.json['request_id'], 'other-tap'])
+    monkeypatch.setattr(admission, 'claim', lambda *args: next(claims))
+
+    response = pay(client, vendor[1])
+
+    assert response.status_code == 202
+    assert response.json['request_id'] == 'other-tap' and response.json['deduplicated'] is True
+    assert len(limited) == 1
+
+
+def test_rate_limited_tap_gets_retry_after(app, client, vendor, limited):
+    app.config.update(RATE_LIMIT_PHONE_BURST=1, RATE_LIMIT_PHONE_RATE=0.1)
+
+    assert pay(client, vendor[1], amount=100).status_code == 202
+    response = pay(client, vendor[1], amount=200)
+
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    # The refused request released its claim: once admitted again it is not deduplicated
+    app.config['RATE_LIMIT_PHONE_RATE'] = 1000
+    time.sleep(0.01)
+    retried = pay(client, vendor[1], amount=200)
+    assert retried.status_code == 202 and 'deduplicated' not in retried.json
+
+
+def test_claim_is_released_when_queueing_fails(app, client, vendor, limited, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError('database unavailable')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(payment, 'next_change_seq', broken)
+        assert pay(client, vendor[1]).status_code == 500
+
+    retried = pay(client, vendor[1])
+
+    assert retried.status_code == 202 and 'deduplicated' not in retried.json
+    assert len(limited) == 1
@@ -0,0 +1,49 @@
+import time
+import pytest
+from app import db
+from app.models.ledger_entry import LedgerEntry
+from app.models.vendor import Vendor
+from app.services import ledger
+from app.services.callback_queue import callback_queue
+from conftest import add_pending, stk_callback
+
+
+@pytest.fixture
+def queue(app, tmp_path):
+    app.config.update(CALLBACK_INTAKE_MODE='queue', CALLBACK_QUEUE_PATH=str(tmp_path / 'callbacks.sqlite3'),
+                      CALLBACK_QUEUE_POLL_INTERVAL=0.05, CALLBACK_QUEUE_BATCH_SIZE=5)
+    yield callback_queue
+    callback_queue.stop_consumers(timeout=5)
+
+
+def wait_for_depth(queue, depth, timeout=10):
+    deadline = time.monotonic() + timeout
+    while queue.stats()['depth'] > depth and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return queue.stats()
+
+
+def test_callbacks_settle_once_across_a_consumer_restart(app, client, vendor, queue):
+    vendor_id, _ = vendor
+    ids = [add_pending(app, vendor_id, 10, f'ws_CO_{i}') for i in range(20)]
+    # Daraja delivers every callback twice
+    for i in list(range(20)) * 2:
+        response = client.post('/mpesa/callback', json=stk_callback(f'ws_CO_{i}', amount=10))
+        assert response.status_code == 200 and response.json['message'] == 'Accepted'
+
+    # A consumer that died mid-batch: its claims are replayed once the lease expires
+    assert len(queue.claim(15, lease=1)) == 15
+
+    queue.start_consumers(2)
+    wait_for_depth(queue, 30)
+    queue.stop_consumers(timeout=5)
+    assert queue.stats()['depth'] > 0
+    queue.start_consumers(2)
+    stats = wait_for_depth(queue, 0)
+
+    assert stats == {'depth': 0, 'lag_seconds': 0.0, 'dead': 0}
+    with app.app_context():
+        assert db.session.get(Vendor, vendor_id).balance == 200
+        for transaction_id in ids:
+            assert LedgerEntry.query.filter_by(transaction_id=transaction_id).count() == 2
+        assert ledger.check() == ([], [])
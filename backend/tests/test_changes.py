@@ -0,0 +1,47 @@
+from datetime import datetime
+from app import db
+from app.models.transaction import Transaction
+from app.services.changes import next_change_seq
+
+
+def add_changes(app, vendor_id, count):
+    """Insert ``count`` queued collections, each stamped with the next change sequence."""
+    with app.app_context():
+        for _ in range(count):
+            db.session.add(Transaction(vendor_id=vendor_id, type='in', amount=10, customer='Customer',
+                                       status='queued', date=datetime.utcnow(),
+                                       change_seq=next_change_seq(vendor_id)))
+        db.session.commit()
+
+
+def changes(client, auth_headers, since, limit):
+    response = client.get('/transactions/changes', query_string={'since': since, 'limit': limit},
+                          headers=auth_headers)
+    assert response.status_code == 200
+    return response.json
+
+
+def test_paging_through_more_changes_than_the_limit(app, client, vendor, auth_headers):
+    add_changes(app, vendor[0], 7)
+
+    pages, since = [], 0
+    while True:
+        page = changes(client, auth_headers, since, limit=3)
+        pages.append((len(page['transactions']), page['high_water'], page['has_more']))
+        since = page['high_water']
+        if not page['has_more']:
+            break
+
+    assert pages == [(3, 3, True), (3, 6, True), (1, 7, False)]
+    # Caught up: nothing new, the high-water mark stays put
+    assert changes(client, auth_headers, since, limit=3) == {
+        'balance': 0, 'transactions': [], 'high_water': 7, 'has_more': False}
+
+
+def test_since_beyond_the_current_sequence(app, client, vendor, auth_headers):
+    add_changes(app, vendor[0], 2)
+
+    page = changes(client, auth_headers, since=50, limit=10)
+
+    assert page['transactions'] == []
+    assert page['high_water'] == 50 and page['has_more'] is False
@@ -0,0 +1,92 @@
+from datetime import datetime
+import pytest
+import requests
+import app as app_package
+from app import db
+from app.models.daily_rollup import DailyRollup
+from app.models.transaction import Transaction
+from app.models.vendor import Vendor
+from app.services.stk_dispatcher import dispatch_stk_push, expire_unknown, requeue_stale
+from conftest import stk_callback
+
+
+class FakeMpesa:
+    """Stands in for the Daraja client, raising ``error`` from every STK push."""
+
+    def __init__(self, error):
+        self.error = error
+        self.pushes = 0
+
+    def stk_push(self, **kwargs):
+        self.pushes += 1
+        raise self.error
+
+
+@pytest.fixture
+def fake_mpesa(monkeypatch):
+    def install(error):
+        fake = FakeMpesa(error)
+        monkeypatch.setattr(app_package, '_mpesa', fake)
+        return fake
+    return install
+
+
+def add_queued(app, vendor_id, amount=100):
+    with app.app_context():
+        transaction = Transaction(vendor_id=vendor_id, type='in', amount=amount, customer='Customer',
+                                  phone_number='254700000001', status='queued', date=datetime.utcnow())
+        db.session.add(transaction)
+        db.session.commit()
+        return transaction.id
+
+
+def dispatch(app, transaction_id):
+    with app.app_context():
+        dispatch_stk_push(transaction_id)
+        transaction = db.session.get(Transaction, transaction_id)
+        failed = DailyRollup.query.filter_by(status='failed').count()
+        return transaction.status, transaction.mpesa_checkout_request_id, failed
+
+
+def test_read_timeout_leaves_outcome_unknown(app, vendor, fake_mpesa):
+    fake = fake_mpesa(requests.ReadTimeout('read timed out'))
+    transaction_id = add_queued(app, vendor[0])
+
+    assert dispatch(app, transaction_id) == ('unknown', None, 0)
+    with app.app_context():
+        # Not queued any more, so never pushed a second time
+        assert requeue_stale(0, 10) == 0
+    assert fake.pushes == 1
+
+
+def test_connect_failure_fails_the_push(app, vendor, fake_mpesa):
+    fake_mpesa(requests.ConnectTimeout('connect timed out'))
+    transaction_id = add_queued(app, vendor[0])
+
+    assert dispatch(app, transaction_id) == ('failed', None, 1)
+
+
+def test_success_callback_claims_the_unknown_push(app, client, vendor, fake_mpesa):
+    vendor_id, _ = vendor
+    fake_mpesa(requests.ReadTimeout('read timed out'))
+    transaction_id = add_queued(app, vendor_id, amount=100)
+    dispatch(app, transaction_id)
+
+    response = client.post('/mpesa/callback', json=stk_callback('ws_CO_lost', amount=100))
+
+    assert response.status_code == 200 and response.json['message'] == 'Success'
+    with app.app_context():
+        transaction = db.session.get(Transaction, transaction_id)
+        assert (transaction.status, transaction.mpesa_checkout_request_id) == ('completed', 'ws_CO_lost')
+        assert db.session.get(Vendor, vendor_id).balance == 100
+
+
+def test_unclaimed_unknown_push_expires_as_failed(app, vendor, fake_mpesa):
+    fake_mpesa(requests.ReadTimeout('read timed out'))
+    transaction_id = add_queued(app, vendor[0])
+    dispatch(app, transaction_id)
+
+    with app.app_context():
+        assert expire_unknown(0, 10) == 1
+        assert db.session.get(Transaction, transaction_id).status == 'failed'
+        assert DailyRollup.query.filter_by(status='failed').count() == 1
@@ -0,0 +1,163 @@
+import threading
+import time
+import pytest
+import requests
+from config.auth import AccessTokenCache, MpesaBase
+from config.http import CircuitBreaker, CircuitOpenError
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self._body = body or {}
+
+    def json(self):
+        return self._body
+
+
+class FakeSession:
+    """Replays ``outcomes`` (responses or exceptions to raise) and records each request."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.requests = []
+
+    def request(self, method, url, timeout=None, **kwargs):
+        self.requests.append((method, url))
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def mpesa(monkeypatch):
+    monkeypatch.setenv('MPESA_RETRY_BACKOFF', '0')
+    monkeypatch.setenv('MPESA_MAX_RETRIES', '2')
+    return MpesaBase(env='sandbox', app_key='key', app_secret='secret', sandbox_url='http://daraja.test')
+
+
+def test_concurrent_callers_share_one_refresh():
+    fetches = []
+    release = threading.Event()
+
+    def fetch():
+        fetches.append(1)
+        release.wait(5)
+        return 'token-1', 3599
+
+    tokens = AccessTokenCache(fetch)
+    start = threading.Barrier(20)
+    results = []
+
+    def call():
+        start.wait()
+        results.append(tokens.get())
+
+    threads = [threading.Thread(target=call) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert fetches == [1]
+    assert results == ['token-1'] * 20
+
+
+def test_waiting_callers_see_the_refresh_error():
+    release = threading.Event()
+
+    def fetch():
+        release.wait(5)
+        raise requests.ConnectionError('down')
+
+    tokens = AccessTokenCache(fetch)
+    errors = []
+
+    def call():
+        try:
+            tokens.get()
+        except requests.ConnectionError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 5
+
+
+def test_breaker_opens_then_lets_one_trial_through():
+    breaker = CircuitBreaker(threshold=3, cooldown=0.2)
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure()
+
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.25)
+    assert breaker.state == 'half-open'
+    breaker.before_call()
+    # Only one trial call while half-open
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+def test_failed_trial_reopens_the_breaker():
+    breaker = CircuitBreaker(threshold=1, cooldown=0.1)
+    breaker.before_call()
+    breaker.record_failure()
+    time.sleep(0.15)
+
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == 'open'
+
+
+def test_non_idempotent_call_is_sent_once(mpesa):
+    mpesa.session = FakeSession(requests.ReadTimeout('read timed out'), FakeResponse(200))
+
+    with pytest.raises(requests.ReadTimeout):
+        mpesa._send('POST', 'http://daraja.test/mpesa/stkpush/v1/processrequest')
+
+    assert len(mpesa.session.requests) == 1
+
+
+def test_non_idempotent_5xx_is_returned_without_retry(mpesa):
+    mpesa.session = FakeSession(FakeResponse(503), FakeResponse(200))
+
+    r = mpesa._send('POST', 'http://daraja.test/mpesa/stkpush/v1/processrequest')
+
+    assert r.status_code == 503
+    assert len(mpesa.session.requests) == 1
+
+
+def test_idempotent_call_is_retried(mpesa):
+    mpesa.session = FakeSession(requests.ConnectionError('reset'), FakeResponse(503), FakeResponse(200))
+
+    r = mpesa._send('GET', 'http://daraja.test/oauth/v1/generate', idempotent=True)
+
+    assert r.status_code == 200
+    assert len(mpesa.session.requests) == 3
+
+
+def test_business_error_is_final(mpesa):
+    mpesa.session = FakeSession(FakeResponse(500, {'errorCode': '500.001.1001'}), FakeResponse(200))
+
+    r = mpesa._send('POST', 'http://daraja.test/mpesa/stkpushquery/v1/query', idempotent=True,
+                    business_errors=True)
+
+    assert r.status_code == 500
+    assert len(mpesa.session.requests) == 1
+    assert mpesa.breaker.state == 'closed'
@@ -0,0 +1,56 @@
+import json
+import pytest
+from config.mpesa import MpesaExpress
+
+httpx = pytest.importorskip('httpx')
+from config.mpesa_async import AsyncMpesaExpress  # noqa: E402
+
+
+class FakeDaraja:
+    """Answers Daraja's OAuth, STK push and query endpoints, recording each request path."""
+
+    def __init__(self):
+        self.paths = []
+        self.tokens_issued = 0
+
+    def __call__(self, request):
+        self.paths.append(request.url.path)
+        if request.url.path == '/oauth/v1/generate':
+            self.tokens_issued += 1
+            return httpx.Response(200, json={'access_token': f'token-{self.tokens_issued}', 'expires_in': 3599})
+        assert request.headers['Authorization'] == f'Bearer token-{self.tokens_issued}'
+        body = json.loads(request.content)
+        if request.url.path == '/mpesa/stkpush/v1/processrequest':
+            return httpx.Response(200, json={'ResponseCode': '0', 'CheckoutRequestID': 'ws_CO_1',
+                                             'AccountReference': body['AccountReference']})
+        return httpx.Response(200, json={'ResponseCode': '0', 'ResultCode': '0',
+                                         'CheckoutRequestID': body['CheckoutRequestID']})
+
+
+@pytest.fixture
+def daraja():
+    return FakeDaraja()
+
+
+@pytest.fixture
+def mpesa(daraja):
+    async_client = AsyncMpesaExpress(env='sandbox', app_key='key', app_secret='secret',
+                                     sandbox_url='http://daraja.test')
+    async_client._client = httpx.AsyncClient(transport=httpx.MockTransport(daraja))
+    yield MpesaExpress(env='sandbox', sandbox_url='http://daraja.test', async_client=async_client)
+    async_client.run_sync(async_client.aclose())
+
+
+def test_wrapper_delegates_every_call_to_the_async_client(mpesa, daraja):
+    assert mpesa.session is None and mpesa.tokens is None
+
+    assert mpesa.token == 'token-1'
+    assert mpesa.authenticate() == 'token-2'
+    assert mpesa.token == 'token-2'
+    pushed = mpesa.stk_push(174379, 'passkey', 10, 'http://callback.test', 'REF1', '254700000001', 'Payment')
+    queried = mpesa.query(174379, 'ws_CO_1', 'passkey', throttle=lambda: None)
+
+    assert pushed['CheckoutRequestID'] == 'ws_CO_1' and pushed['AccountReference'] == 'REF1'
+    assert queried['CheckoutRequestID'] == 'ws_CO_1'
+    assert daraja.paths == ['/oauth/v1/generate', '/oauth/v1/generate',
+                            '/mpesa/stkpush/v1/processrequest', '/mpesa/stkpushquery/v1/query']
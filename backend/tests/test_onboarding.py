@@ -0,0 +1,97 @@
+import csv
+import io
+import pytest
+from app import db
+from app.models.vendor import Vendor
+from app.services import onboarding
+
+
+def test_business_numbers_are_distinct_ten_digit_numbers(app):
+    with app.app_context():
+        by_id = onboarding.business_numbers(range(1, 50001))
+    numbers = [by_id[vendor_id] for vendor_id in range(1, 50001)]
+
+    assert len(set(numbers)) == len(numbers)
+    assert all(len(number) == 10 and number[0] != '0' for number in numbers)
+    # Consecutive ids must not give guessable, consecutive numbers
+    assert sum(int(b) - int(a) == 1 for a, b in zip(numbers, numbers[1:])) == 0
+
+
+def test_business_numbers_depend_on_the_key(app):
+    with app.app_context():
+        first = onboarding.business_number(1)
+        app.config['BUSINESS_NUMBER_KEY'] = 'another-key'
+        second = onboarding.business_number(1)
+
+    assert first != second
+
+
+def test_business_number_range_is_bounded(app):
+    with app.app_context():
+        # The last id that maps into ten-digit numbers, and the first that cannot
+        last_id = onboarding.BUSINESS_NUMBER_HALF ** 2 - onboarding.BUSINESS_NUMBER_MIN
+        assert len(onboarding.business_number(last_id)) == 10
+        with pytest.raises(ValueError):
+            onboarding.business_number(last_id + 1)
+        with pytest.raises(ValueError):
+            onboarding.business_number(0)
+
+
+def register(client, index):
+    return client.post('/vendor/register', json={
+        'business_name': f'Shop {index}', 'email': f'shop{index}@example.com', 'password': 'secret',
+        'phone_number': f'07000000{index:02d}', 'business_type': 'retail',
+        'id_number': str(index), 'full_name': f'Owner {index}'
+    })
+
+
+def test_registration_assigns_the_vendor_ids_business_number(app, client):
+    for index in range(5):
+        assert register(client, index).status_code == 201
+    assert register(client, 0).status_code == 400
+
+    with app.app_context():
+        vendors = Vendor.query.all()
+        assert len(vendors) == 5
+        assert all(vendor.business_number == onboarding.business_number(vendor.id) for vendor in vendors)
+
+
+def test_import_assigns_distinct_business_numbers(app, client):
+    assert register(client, 0).status_code == 201
+    rows = ''.join(f'Shop {i},shop{i}@example.com,secret,07000000{i:02d},retail,{i},Owner {i}\n'
+                   for i in range(30))
+    reader = csv.DictReader(io.StringIO(','.join(onboarding.IMPORT_FIELDS) + '\n' + rows))
+
+    with app.app_context():
+        results = list(onboarding.import_vendors(reader, batch_size=8))
+        vendors = Vendor.query.all()
+        expected = {vendor.id: onboarding.business_number(vendor.id) for vendor in vendors}
+
+    assert [result.status for result in results].count('imported') == 29
+    assert [result.error for result in results if result.status == 'error'] == ['Email already registered']
+    assert len({vendor.business_number for vendor in vendors}) == len(vendors) == 30
+    assert all(vendor.business_number == expected[vendor.id] for vendor in vendors)
+
+
+def test_derived_numbers_step_over_legacy_numbers(app, client):
+    # A vendor from before derived numbers holds, at random, the number id 2 would get
+    with app.app_context():
+        taken = onboarding.business_number(2)
+        db.session.add(Vendor(business_name='Legacy Shop', email='legacy@example.com', password_hash='x',
+                              phone_number='0711111111', business_type='retail', id_number='99',
+                              full_name='Legacy Owner', business_number=taken))
+        db.session.commit()
+
+    assert register(client, 1).status_code == 201
+    rows = ''.join(f'Shop {i},shop{i}@example.com,secret,07000000{i:02d},retail,{i},Owner {i}\n'
+                   for i in range(2, 6))
+    reader = csv.DictReader(io.StringIO(','.join(onboarding.IMPORT_FIELDS) + '\n' + rows))
+
+    with app.app_context():
+        assert [result.status for result in onboarding.import_vendors(reader, batch_size=10)] == ['imported'] * 4
+        vendors = Vendor.query.order_by(Vendor.id).all()
+        numbers = [vendor.business_number for vendor in vendors]
+        assert numbers[0] == taken and taken not in numbers[1:]
+        assert len(set(numbers)) == 6
+        # Still a function of the id once assigned
+        assert all(onboarding.business_number(vendor.id) == vendor.business_number for vendor in vendors[1:])
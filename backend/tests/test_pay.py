@@ -0,0 +1,25 @@
+import pytest
+from app.routes import payment
+
+
+@pytest.fixture
+def queued(monkeypatch):
+    """Pushes recorded instead of dispatched to Daraja."""
+    submitted = []
+    monkeypatch.setattr(payment.dispatcher, 'submit', submitted.append)
+    return submitted
+
+
+def test_reference_is_stored_and_listed(app, client, vendor, auth_headers, queued):
+    response = client.post('/pay', json={'amount': 150, 'phone_number': '254700000001',
+                                         'account_number': vendor[1], 'reference': ' Table 4 '})
+    assert response.status_code == 202
+
+    listed = client.get('/transactions', headers=auth_headers).json['transactions']
+    assert [row['reference'] for row in listed] == ['Table 4']
+
+
+def test_overlong_reference_is_rejected(client, vendor, queued):
+    response = client.post('/pay', json={'amount': 150, 'phone_number': '254700000001',
+                                         'account_number': vendor[1], 'reference': 'x' * 65})
+    assert response.status_code == 400
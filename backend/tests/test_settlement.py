@@ -0,0 +1,72 @@
+import threading
+from app import db
+from app.models.ledger_entry import LedgerEntry
+from app.models.transaction import Transaction
+from app.models.vendor import Vendor
+from app.services import ledger
+from app.services.settlement import apply_stk_result
+from conftest import add_pending, stk_callback
+
+
+def balance(app, vendor_id):
+    with app.app_context():
+        return db.session.get(Vendor, vendor_id).balance
+
+
+def test_duplicate_callback_credits_once(app, client, vendor):
+    vendor_id, _ = vendor
+    transaction_id = add_pending(app, vendor_id, 100, 'ws_CO_1')
+
+    first = client.post('/mpesa/callback', json=stk_callback('ws_CO_1'))
+    second = client.post('/mpesa/callback', json=stk_callback('ws_CO_1'))
+
+    assert first.status_code == 200 and first.json['message'] == 'Success'
+    assert second.status_code == 200 and second.json['message'] == 'Already processed'
+    assert balance(app, vendor_id) == 100
+    with app.app_context():
+        assert db.session.get(Transaction, transaction_id).status == 'completed'
+        lines = LedgerEntry.query.filter_by(transaction_id=transaction_id).count()
+        assert lines == 2
+        assert ledger.check() == ([], [])
+
+
+def test_racing_deliveries_apply_once(app, vendor):
+    vendor_id, _ = vendor
+    add_pending(app, vendor_id, 250, 'ws_CO_2')
+    start = threading.Barrier(8)
+    results = []
+
+    def deliver():
+        with app.app_context():
+            start.wait()
+            results.append(apply_stk_result('ws_CO_2', 0))
+
+    threads = [threading.Thread(target=deliver) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(result.applied for result in results) == 1
+    assert {result.status for result in results} == {'completed'}
+    assert balance(app, vendor_id) == 250
+    with app.app_context():
+        assert ledger.check() == ([], [])
+
+
+def test_failed_result_does_not_credit(app, client, vendor):
+    vendor_id, _ = vendor
+    transaction_id = add_pending(app, vendor_id, 100, 'ws_CO_3')
+
+    response = client.post('/mpesa/callback', json=stk_callback('ws_CO_3', result_code=1032))
+
+    assert response.status_code == 200 and response.json['message'] == 'Failed'
+    assert balance(app, vendor_id) == 0
+    with app.app_context():
+        assert db.session.get(Transaction, transaction_id).status == 'failed'
+        assert LedgerEntry.query.filter_by(transaction_id=transaction_id).count() == 0
+
+
+def test_unknown_checkout_request_is_not_found(client, vendor):
+    response = client.post('/mpesa/callback', json=stk_callback('ws_CO_unknown'))
+    assert response.status_code == 404
@@ -0,0 +1,130 @@
+import re
+import smtplib
+from datetime import datetime, timedelta
+import pytest
+from app import db
+from app.models.statement_job import StatementJob
+from app.services import statements
+from app.services.statements import SmtpPool, StatementPdf, requeue_stale_jobs, run_statement_job
+
+
+@pytest.fixture
+def submitted(monkeypatch):
+    jobs = []
+    monkeypatch.setattr(statements.statement_worker, 'submit', jobs.append)
+    return jobs
+
+
+def add_job(app, vendor_id, job_id, status, age, started_age=None):
+    now = datetime.utcnow()
+    with app.app_context():
+        db.session.add(StatementJob(
+            id=job_id, vendor_id=vendor_id, email='shop@example.com', duration='monthly',
+            start_date=now - timedelta(days=30), end_date=now, status=status,
+            created_at=now - timedelta(seconds=age),
+            started_at=now - timedelta(seconds=started_age) if started_age is not None else None
+        ))
+        db.session.commit()
+
+
+def test_stale_jobs_are_submitted_again(app, vendor, submitted):
+    vendor_id, _ = vendor
+    add_job(app, vendor_id, 'queued-old', 'queued', age=600)
+    add_job(app, vendor_id, 'queued-new', 'queued', age=10)
+    add_job(app, vendor_id, 'running-dead', 'running', age=4000, started_age=3600)
+    add_job(app, vendor_id, 'running-live', 'running', age=4000, started_age=60)
+    add_job(app, vendor_id, 'sent', 'sent', age=4000, started_age=3600)
+
+    with app.app_context():
+        assert requeue_stale_jobs(300, 1800, 10) == 2
+        statuses = dict(db.session.query(StatementJob.id, StatementJob.status))
+
+    assert submitted == ['running-dead', 'queued-old']
+    assert statuses == {'queued-old': 'queued', 'queued-new': 'queued', 'running-dead': 'queued',
+                        'running-live': 'running', 'sent': 'sent'}
+
+
+class FakeSmtp:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(message['To'])
+
+
+def test_requeued_job_runs_to_completion(app, vendor, tmp_path, submitted, monkeypatch):
+    pytest.importorskip('reportlab')
+    app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    smtp = FakeSmtp()
+    monkeypatch.setattr(statements.statement_worker, 'smtp', smtp)
+    add_job(app, vendor[0], 'job-1', 'running', age=4000, started_age=3600)
+
+    with app.app_context():
+        requeue_stale_jobs(300, 1800, 10)
+        for job_id in submitted:
+            run_statement_job(job_id)
+        # A second submission of the same job finds it no longer queued
+        run_statement_job('job-1')
+        assert db.session.get(StatementJob, 'job-1').status == 'sent'
+
+    assert smtp.sent == ['shop@example.com']
+
+
+def pdf_pages(path):
+    return len(re.findall(rb'/Type /Page\b(?!s)', path.read_bytes()))
+
+
+@pytest.mark.parametrize('extra_rows', [0, 1])
+def test_statement_ends_without_a_blank_page(tmp_path, extra_rows):
+    pytest.importorskip('reportlab')
+    path = tmp_path / 'statement.pdf'
+    day = datetime(2024, 5, 1)
+    pdf = StatementPdf(str(path), 'Test Shop', 'monthly', day, day, 100, 0)
+    # Fill the first page exactly, so the last add() breaks the page
+    while pdf.canvas.getPageNumber() == 1:
+        pdf.add(day, 'in', 'Customer', 10)
+    for _ in range(extra_rows):
+        pdf.add(day, 'in', 'Customer', 10)
+    pdf.close()
+
+    assert pdf_pages(path) == 1 + extra_rows
+
+
+class FakeSmtpConnection:
+    def __init__(self, error=None):
+        self.error = error
+        self.closed = False
+
+    def send_message(self, message):
+        if self.error:
+            raise self.error
+
+    def quit(self):
+        self.closed = True
+
+
+def test_failed_retry_discards_the_fresh_connection(monkeypatch):
+    pool = SmtpPool({}, size=1)
+    stale = FakeSmtpConnection(smtplib.SMTPServerDisconnected('gone'))
+    fresh = FakeSmtpConnection(smtplib.SMTPDataError(554, b'rejected'))
+    monkeypatch.setattr(pool, '_checkout', lambda: stale)
+    monkeypatch.setattr(pool, '_connect', lambda: fresh)
+
+    with pytest.raises(smtplib.SMTPDataError):
+        pool.send('message')
+
+    assert fresh.closed
+    assert pool._idle.empty()
+    # The slot was given back
+    assert pool._slots.acquire(blocking=False)
+
+
+def test_successful_retry_keeps_the_fresh_connection(monkeypatch):
+    pool = SmtpPool({}, size=1)
+    fresh = FakeSmtpConnection()
+    monkeypatch.setattr(pool, '_checkout', lambda: FakeSmtpConnection(smtplib.SMTPServerDisconnected('gone')))
+    monkeypatch.setattr(pool, '_connect', lambda: fresh)
+
+    pool.send('message')
+
+    assert not fresh.closed and pool._idle.get_nowait() is fresh
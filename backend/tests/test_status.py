@@ -0,0 +1,36 @@
+import threading
+import time
+import pytest
+from conftest import add_pending, stk_callback
+
+
+@pytest.mark.parametrize('wait', ['nan', 'inf', '-inf', 'soon'])
+def test_invalid_wait_is_rejected(client, vendor, wait):
+    add_pending(client.application, vendor[0], 100, 'ws_CO_1')
+
+    response = client.get('/mpesa/status/ws_CO_1', query_string={'wait': wait})
+
+    assert response.status_code == 400
+
+
+def test_negative_wait_answers_at_once(client, vendor):
+    add_pending(client.application, vendor[0], 100, 'ws_CO_1')
+
+    started = time.monotonic()
+    response = client.get('/mpesa/status/ws_CO_1', query_string={'wait': '-5'})
+
+    assert response.status_code == 200 and response.json['status'] == 'pending'
+    assert time.monotonic() - started < 1
+
+
+def test_wait_returns_once_the_payment_settles(app, client, vendor):
+    add_pending(app, vendor[0], 100, 'ws_CO_1')
+    timer = threading.Timer(0.3, lambda: app.test_client().post('/mpesa/callback', json=stk_callback('ws_CO_1')))
+    timer.start()
+
+    started = time.monotonic()
+    response = client.get('/mpesa/status/ws_CO_1', query_string={'wait': '10'})
+    timer.join()
+
+    assert response.status_code == 200 and response.json['status'] == 'completed'
+    assert time.monotonic() - started < 5
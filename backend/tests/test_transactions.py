@@ -0,0 +1,66 @@
+import base64
+from datetime import datetime
+import pytest
+from app import db
+from app.models.transaction import Transaction
+
+
+def add_completed(app, vendor_id, dates):
+    """Insert one completed collection per date. Returns their ids."""
+    with app.app_context():
+        transactions = [Transaction(vendor_id=vendor_id, type='in', amount=10, customer='Customer',
+                                    status='completed', date=date) for date in dates]
+        db.session.add_all(transactions)
+        db.session.commit()
+        return [transaction.id for transaction in transactions]
+
+
+def walk(client, auth_headers, limit):
+    """Follow next_cursor to the end. Returns the ids seen and the page count."""
+    ids, pages, cursor = [], 0, None
+    while True:
+        params = {'limit': limit}
+        if cursor:
+            params['cursor'] = cursor
+        response = client.get('/transactions', query_string=params, headers=auth_headers)
+        assert response.status_code == 200
+        pages += 1
+        ids += [row['id'] for row in response.json['transactions']]
+        cursor = response.json['next_cursor']
+        if not cursor:
+            return ids, pages
+
+
+def test_equal_dates_across_a_page_boundary(app, client, vendor, auth_headers):
+    same = datetime(2024, 5, 1, 12, 0, 0)
+    ids = add_completed(app, vendor[0], [datetime(2024, 5, 2)] + [same] * 5 + [datetime(2024, 4, 30)])
+
+    seen, pages = walk(client, auth_headers, limit=3)
+
+    # Newest first, ties broken by id descending, each row exactly once
+    assert seen == [ids[0]] + sorted(ids[1:6], reverse=True) + [ids[6]]
+    assert pages == 3
+
+
+@pytest.mark.parametrize('cursor', ['not-a-cursor', '!!!', base64.urlsafe_b64encode(b'2024-05-01').decode(),
+                                    base64.urlsafe_b64encode(b'yesterday|1').decode(),
+                                    base64.urlsafe_b64encode(b'2024-05-01T00:00:00|x').decode()])
+def test_malformed_cursor_is_rejected(client, auth_headers, cursor):
+    response = client.get('/transactions', query_string={'cursor': cursor}, headers=auth_headers)
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('limit', ['0', '-1', 'ten'])
+def test_invalid_limit_is_rejected(client, auth_headers, limit):
+    response = client.get('/transactions', query_string={'limit': limit}, headers=auth_headers)
+    assert response.status_code == 400
+
+
+def test_limit_is_clamped_to_the_maximum_page_size(app, client, vendor, auth_headers):
+    app.config['TRANSACTIONS_MAX_PAGE_SIZE'] = 4
+    add_completed(app, vendor[0], [datetime(2024, 5, day) for day in range(1, 11)])
+
+    response = client.get('/transactions', query_string={'limit': 1000}, headers=auth_headers)
+
+    assert len(response.json['transactions']) == 4
+    assert response.json['next_cursor']
@@ -0,0 +1,67 @@
+import threading
+from app import db
+from app.models.transaction import Transaction
+from app.models.vendor import Vendor
+from app.services import ledger
+from conftest import add_pending, stk_callback
+
+
+def credit(app, client, vendor_id, amount, checkout_request_id):
+    add_pending(app, vendor_id, amount, checkout_request_id)
+    response = client.post('/mpesa/callback', json=stk_callback(checkout_request_id, amount=amount))
+    assert response.status_code == 200
+
+
+def withdraw(client, business_number, amount):
+    return client.post('/withdraw', json={'amount': amount, 'phone': '0700000000',
+                                          'business_number': business_number})
+
+
+def test_withdrawal_debits_and_balances_ledger(app, client, vendor):
+    vendor_id, business_number = vendor
+    credit(app, client, vendor_id, 150, 'ws_CO_1')
+
+    response = withdraw(client, business_number, 40)
+
+    assert response.status_code == 200
+    assert response.json['remaining_balance'] == 110
+    with app.app_context():
+        assert db.session.get(Vendor, vendor_id).balance == 110
+        assert ledger.check() == ([], [])
+
+
+def test_withdrawal_beyond_balance_is_refused(app, client, vendor):
+    vendor_id, business_number = vendor
+    credit(app, client, vendor_id, 50, 'ws_CO_1')
+
+    response = withdraw(client, business_number, 50.01)
+
+    assert response.status_code == 400
+    with app.app_context():
+        assert db.session.get(Vendor, vendor_id).balance == 50
+        assert Transaction.query.filter_by(type='out').count() == 0
+        assert ledger.check() == ([], [])
+
+
+def test_concurrent_withdrawals_never_overdraw(app, client, vendor):
+    vendor_id, business_number = vendor
+    credit(app, client, vendor_id, 100, 'ws_CO_1')
+    start = threading.Barrier(10)
+    statuses = []
+
+    def attempt():
+        local_client = app.test_client()
+        start.wait()
+        statuses.append(withdraw(local_client, business_number, 30).status_code)
+
+    threads = [threading.Thread(target=attempt) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(statuses) == [200] * 3 + [400] * 7
+    with app.app_context():
+        assert db.session.get(Vendor, vendor_id).balance == 10
+        assert Transaction.query.filter_by(type='out').count() == 3
+        assert ledger.check() == ([], [])